@@ -108,6 +108,46 @@ function fetchProducts(ingredient, containerId, source) {
         });
 }
 
+// Fetch products for every ingredient of the recipe in one batch request
+function fetchAllProducts(source) {
+    const inputs = Array.from(document.querySelectorAll('.ingredient-header input[id^="ingredient-"]'));
+    const ingredients = inputs.map(input => input.value.trim()).filter(value => value);
+
+    inputs.forEach(input => {
+        const container = document.getElementById(input.id.replace('ingredient-', 'product-'));
+        container.innerHTML = '<p>Loading products...</p>';
+        container.style.display = 'block';
+    });
+
+    fetch('/fetch_products_batch', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ ingredients, source, render: true }),
+    })
+        .then(response => response.json())
+        .then(data => {
+            inputs.forEach(input => {
+                const container = document.getElementById(input.id.replace('ingredient-', 'product-'));
+                const html = data.html[input.value.trim()];
+                if (html !== undefined) {
+                    container.innerHTML = html;
+                } else {
+                    // Still pending upstream when the deadline passed: fall back to a single lookup
+                    fetchProducts(input.value, container.id, source);
+                }
+            });
+            attachProductSelectionListeners();
+        })
+        .catch(error => {
+            console.error('Error fetching products:', error);
+            inputs.forEach(input => {
+                document.getElementById(input.id.replace('ingredient-', 'product-')).innerHTML = '<p>Error fetching products.</p>';
+            });
+        });
+}
+
 // Functions to display results
 function displayAllergenResults(data) {
     const container = document.getElementById('allergen-results');
@@ -264,7 +304,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // Allergen List (Removal)
     const recipeNameHiddenElement = document.getElementById('recipe-name-hidden');
-    const recipeTitleHiddenElement = document.getElementById('recipe-title-hidden');
+    const recipeIdHiddenElement = document.getElementById('recipe-id-hidden');
 
     function attachRemoveListeners() {
         const removeButtons = document.querySelectorAll('.remove');
@@ -284,16 +324,16 @@ document.addEventListener('DOMContentLoaded', () => {
                 let fetchUrl = '';
                 let fetchBody = '';
 
-                if (recipeNameHiddenElement) {
+                if (recipeIdHiddenElement && recipeIdHiddenElement.value) {
+                    // On recipe_details.html
+                    const recipeId = recipeIdHiddenElement.value;
+                    fetchUrl = `/recipe_details/${encodeURIComponent(recipeId)}`;
+                    fetchBody = `allergens=${encodeURIComponent(updatedAllergens.join(','))}`;
+                } else if (recipeNameHiddenElement) {
                     // On results.html
                     const recipeNameHidden = recipeNameHiddenElement.value;
                     fetchUrl = '/search';
                     fetchBody = `allergens=${encodeURIComponent(updatedAllergens.join(','))}&recipe=${encodeURIComponent(recipeNameHidden)}`;
-                } else if (recipeTitleHiddenElement) {
-                    // On recipe_details.html
-                    const recipeTitle = recipeTitleHiddenElement.value;
-                    fetchUrl = `/recipe_details/${encodeURIComponent(recipeTitle)}`;
-                    fetchBody = `allergens=${encodeURIComponent(updatedAllergens.join(','))}`;
                 }
 
                 // Send a POST request with the updated allergens list
@@ -335,11 +375,11 @@ document.addEventListener('DOMContentLoaded', () => {
     if (saveRecipeButton) {
         saveRecipeButton.addEventListener('click', () => {
             console.log('Save Recipe button clicked.');
-            const recipeTitleHiddenElement = document.getElementById('recipe-title-hidden');
-            const recipeTitle = recipeTitleHiddenElement ? recipeTitleHiddenElement.value : '';
+            const recipeIdHiddenElement = document.getElementById('recipe-id-hidden');
+            const recipeId = recipeIdHiddenElement ? recipeIdHiddenElement.value : '';
 
             // Send selected products to the server
-            fetch(`/save_recipe/${encodeURIComponent(recipeTitle)}`, {
+            fetch(`/save_recipe/${encodeURIComponent(recipeId)}`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -0,0 +1,189 @@
+import os
+import re
+from functools import lru_cache
+import numpy as np
+
+ALLERGENS_TXT_PATH = os.path.join(os.path.dirname(__file__), 'Static', 'Allergens.txt')
+
+# Mapping of allergens to potential keywords in product names or nutrient names
+ALLERGEN_KEYWORDS = {
+    'milk': ['milk', 'lactose', 'casein', 'whey', 'dairy'],
+    'egg': ['egg', 'albumin', 'egg white', 'egg yolk'],
+    'peanut': ['peanut'],
+    'tree nut': ['almond', 'walnut', 'cashew', 'hazelnut', 'pistachio', 'pecan', 'macadamia', 'brazil nut', 'nut'],
+    'fish': ['fish', 'cod', 'salmon', 'tuna', 'trout', 'anchovy', 'bass', 'catfish'],
+    'shellfish': ['shrimp', 'crab', 'lobster', 'shellfish', 'mussel', 'oyster', 'scallop', 'prawn'],
+    'wheat': ['wheat', 'gluten', 'farina', 'semolina', 'spelt', 'durum'],
+    'soy': ['soy', 'soya', 'soybean', 'edamame'],
+    'sesame': ['sesame', 'tahini'],
+    'gluten': ['gluten', 'wheat', 'barley', 'rye', 'spelt', 'triticale', 'farina', 'semolina'],
+    # Add more allergens and keywords as needed
+}
+
+# Words that end in a keyword without containing the allergen. Keywords may
+# end a compound ('buttermilk') but not begin one, so 'eggplant' and 'nutmeg'
+# need no entry here.
+NON_ALLERGEN_WORDS = ['butternut', 'doughnut', 'donut']
+
+
+def load_allergen_families(path=ALLERGENS_TXT_PATH):
+    """
+    Returns the allergen vocabulary: the keyword families above plus any
+    allergen listed in Static/Allergens.txt that has no family yet. Each
+    family owns one bit of the uint32 recipe masks.
+    """
+    families = {family: list(keywords) for family, keywords in ALLERGEN_KEYWORDS.items()}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            listed = [line.strip() for line in f if line.strip()]
+    except FileNotFoundError:
+        listed = []
+    for name in listed:
+        if normalize_allergen(name, families) is None:
+            family = name.lower().replace('_', ' ')
+            families[family] = [family]
+    if len(families) > 32:
+        raise ValueError("Allergen masks are uint32; at most 32 allergen families are supported.")
+    return families
+
+
+def normalize_allergen(name, families=None):
+    """
+    Maps a user-facing allergen name ('eggs', 'tree_nuts', 'Peanut') onto its
+    family key, or returns None if it is not part of the vocabulary.
+    """
+    families = ALLERGEN_FAMILIES if families is None else families
+    name = name.strip().lower().replace('_', ' ')
+    for candidate in (name, name[:-1] if name.endswith('s') else name, name[:-2] if name.endswith('es') else name):
+        if candidate in families:
+            return candidate
+    return None
+
+
+def keyword_alternatives(keywords, exclusions=NON_ALLERGEN_WORDS):
+    """
+    Regex alternatives for a list of keywords, longest first. A keyword
+    also matches at the end of a compound word ('milk' in 'buttermilk'),
+    except in the exclusions ending in it ('nut' in 'butternut').
+    """
+    alternatives = []
+    for keyword in sorted(keywords, key=len, reverse=True):
+        prefixes = [word[:-len(keyword)] for word in exclusions if word.endswith(keyword) and word != keyword]
+        lookbehinds = ''.join(rf'(?<!\b{re.escape(prefix)})' for prefix in prefixes)
+        alternatives.append(lookbehinds + re.escape(keyword))
+    return '|'.join(alternatives)
+
+
+def keyword_pattern(keywords):
+    """
+    Pattern for a list of keywords ending a word, allowing plurals, so 'egg'
+    matches 'eggs' but not 'eggplant' and 'milk' matches 'buttermilk'.
+    """
+    return rf'(?:{keyword_alternatives(keywords)})(?:e?s)?\b'
+
+
+class AllergenMatcher:
+    """
+    Every keyword of every allergen family compiled into one case-insensitive
+    regex (see keyword_pattern), so a text is scanned once no matter how many
+    families there are. A keyword shared by several families ('wheat',
+    'spelt') reports all of them. Blank keywords are ignored: an empty
+    alternative would match every text.
+    """
+
+    def __init__(self, families):
+        self.families = list(families)
+        self.family_bits = {family: 1 << bit for bit, family in enumerate(self.families)}
+        self.keyword_bits = {}
+        for family, keywords in families.items():
+            for keyword in keywords:
+                keyword = keyword.strip().lower()
+                if keyword:
+                    self.keyword_bits[keyword] = self.keyword_bits.get(keyword, 0) | self.family_bits[family]
+        alternatives = keyword_alternatives(self.keyword_bits)
+        self.pattern = re.compile(rf'({alternatives})(?:e?s)?\b', re.IGNORECASE) if alternatives else None
+
+    def mask(self, text):
+        """
+        Returns the bitmask of the families whose keywords appear in text.
+        """
+        bits = 0
+        if text and self.pattern is not None:
+            for keyword in self.pattern.findall(text):
+                bits |= self.keyword_bits[keyword.lower()]
+        return bits
+
+    def families_in(self, text):
+        """
+        Returns the set of families whose keywords appear in text.
+        """
+        bits = self.mask(text)
+        return {family for family, bit in self.family_bits.items() if bits & bit}
+
+    def masks(self, texts):
+        """
+        Returns one uint32 mask per text. Repeated texts, common in ingredient
+        lists, are only scanned once.
+        """
+        seen = {}
+        masks = np.zeros(len(texts), dtype=np.uint32)
+        for i, text in enumerate(texts):
+            if not isinstance(text, str):
+                continue
+            bits = seen.get(text)
+            if bits is None:
+                bits = seen[text] = self.mask(text)
+            masks[i] = bits
+        return masks
+
+
+ALLERGEN_FAMILIES = load_allergen_families()
+ALLERGEN_MATCHER = AllergenMatcher(ALLERGEN_FAMILIES)
+ALLERGEN_BITS = ALLERGEN_MATCHER.family_bits
+
+
+@lru_cache(maxsize=256)
+def free_text_matcher(allergen):
+    """
+    A matcher for an allergen outside the vocabulary, matching the word itself.
+    """
+    allergen = allergen.strip().lower()
+    return AllergenMatcher({allergen: [allergen]})
+
+
+def allergen_bits(allergens):
+    """
+    Splits user allergens into a uint32 bitmask over the known families and a
+    list of free-text allergens that are not part of the vocabulary.
+    """
+    bits = 0
+    unknown = []
+    for allergen in allergens:
+        if not allergen.strip():
+            continue
+        family = normalize_allergen(allergen)
+        if family is None:
+            unknown.append(allergen.strip())
+        else:
+            bits |= ALLERGEN_BITS[family]
+    return np.uint32(bits), unknown
+
+
+def compute_allergen_masks(ner):
+    """
+    Builds one uint32 allergen mask per entry of ner, a sequence (or pandas
+    Series) of ingredient names or of whole NER lists stored as strings.
+    """
+    return ALLERGEN_MATCHER.masks(list(ner))
+
+
+def combine_list_masks(item_masks, list_offsets):
+    """
+    ORs per-item masks together into one mask per list, where the items of
+    list i are item_masks[list_offsets[i]:list_offsets[i + 1]].
+    """
+    padded = np.append(item_masks, np.uint32(0))  # reduceat needs a valid index for trailing empty lists
+    masks = np.bitwise_or.reduceat(padded, list_offsets[:-1]) if len(list_offsets) > 1 \
+        else np.empty(0, dtype=np.uint32)
+    masks[list_offsets[1:] == list_offsets[:-1]] = 0  # reduceat returns the next item for empty lists
+    return masks.astype(np.uint32)
@@ -0,0 +1,302 @@
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from collections import deque
+import numpy as np
+from allergen_index import ALLERGEN_FAMILIES, ALLERGEN_MATCHER
+from food_database import ensure_schema, get_foods
+from food_matcher import get_food_matcher, match_foods
+from recipe_parser import parse_ingredient
+from recipe_snapshot import ID_COLUMN_NAMES, parse_list
+from unit_conversion import convert_to_grams
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the output layout or the estimates change so old parts are not mixed in
+ANNOTATIONS_VERSION = 3
+
+ANNOTATION_WORKERS = int(os.environ.get('ANNOTATION_WORKERS', os.cpu_count() or 1))
+ANNOTATION_CHUNKSIZE = int(os.environ.get('ANNOTATION_CHUNKSIZE', 5_000))
+
+# Output columns and the FoodData Central nutrients (name, unit) they are read
+# from, best first. FDC amounts are per 100g of food.
+ANNOTATION_NUTRIENTS = {
+    'energy_kcal': [('Energy', 'kcal'), ('Energy (Atwater General Factors)', 'kcal'),
+                    ('Energy (Atwater Specific Factors)', 'kcal')],
+    'protein_g': [('Protein', 'g')],
+    'fat_g': [('Total lipid (fat)', 'g')],
+    'saturated_fat_g': [('Fatty acids, total saturated', 'g')],
+    'carbohydrate_g': [('Carbohydrate, by difference', 'g'), ('Carbohydrate, by summation', 'g')],
+    'sugars_g': [('Sugars, Total', 'g'), ('Total Sugars', 'g'), ('Sugars, total including NLEA', 'g')],
+    'fiber_g': [('Fiber, total dietary', 'g')],
+    'sodium_mg': [('Sodium, Na', 'mg')],
+}
+NUTRIENT_COLUMNS = list(ANNOTATION_NUTRIENTS)
+_NUTRIENT_SOURCES = {
+    (name.lower(), unit.lower()): (column, priority)
+    for column, sources in enumerate(ANNOTATION_NUTRIENTS.values())
+    for priority, (name, unit) in enumerate(sources)
+}
+
+
+def default_annotations_path(csv_path):
+    return os.path.splitext(csv_path)[0] + '.annotations'
+
+
+class FoodNutrients:
+    """
+    Per-process memo of NER term -> (food ID, nutrients per 100g as a
+    vector over NUTRIENT_COLUMNS). RecipeNLG repeats the same few thousand
+    terms millions of times, so each term hits the database once.
+    """
+
+    def __init__(self):
+        self._foods = {}
+
+    def match(self, term):
+        key = term.strip().lower()
+        if key not in self._foods:
+            self._foods[key] = self._lookup(key)
+        return self._foods[key]
+
+    def _lookup(self, term):
+        food_ids = match_foods(term, limit=1, persist=True) if term else []
+        foods = get_foods(food_ids) if food_ids else []
+        if not foods:
+            return None
+        food_id, _, nutrients = foods[0]
+        vector = np.zeros(len(NUTRIENT_COLUMNS))
+        best = [len(sources) for sources in ANNOTATION_NUTRIENTS.values()]
+        for name, amount, unit in nutrients:
+            source = _NUTRIENT_SOURCES.get((name.lower(), (unit or '').lower()))
+            if source is None or amount is None:
+                continue
+            column, priority = source
+            if priority < best[column]:
+                vector[column] = amount
+                best[column] = priority
+        return food_id, vector
+
+
+_food_nutrients = None
+
+
+def _init_worker():
+    global _food_nutrients
+    _food_nutrients = FoodNutrients()
+
+
+def ingredient_grams(term, ingredient_lines, food_id):
+    """
+    Estimates the grams of a NER term used by the recipe from the first
+    ingredient line that mentions it, or returns None.
+    """
+    lowered = term.lower()
+    for line in ingredient_lines:
+        if lowered in line.lower():
+            parsed = parse_ingredient(line)
+            if parsed.quantity is None:
+                return None
+            return convert_to_grams(parsed.quantity, parsed.unit, food_id=food_id)
+    return None
+
+
+def annotate_chunk(task):
+    """
+    Annotates one chunk of recipes given as (chunk number, ids, ingredient
+    lists, NER lists). Returns the chunk number and its columns: nutrient
+    totals (recipes x NUTRIENT_COLUMNS), allergen masks and the fraction of
+    NER terms that contributed to the totals.
+    """
+    number, ids, ingredient_lists, ner_lists = task
+    food_nutrients = _food_nutrients or FoodNutrients()
+
+    recipe_index, grams, vectors = [], [], []
+    terms = np.zeros(len(ids), dtype=np.int32)
+    for i, (ingredient_lines, ner) in enumerate(zip(ingredient_lists, ner_lists)):
+        terms[i] = len(ner)
+        for term in ner:
+            food = food_nutrients.match(term)
+            if food is None:
+                continue
+            food_id, vector = food
+            quantity_in_grams = ingredient_grams(term, ingredient_lines, food_id)
+            if quantity_in_grams is None:
+                continue
+            recipe_index.append(i)
+            grams.append(quantity_in_grams)
+            vectors.append(vector)
+
+    # Totals: (grams / 100) weighted nutrient rows, summed per recipe
+    nutrients = np.zeros((len(ids), len(NUTRIENT_COLUMNS)))
+    if recipe_index:
+        weighted = np.array(vectors) * (np.array(grams) / 100)[:, None]
+        np.add.at(nutrients, np.array(recipe_index), weighted)
+    matched = np.bincount(np.array(recipe_index, dtype=np.intp), minlength=len(ids))
+
+    allergen_masks = ALLERGEN_MATCHER.masks(['\n'.join(ner) for ner in ner_lists])
+    coverage = np.divide(matched, terms, out=np.zeros(len(ids)), where=terms > 0)
+    return number, {
+        'ids': np.asarray(ids, dtype=np.int64),
+        'nutrients': nutrients.astype(np.float32),
+        'allergen_masks': allergen_masks,
+        'coverage': coverage.astype(np.float32),
+    }
+
+
+def _read_chunks(csv_path, chunksize):
+    import pandas as pd
+    header = pd.read_csv(csv_path, nrows=0).columns
+    id_column = next((column for column in ID_COLUMN_NAMES if column in header), None)
+    columns = ['ingredients', 'NER'] + ([id_column] if id_column is not None else [])
+    start = 0
+    reader = pd.read_csv(csv_path, chunksize=chunksize, dtype=str, keep_default_na=False, usecols=columns)
+    for number, chunk in enumerate(reader):
+        if id_column is not None:
+            ids = chunk[id_column].astype(np.int64).to_numpy()
+        else:
+            ids = np.arange(start, start + len(chunk), dtype=np.int64)
+        start += len(chunk)
+        yield number, ids, chunk['ingredients'], chunk['NER']
+
+
+def _part_path(output_path, number):
+    return os.path.join(output_path, 'parts', f'part-{number:06d}.npz')
+
+
+def _save_part(output_path, number, columns):
+    # Written under a temporary name and renamed, so a part on disk is always complete
+    path = _part_path(output_path, number)
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, **columns)
+    os.replace(tmp_path, path)
+
+
+def _start_run(csv_path, output_path, chunksize):
+    """
+    Returns the chunk numbers already done. A run can only be resumed with
+    the same source file and chunk size; otherwise it starts over.
+    """
+    stat = os.stat(csv_path)
+    manifest = {
+        'version': ANNOTATIONS_VERSION,
+        'source_size': stat.st_size,
+        'source_mtime': stat.st_mtime,
+        'chunksize': chunksize,
+        'nutrients': NUTRIENT_COLUMNS,
+        'allergen_families': list(ALLERGEN_FAMILIES),
+        'allergen_pattern': ALLERGEN_MATCHER.pattern.pattern,
+    }
+    manifest_path = os.path.join(output_path, 'run.json')
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    except (FileNotFoundError, ValueError):
+        previous = None
+    if previous != manifest:
+        shutil.rmtree(output_path, ignore_errors=True)
+    os.makedirs(os.path.join(output_path, 'parts'), exist_ok=True)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+
+    done = set()
+    for name in os.listdir(os.path.join(output_path, 'parts')):
+        if name.startswith('part-') and name.endswith('.npz') and '.tmp' not in name:
+            done.add(int(name[len('part-'):-len('.npz')]))
+    return done, manifest
+
+
+def _merge_parts(output_path, manifest, num_chunks):
+    """
+    Concatenates the parts into one .npy file per column, which
+    load_annotations memory-maps.
+    """
+    columns = {}
+    for number in range(num_chunks):
+        with np.load(_part_path(output_path, number)) as part:
+            for name in part.files:
+                columns.setdefault(name, []).append(part[name])
+    for name, arrays in columns.items():
+        np.save(os.path.join(output_path, f'{name}.npy'), np.concatenate(arrays))
+    rows = sum(len(ids) for ids in columns.get('ids', []))
+    with open(os.path.join(output_path, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(dict(manifest, rows=rows), f)
+    return rows
+
+
+def annotate_recipes(csv_path, output_path=None, workers=ANNOTATION_WORKERS, chunksize=ANNOTATION_CHUNKSIZE):
+    """
+    Estimates nutrient totals and allergen flags for every recipe in the CSV
+    and writes them as columns under output_path. Chunks are annotated by a
+    pool of worker processes and checkpointed as they finish, so an
+    interrupted run picks up where it stopped when started again.
+    """
+    output_path = output_path or default_annotations_path(csv_path)
+    done, manifest = _start_run(csv_path, output_path, chunksize)
+    if os.path.exists(os.path.join(output_path, 'manifest.json')):
+        os.remove(os.path.join(output_path, 'manifest.json'))
+
+    # Built before the pool starts so forked workers share the matcher's index
+    ensure_schema()
+    get_food_matcher()
+    start_time = time.time()
+    rows = 0
+    num_chunks = 0
+    with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+        # At most two chunks per worker are parsed and in flight at a time
+        in_flight = deque()
+
+        def collect():
+            nonlocal rows
+            number, columns = in_flight.popleft().get()
+            _save_part(output_path, number, columns)
+            rows += len(columns['ids'])
+            elapsed = time.time() - start_time
+            logger.info("Annotated chunk %d (%d recipes this run, %.0f recipes/sec)",
+                        number, rows, rows / max(elapsed, 1e-9))
+
+        for number, ids, ingredients, ner in _read_chunks(csv_path, chunksize):
+            num_chunks = number + 1
+            if number in done:
+                continue
+            task = (number, ids, [parse_list(text) for text in ingredients], [parse_list(text) for text in ner])
+            in_flight.append(pool.apply_async(annotate_chunk, (task,)))
+            if len(in_flight) >= 2 * workers:
+                collect()
+        while in_flight:
+            collect()
+
+    total = _merge_parts(output_path, manifest, num_chunks)
+    elapsed = time.time() - start_time
+    logger.info("Annotated %d recipes in %.1fs (%.0f recipes/sec); %d recipes in %s",
+                rows, elapsed, rows / max(elapsed, 1e-9), total, output_path)
+    return output_path
+
+
+def load_annotations(path):
+    """
+    Memory-maps the columns of a finished annotation run, or returns None if
+    there is none at path.
+    """
+    try:
+        with open(os.path.join(path, 'manifest.json'), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    columns = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+               for name in ('ids', 'nutrients', 'allergen_masks', 'coverage')}
+    columns['manifest'] = manifest
+    return columns
+
+
+if __name__ == '__main__':
+    from observability import configure_logging
+    from recipe_store import RECIPE_CSV_PATH
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else RECIPE_CSV_PATH
+    output_path = sys.argv[2] if len(sys.argv) > 2 else None
+    configure_logging()
+    annotate_recipes(csv_path, output_path)
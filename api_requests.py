@@ -1,60 +1,148 @@
-import requests
-from functools import lru_cache
+import asyncio
+import logging
+from off_client import async_request_error, get_async_off_client, get_off_client, request_error
+from off_mirror import mirror_search
+from response_cache import get_response_cache, make_cache_key
+
+# Fields of the raw search results used by ingredient_results.html
+SEARCH_RESULT_FIELDS = [
+    'code', 'product_name', 'brands', 'image_url', 'ingredients_text', 'nutriscore_grade', 'ecoscore_grade'
+]
+
+# Nutrients read from the products' nutriments, per serving or per 100 g
+OFF_NUTRIENTS = [
+    'energy-kcal',
+    'fat',
+    'saturated-fat',
+    'carbohydrates',
+    'sugars',
+    'fiber',
+    'proteins',
+    'salt',
+    'sodium'
+]
+
+logger = logging.getLogger(__name__)
 
-@lru_cache(maxsize=100)
 def fetch_ingredient_data(ingredient_name, limit=5):
-    base_url = "https://world.openfoodfacts.org/cgi/search.pl"
-    params = {
+    # Repeated lookups are answered from the shared response cache
+    cache_key = make_cache_key('off_products', ingredient_name, limit)
+    try:
+        return get_response_cache().get_or_fetch(cache_key, lambda: request_ingredient_data(ingredient_name, limit))
+    except request_error() as e:
+        logger.warning("Open Food Facts request failed: %s", e)
+        return []
+    except ValueError as e:
+        logger.warning("Invalid Open Food Facts response: %s", e)
+        return []
+
+def request_ingredient_data(ingredient_name, limit=5):
+    data = search_off(ingredient_search_params(ingredient_name, limit))
+    return clean_products(data.get("products", []))
+
+def search_off(params):
+    # The local mirror (off_mirror.py) answers first when it has matches. API calls are pooled,
+    # time-limited and retried, and concurrent identical lookups share one call
+    data = mirror_search(params)
+    return data if data is not None else get_off_client().search(params)
+
+async def search_off_async(params):
+    data = await asyncio.to_thread(mirror_search, params)
+    return data if data is not None else await get_async_off_client().search(params)
+
+def ingredient_search_params(ingredient_name, limit=5):
+    return {
         "search_terms": ingredient_name,
         "search_simple": 1,
         "action": "process",
         "json": 1,
         "page_size": limit  # Limit the number of results to fetch
     }
+
+def clean_products(products):
+    # Process products to keep only relevant data
+    cleaned_products = []
+    for product in products:
+        cleaned_product = {
+            'product_name': product.get('product_name'),
+            'image_url': product.get('image_url'),
+            'nutrients': extract_nutrients(product),
+            'Nutri-Score': product.get('nutriscore_grade'),
+            'Eco-Score': product.get('ecoscore_grade'),
+            'code': product.get('code'),
+            'brands': product.get('brands'),
+            'allergens_hierarchy': product.get('allergens_hierarchy'),
+            'serving_size': product.get('serving_size'),  # Extract serving size
+        }
+        cleaned_products.append(cleaned_product)
+    return cleaned_products
+
+def search_products(search_terms):
+    # Raw search results for the ingredient search page, cached like fetch_ingredient_data
+    cache_key = make_cache_key('off_search', search_terms)
     try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()  # Raise an error for bad status codes
-        data = response.json()
-        products = data.get("products", [])
-        # Process products to keep only relevant data
-        cleaned_products = []
-        for product in products:
-            cleaned_product = {
-                'product_name': product.get('product_name'),
-                'image_url': product.get('image_url'),
-                'nutrients': extract_nutrients(product),
-                'Nutri-Score': product.get('nutriscore_grade'),
-                'Eco-Score': product.get('ecoscore_grade'),
-                'code': product.get('code'),
-                'brands': product.get('brands'),
-                'allergens_hierarchy': product.get('allergens_hierarchy'),
-                'serving_size': product.get('serving_size'),  # Extract serving size
-            }
-            cleaned_products.append(cleaned_product)
-        return cleaned_products
-    except requests.exceptions.RequestException as e:
-        print(f"API Request error: {e}")
+        return get_response_cache().get_or_fetch(cache_key, lambda: request_search_products(search_terms))
+    except request_error() as e:
+        logger.warning("Open Food Facts request failed: %s", e)
         return []
     except ValueError as e:
-        print(f"Error parsing JSON response: {e}")
+        logger.warning("Invalid Open Food Facts response: %s", e)
         return []
 
+def request_search_products(search_terms):
+    return search_result_fields(search_off(product_search_params(search_terms)).get('products', []))
+
+def product_search_params(search_terms):
+    return {
+        'search_terms': search_terms,
+        'search_simple': '1',
+        'action': 'process',
+        'json': '1'
+    }
+
+def search_result_fields(products):
+    # Only keep the fields the results page shows, so cache entries stay small
+    return [{field: product.get(field) for field in SEARCH_RESULT_FIELDS if field in product} for product in products]
+
+# Async variants for the ASGI app (asgi.py). They share the response cache
+# and its keys with the functions above, but wait on the async client.
+
+async def fetch_ingredient_data_async(ingredient_name, limit=5):
+    cache_key = make_cache_key('off_products', ingredient_name, limit)
+    try:
+        return await get_response_cache().get_or_fetch_async(
+            cache_key, lambda: request_ingredient_data_async(ingredient_name, limit))
+    except async_request_error() as e:
+        logger.warning("Open Food Facts request failed: %s", e)
+        return []
+    except ValueError as e:
+        logger.warning("Invalid Open Food Facts response: %s", e)
+        return []
+
+async def request_ingredient_data_async(ingredient_name, limit=5):
+    data = await search_off_async(ingredient_search_params(ingredient_name, limit))
+    return clean_products(data.get("products", []))
+
+async def search_products_async(search_terms):
+    cache_key = make_cache_key('off_search', search_terms)
+    try:
+        return await get_response_cache().get_or_fetch_async(
+            cache_key, lambda: request_search_products_async(search_terms))
+    except async_request_error() as e:
+        logger.warning("Open Food Facts request failed: %s", e)
+        return []
+    except ValueError as e:
+        logger.warning("Invalid Open Food Facts response: %s", e)
+        return []
+
+async def request_search_products_async(search_terms):
+    data = await search_off_async(product_search_params(search_terms))
+    return search_result_fields(data.get('products', []))
+
 def extract_nutrients(product):
-    # Define the nutrients you want to extract
-    nutrients_wanted = [
-        'energy-kcal',
-        'fat',
-        'saturated-fat',
-        'carbohydrates',
-        'sugars',
-        'fiber',
-        'proteins',
-        'salt',
-        'sodium'
-    ]
     nutrients_data = product.get('nutriments', {})
     nutrients_list = []
-    for nutrient in nutrients_wanted:
+    for nutrient in OFF_NUTRIENTS:
         # Try to get per serving values first
         amount = nutrients_data.get(f"{nutrient}_serving")
         unit = nutrients_data.get(f"{nutrient}_unit")
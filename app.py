@@ -1,44 +1,160 @@
-import requests
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
-from recipe_data_handler import fetch_filtered_recipes
-from api_requests import fetch_ingredient_data
+from flask import Blueprint, Flask, Response, render_template, request, redirect, url_for, flash, session, jsonify
+import logging
+from recipe_data_handler import search_recipes, search_recipe_page, iter_recipes, fetch_recipe, fetch_saved_recipes
+from recipe_store import RECIPE_FIELDS, get_recipe_store, recipe_store_loaded
+import json
+from api_requests import search_products
 import os
-from recipe_parser import parse_multiple_ingredients
-from fetch_from_localdb import fetch_from_localdb
+from recipe_parser import format_quantity, parse_multiple_ingredients
+from product_lookup import fetch_products as lookup_products, fetch_products_batch, warm_products
 from allergen_checker import check_allergens 
 from nutrition_calculator import calculate_nutrition 
-from nutrition_calculator import calculate_nutrition
+from nutrition_calculator import calculate_nutrition, calculate_nutrition_batch
 from environmental_impact import calculate_environmental_impact
+import threading
 from datetime import datetime
-import pandas as pd
-
-app = Flask(__name__)
-app.secret_key = os.environ.get('SECRET_KEY', 'your_secret_key')
-OFF_API_URL = "https://world.openfoodfacts.org/cgi/search.pl"
-
-recipes_df = pd.read_csv('Recipedata.csv')
-top_100_recipes = recipes_df[['title', 'link']].head(100)
-
-@app.before_request
-def initialize_saved_recipes():
-    if 'saved_recipes' not in session:
-        session['saved_recipes'] = []
-
-@app.route('/')
+from session_store import create_session_interface
+from observability import configure_logging, instrument_app, render_metrics
+from food_database import FOOD_DATABASE_PATH, ensure_schema, schema_is_current
+
+# Load the recipe data in the background as soon as the app is created, rather than on the first request
+RECIPE_PRELOAD = os.environ.get('RECIPE_PRELOAD', '1') == '1'
+
+INDEX_PAGE_SIZE = 10
+SEARCH_RESULTS_PER_PAGE = 20
+API_MAX_PAGE_SIZE = 200
+# Recipes serialized per chunk of a streamed response
+API_STREAM_BATCH = 20
+
+# cli_group=None puts the blueprint's commands at the top level: flask --app app upgrade-food-db
+main = Blueprint('main', __name__, cli_group=None)
+
+logger = logging.getLogger(__name__)
+
+_preload_error = None
+
+
+def preload_recipe_store():
+    """
+    Loads the recipe store (memory-mapping its snapshot, or building it from
+    the CSV if there is none yet) so /ready can report when it is done.
+    """
+    global _preload_error
+    try:
+        get_recipe_store()
+    except Exception as e:
+        _preload_error = e
+        logger.exception("Loading the recipe data failed")
+
+
+def create_app(preload=RECIPE_PRELOAD):
+    """
+    Creates the Flask app. Nothing heavy happens here: the recipe data,
+    the food matcher and the pint registry are all loaded on first use,
+    and with preload the recipe data starts loading in a background thread.
+    The food database is only checked, never written: the importers and
+    `flask --app app upgrade-food-db` bring it to the current schema.
+    """
+    configure_logging()
+    if not schema_is_current():
+        logger.error("The food database %s is missing or has an outdated schema, so local food lookups will fail. "
+                     "Upgrade it with `flask --app app upgrade-food-db`.", FOOD_DATABASE_PATH)
+    app = Flask(__name__)
+    app.secret_key = os.environ.get('SECRET_KEY', 'your_secret_key')
+    # Session data is kept server side; the cookie only carries a session ID (see SESSION_BACKEND)
+    app.session_interface = create_session_interface()
+    app.register_blueprint(main)
+    # Request latency per route and template render times, exposed at /metrics
+    instrument_app(app)
+    if preload and not recipe_store_loaded():
+        threading.Thread(target=preload_recipe_store, name='recipe-preload', daemon=True).start()
+    return app
+
+
+@main.cli.command('upgrade-food-db')
+def upgrade_food_db():
+    """Creates or upgrades the food database to the current schema."""
+    ensure_schema()
+    logger.info("The food database %s has the current schema", FOOD_DATABASE_PATH)
+
+
+@main.route('/healthz')
+def healthz():
+    # Liveness: the process is up and serving requests
+    return jsonify({'status': 'ok'})
+
+@main.route('/ready')
+def ready():
+    # Readiness: 503 until the recipe data is loaded, so traffic only arrives once requests are fast
+    if recipe_store_loaded():
+        return jsonify({'status': 'ready'})
+    if _preload_error is not None:
+        return jsonify({'status': 'error', 'error': str(_preload_error)}), 503
+    return jsonify({'status': 'loading'}), 503
+
+@main.route('/metrics')
+def metrics():
+    # Prometheus text format: latency histograms, span timings and cache hit ratios
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@main.route('/')
 def index():
-    page = int(request.args.get('page', 1))
-    per_page = 10
-
-    start_idx = (page - 1) * per_page
-    end_idx = start_idx + per_page
-
-    paginated_recipes = top_100_recipes.iloc[start_idx:end_idx]
-
-    total_pages = len(top_100_recipes) // per_page
-
-    return render_template('index.html',paginated_recipes=paginated_recipes.to_dict(orient='records'), page=page, total_pages=total_pages)
-
-@app.route('/custom_recipe', methods=['POST'])
+    # Browses the whole dataset by recipe ID, with the cursors of the search API
+    try:
+        recipe_page = search_recipe_page('', [], request.args.get('cursor'), INDEX_PAGE_SIZE)
+    except ValueError:
+        recipe_page = search_recipe_page('', [], None, INDEX_PAGE_SIZE)
+    paginated_recipes = list(iter_recipes(recipe_page.rows, ('id', 'title', 'link')))
+
+    page = recipe_page.start // INDEX_PAGE_SIZE + 1
+    total_pages = (recipe_page.total + INDEX_PAGE_SIZE - 1) // INDEX_PAGE_SIZE
+
+    return render_template('index.html', paginated_recipes=paginated_recipes, page=page, total_pages=total_pages,
+                           next_cursor=recipe_page.next_cursor, previous_cursor=recipe_page.previous_cursor)
+
+@main.route('/api/recipes/search')
+def api_search_recipes():
+    """
+    JSON recipe search with keyset pagination: pass the returned next_cursor
+    back as cursor for the following page. Optional parameters: q, allergens
+    (comma separated), limit and fields (comma separated subset of the
+    recipe fields). The recipes are streamed as they are serialized.
+    next_cursor is null on the last page. previous_cursor is null on the
+    first page and "" on the second, where the previous page is the first
+    one and is fetched without a cursor. A malformed cursor answers 400.
+    """
+    recipe_name = request.args.get('q', '')
+    allergens = request.args.get('allergens', '').split(',')
+    limit = min(max(request.args.get('limit', SEARCH_RESULTS_PER_PAGE, type=int), 1), API_MAX_PAGE_SIZE)
+    fields = [field for field in request.args.get('fields', '').split(',') if field] or list(RECIPE_FIELDS)
+    unknown = [field for field in fields if field not in RECIPE_FIELDS]
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(unknown)}", 'fields': list(RECIPE_FIELDS)}), 400
+    try:
+        recipe_page = search_recipe_page(recipe_name, allergens, request.args.get('cursor'), limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        header = json.dumps({
+            'total': recipe_page.total,
+            'next_cursor': recipe_page.next_cursor,
+            'previous_cursor': recipe_page.previous_cursor,
+        })
+        yield header[:-1] + ', "recipes": ['
+        batch, separator = [], ''
+        for recipe in iter_recipes(recipe_page.rows, fields):
+            batch.append(json.dumps(recipe))
+            if len(batch) == API_STREAM_BATCH:
+                yield separator + ','.join(batch)
+                batch, separator = [], ','
+        if batch:
+            yield separator + ','.join(batch)
+        yield ']}'
+
+    return Response(generate(), mimetype='application/json')
+
+@main.route('/custom_recipe', methods=['POST'])
 def custom_recipe():
     #Get the custom recipe text and allergens from the JSON data
     data = request.get_json()
@@ -59,24 +175,28 @@ def custom_recipe():
         combined_list.append({
             'ingredient_text': ingredient.ingredient_text,
             'name': ingredient.name,
-            'quantity': ingredient.quantity,
+            'quantity': format_quantity(ingredient.quantity) or None,
             'unit': ingredient.unit,
         })
 
     #Render the recipe details page with the custom recipe and combined list
     return render_template('recipe_details.html', recipe=parsed_recipe, is_custom=True, allergens=allergens, combined_list=combined_list)
 
-@app.route('/search', methods=['POST','GET'])
+@main.route('/search', methods=['POST','GET'])
 def search():
-    recipe_name = request.form.get('recipe')
-    allergens = request.form.get('allergens', '').split(',')
+    recipe_name = request.values.get('recipe', '')
+    allergens = request.values.get('allergens', '').split(',')
+    page = max(request.values.get('page', 1, type=int), 1)
+    per_page = SEARCH_RESULTS_PER_PAGE
     # Store allergens in the session
     session['allergens'] = allergens
-    filtered_recipes = fetch_filtered_recipes(recipe_name, allergens)
-    return render_template('results.html', recipes=filtered_recipes, allergens=allergens)
+    filtered_recipes, total_results = search_recipes(recipe_name, allergens, limit=per_page, offset=(page - 1) * per_page)
+    total_pages = (total_results + per_page - 1) // per_page
+    return render_template('results.html', recipes=filtered_recipes, allergens=allergens, recipe_name=recipe_name,
+                           page=page, total_pages=total_pages, total_results=total_results)
 
-@app.route('/recipe_details/<recipe_title>', methods=['GET', 'POST'])
-def recipe_details(recipe_title):
+@main.route('/recipe_details/<int:recipe_id>', methods=['GET', 'POST'])
+def recipe_details(recipe_id):
     if request.method == 'POST':
         # Get updated allergens from the form data
         allergens = request.form.get('allergens', '')
@@ -88,70 +208,71 @@ def recipe_details(recipe_title):
         allergens = session.get('allergens', [])
     
     # Fetch the recipe, applying allergen filters if necessary
-    recipe = next((r for r in fetch_filtered_recipes('', allergens) if r['title'] == recipe_title), None)
+    recipe = fetch_recipe(recipe_id, allergens)
 
-     # Create the combined list for use in the template
-    ingredients = recipe.get('ingredients', '').strip('[]').replace('"', '').split(', ')
-    ner_list = recipe.get('NER', '').strip('[]').replace('"', '').split(', ')
-    
-    combined_list = []
-    for ing, ner in zip(ingredients, ner_list):
-        combined_list.append({
-            'ingredient_text': ing,
-            'name': ner,
-            'quantity': None,
-            'unit': None
-        })
-        
     if recipe:
+        # Create the combined list for use in the template
+        ingredients = recipe.get('ingredients', [])
+        ner_list = recipe.get('NER', [])
+
+        combined_list = []
+        for ing, ner in zip(ingredients, ner_list):
+            combined_list.append({
+                'ingredient_text': ing,
+                'name': ner,
+                'quantity': None,
+                'unit': None
+            })
+
+        # Start filling the product cache while the user reads the recipe
+        warm_products(ner_list)
+
         current_year = datetime.now().year
         return render_template('recipe_details.html', recipe=recipe, allergens=allergens, current_year=current_year, combined_list=combined_list)
     else:
         flash('Recipe not found.', 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
-@app.route('/save_recipe/<recipe_title>')
-def save_recipe(recipe_title):
-    saved_recipes = session['saved_recipes']
-    if recipe_title not in saved_recipes:
-        saved_recipes.append(recipe_title)
+@main.route('/save_recipe/<int:recipe_id>', methods=['GET', 'POST'])
+def save_recipe(recipe_id):
+    saved_recipes = session.get('saved_recipes', [])
+    if recipe_id not in saved_recipes:
+        saved_recipes.append(recipe_id)
         session['saved_recipes'] = saved_recipes  # 更新会话中的保存列表
-    return redirect(url_for('saved_recipes'))
+    if request.method == 'POST':
+        # The recipe details page saves through fetch() and expects JSON back
+        return jsonify({'success': True})
+    return redirect(url_for('main.saved_recipes'))
 
-@app.route('/saved_recipes')
+@main.route('/saved_recipes')
 def saved_recipes():
-    saved_recipes = session.get('saved_recipes', [])
-    saved_recipe_details = recipes_df[recipes_df['title'].isin(saved_recipes)].to_dict(orient='records')
+    saved_recipe_details = fetch_saved_recipes(session.get('saved_recipes', []))
     # 获取用户选择的优先级选项
     priority = request.args.get('priority', 'none')
-    return render_template('saved_recipes.html', recipes=saved_recipe_details, priority=priority)
+    return render_template('saved_recipes.html', recipes=saved_recipe_details, priority=priority,
+                           selected_products=session.get('selected_products', {}))
 
-@app.route('/unsave_recipe/<recipe_title>')
-def unsave_recipe(recipe_title):
+@main.route('/unsave_recipe/<int:recipe_id>')
+def unsave_recipe(recipe_id):
     if 'saved_recipes' in session:
         # 从会话中获取已保存的食谱列表
         saved_recipes = session['saved_recipes']
         # 如果食谱在列表中，则移除
-        if recipe_title in saved_recipes:
-            saved_recipes.remove(recipe_title)
+        if recipe_id in saved_recipes:
+            saved_recipes.remove(recipe_id)
             session['saved_recipes'] = saved_recipes
-    return redirect(url_for('saved_recipes'))
+    return redirect(url_for('main.saved_recipes'))
 
-@app.route('/ingredient_search/<ingredient>')
+@main.route('/ingredient_search/<ingredient>')
 def ingredient_search(ingredient):
+    products = filter_products(search_products(ingredient))
+    return render_template('ingredient_results.html', ingredient=ingredient, products=products)
+
+def filter_products(products):
+    # Applies the grade filters and ordering chosen on ingredient_results.html
     priority = request.args.get('priority', 'none')
     nutri_score_filter = request.args.get('nutri_score_filter', 'all')
     eco_score_filter = request.args.get('eco_score_filter', 'all')
-    params = {
-        'search_terms': ingredient,
-        'search_simple': '1',
-        'action': 'process',
-        'json': '1'
-    }
-    response = requests.get(OFF_API_URL, params=params)
-    data = response.json()
-
-    products = data.get('products', [])
 
     if nutri_score_filter != 'all':
         products = [product for product in products if
@@ -164,115 +285,161 @@ def ingredient_search(ingredient):
         products = sorted(products, key=lambda x: x.get('nutriscore_grade', 'z'))
     elif priority == 'ecoscore':
         products = sorted(products, key=lambda x: x.get('ecoscore_grade', 'z'))
+    return products
 
-    return render_template('ingredient_results.html', ingredient=ingredient, products=products)
-
-@app.route('/fetch_products')
+@main.route('/fetch_products')
 def fetch_products():
     ingredient = request.args.get('ingredient')
     source = request.args.get('source', 'openfoodfacts')
-
-    if source == 'openfoodfacts':
-        products = fetch_ingredient_data(ingredient, limit=6)
-    elif source == 'localdb':
-        products = fetch_from_localdb(ingredient, limit=6)
-    else:
-        products = []
+    products = lookup_products(ingredient, source, limit=6)
     return render_template('product_list.html', products=products)
 
-@app.route('/select_product', methods=['POST'])
+@main.route('/fetch_products_batch', methods=['GET', 'POST'])
+def fetch_products_batch_route():
+    try:
+        source, ingredients, render = batch_lookup_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if ingredients is None:
+        return jsonify({'error': 'Recipe not found.'}), 404
+    products, pending = fetch_products_batch(ingredients, source, limit=6)
+    return batch_lookup_response(source, products, pending, render)
+
+def batch_lookup_args():
+    """
+    Reads a batch lookup request: a recipe ID or an explicit ingredient
+    list, as query args or a JSON body. Returns (source, ingredients,
+    render); ingredients is None if the recipe does not exist. Raises
+    ValueError for a malformed request.
+    """
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    elif not isinstance(data, dict):
+        raise ValueError('The request body must be a JSON object.')
+    source = data.get('source', request.args.get('source', 'openfoodfacts'))
+    recipe_id = data.get('recipe_id', request.args.get('recipe_id'))
+    ingredients = data.get('ingredients') or request.args.getlist('ingredient')
+    render = bool(data.get('render', request.args.get('render', type=int)))
+
+    if not isinstance(source, str):
+        raise ValueError("'source' must be a string.")
+    if not isinstance(ingredients, list) or not all(isinstance(ingredient, str) for ingredient in ingredients):
+        raise ValueError("'ingredients' must be a list of strings.")
+    if recipe_id is not None and not ingredients:
+        if isinstance(recipe_id, str) and recipe_id.isdigit():
+            recipe_id = int(recipe_id)
+        if isinstance(recipe_id, bool) or not isinstance(recipe_id, int):
+            raise ValueError("'recipe_id' must be an integer.")
+        recipe = fetch_recipe(recipe_id, [])
+        ingredients = recipe['NER'] if recipe is not None else None
+    return source, ingredients, render
+
+def batch_lookup_response(source, products, pending, render):
+    response = {'source': source, 'products': products, 'pending': pending, 'complete': not pending}
+    if render:
+        # Pre-rendered product_list.html fragments, one per ingredient, for the recipe page
+        response['html'] = {
+            ingredient: render_template('product_list.html', products=ingredient_products)
+            for ingredient, ingredient_products in products.items()
+        }
+    return jsonify(response)
+
+@main.route('/select_product', methods=['POST'])
 def select_product():
-    recipe_title = request.form['recipe_title']
+    recipe_id = request.form['recipe_id']
     ingredient = request.form['ingredient']
-    product_name = request.form['product_name']
-    nutriscore = request.form['nutriscore']
-    ecoscore = request.form['ecoscore']
+    code = request.form.get('code', '')
+    # The display fields are kept in the (server side) session, not looked up again later
+    summary = {
+        'product_name': request.form['product_name'],
+        'nutriscore': request.form['nutriscore'],
+        'ecoscore': request.form['ecoscore'],
+    }
+    if code:
+        summary['code'] = code
 
     selected_products = session.get('selected_products', {})
-
-    if recipe_title not in selected_products:
-        selected_products[recipe_title] = []
-
-    selected_products[recipe_title] = [
-        product for product in selected_products[recipe_title]
-        if product['ingredient'] != ingredient
-    ]
-
-    selected_products[recipe_title].append({
-        'ingredient': ingredient,
-        'product_name': product_name,
-        'nutriscore': nutriscore,
-        'ecoscore': ecoscore
-    })
-
+    selected_products.setdefault(recipe_id, {})[ingredient] = summary
     session['selected_products'] = selected_products
-    return redirect(url_for('saved_recipes'))
-@app.route('/remove_product', methods=['POST'])
+    return redirect(url_for('main.saved_recipes'))
+@main.route('/remove_product', methods=['POST'])
 def remove_product():
-    recipe_title = request.form['recipe_title']
+    recipe_id = request.form['recipe_id']
     ingredient = request.form['ingredient']
-    product_name = request.form['product_name']
     selected_products = session.get('selected_products', {})
 
-    if recipe_title in selected_products:
-        selected_products[recipe_title] = [
-            product for product in selected_products[recipe_title]
-            if not (product['ingredient'] == ingredient and product['product_name'] == product_name)
-        ]
-        if not selected_products[recipe_title]:
-            del selected_products[recipe_title]
+    products = selected_products.get(recipe_id, {})
+    if ingredient in products:
+        del products[ingredient]
+        if not products:
+            del selected_products[recipe_id]
         session['selected_products'] = selected_products
-    return redirect(url_for('saved_recipes'))
+    return redirect(url_for('main.saved_recipes'))
 
-@app.route('/return_to_results')
+@main.route('/return_to_results')
 def return_to_results():
     last_search = session.get('last_search', [])
     last_allergen = session.get('last_allergen', '')
     if last_search:
         return render_template('results.html', recipes=last_search, allergen=last_allergen)
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
 
 # Route to handle allergen checking
-@app.route('/check_allergens', methods=['POST'])
+@main.route('/check_allergens', methods=['POST'])
 def check_allergens_route():
     data = request.get_json()
     selected_products = data.get('selectedProducts', {})
     selected_allergens = session.get('allergens', [])
 
-    print("Selected Products Received:", selected_products)  # Debugging statement
-    print("Selected Allergens from Session:", selected_allergens)  # Debugging statement
+    logger.debug("Checking %d products for allergens %s", len(selected_products), selected_allergens)
 
     # Run the allergen checker module
     allergens_found = check_allergens(selected_products, selected_allergens)
 
     return jsonify({'allergens_found': allergens_found})
 
-# Route to handle nutrition calculation
-@app.route('/calculate_nutrition', methods=['POST'])
-def calculate_nutrition_route():
-    data = request.get_json()
-    selected_products = data.get('selectedProducts', {})
-
-    print("Selected Products:", selected_products)  # Debugging statement
-
-    total_nutrients = calculate_nutrition(selected_products)
-
+def serialize_nutrition(total_nutrients):
     # Convert total_nutrients to a serializable format
-    total_nutrients_serializable = {
+    return {
         nutrient: {
             'amount': round(info['amount'], 2),
             'unit': info['unit']
         } for nutrient, info in total_nutrients.items()
     }
 
-    print("Total Nutrients Serializable:", total_nutrients_serializable)  # Debugging statement
+# Route to handle nutrition calculation
+@main.route('/calculate_nutrition', methods=['POST'])
+def calculate_nutrition_route():
+    data = request.get_json()
+    selected_products = data.get('selectedProducts', {})
+
+    logger.debug("Calculating nutrition for %d products", len(selected_products))
+
+    total_nutrients = calculate_nutrition(selected_products)
+    total_nutrients_serializable = serialize_nutrition(total_nutrients)
 
     return jsonify({'nutrition_info': total_nutrients_serializable})
 
+# Nutrition for many recipes in one request, e.g. all saved recipes.
+# 'recipes' maps a recipe key (or is a list) to that recipe's selectedProducts.
+@main.route('/calculate_nutrition_batch', methods=['POST'])
+def calculate_nutrition_batch_route():
+    data = request.get_json(silent=True) or {}
+    recipes = data.get('recipes', {})
+    if isinstance(recipes, dict):
+        totals = calculate_nutrition_batch(list(recipes.values()))
+        nutrition_info = {key: serialize_nutrition(total) for key, total in zip(recipes, totals)}
+    elif isinstance(recipes, list):
+        nutrition_info = [serialize_nutrition(total) for total in calculate_nutrition_batch(recipes)]
+    else:
+        return jsonify({'error': "'recipes' must be an object or a list."}), 400
+    return jsonify({'nutrition_info': nutrition_info})
+
 
     #Route to handle environmental impact calculation
-    @app.route('/calculate_environmental_impact', methods=['POST'])
+    @main.route('/calculate_environmental_impact', methods=['POST'])
     def calculate_environmental_impact_route():
         selected_products = session.get('selected_products', {})
 
@@ -282,5 +449,7 @@ def calculate_nutrition_route():
         return jsonify({'environmental_impact': environmental_impact})
 
 
+app = create_app()
+
 if __name__ == '__main__':
     app.run(debug=True)
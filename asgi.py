@@ -0,0 +1,155 @@
+"""
+ASGI entry point. The routes that wait on Open Food Facts are served by
+async views, so a lookup in flight holds no thread and one process can wait
+on hundreds of them; every other route runs its unchanged Flask view on a
+pool of ASGI_WSGI_THREADS threads.
+
+    uvicorn asgi:app [--port 8000] [--workers N]
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:app
+
+The second form keeps gunicorn's preloading, so the workers share the recipe
+data. Needs aiohttp (the async Open Food Facts client), a2wsgi (to run the
+Flask views) and an ASGI server such as uvicorn.
+"""
+import os
+import time
+from functools import cached_property
+from flask import render_template, request
+from werkzeug.exceptions import HTTPException
+from app import app as flask_app, batch_lookup_args, batch_lookup_response, filter_products
+from api_requests import search_products_async
+from observability import observe_request
+from off_client import close_async_off_client
+from product_lookup import fetch_products_async, fetch_products_batch_async
+
+ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 16))
+
+
+async def ingredient_search(ingredient):
+    products = filter_products(await search_products_async(ingredient))
+    return render_template('ingredient_results.html', ingredient=ingredient, products=products)
+
+
+async def fetch_products():
+    ingredient = request.args.get('ingredient')
+    source = request.args.get('source', 'openfoodfacts')
+    products = await fetch_products_async(ingredient, source, limit=6)
+    return render_template('product_list.html', products=products)
+
+
+async def fetch_products_batch_route():
+    try:
+        source, ingredients, render = batch_lookup_args()
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    if ingredients is None:
+        return {'error': 'Recipe not found.'}, 404
+    products, pending = await fetch_products_batch_async(ingredients, source, limit=6)
+    return batch_lookup_response(source, products, pending, render)
+
+
+# Flask endpoint -> the async view that serves it; the URL rules stay those of app.py
+ASYNC_VIEWS = {
+    'main.ingredient_search': ingredient_search,
+    'main.fetch_products': fetch_products,
+    'main.fetch_products_batch_route': fetch_products_batch_route,
+}
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+class AsyncApp:
+    """
+    ASGI application around a Flask app. Requests for the endpoints in
+    ASYNC_VIEWS are handled on the event loop inside a Flask request context,
+    so those views use request, render_template and the app's error handlers
+    as usual; all other requests go to the Flask app itself.
+    """
+
+    def __init__(self, flask_app, wsgi_threads=ASGI_WSGI_THREADS):
+        self.flask_app = flask_app
+        self.wsgi_threads = wsgi_threads
+
+    @cached_property
+    def wsgi(self):
+        from a2wsgi import WSGIMiddleware
+        return WSGIMiddleware(self.flask_app, workers=self.wsgi_threads)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http':
+            match = self.match(scope)
+            if match is not None:
+                return await self.handle(scope, receive, send, *match)
+        await self.wsgi(scope, receive, send)
+
+    def match(self, scope):
+        """
+        Returns (async view, view arguments) if the request goes to one of
+        ASYNC_VIEWS, else None.
+        """
+        try:
+            endpoint, view_args = self.flask_app.url_map.bind('localhost').match(scope['path'], scope['method'])
+        except HTTPException:
+            return None  # Not found, method not allowed or a redirect: the Flask app answers those
+        view = ASYNC_VIEWS.get(endpoint)
+        return (view, view_args) if view is not None else None
+
+    async def handle(self, scope, receive, send, view, view_args):
+        started = time.perf_counter()
+        body = await read_body(receive)
+        headers = [(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope['headers']]
+        host = dict(headers).get('host') or '{}:{}'.format(*scope.get('server') or ('localhost', 80))
+        client = scope.get('client') or ('', 0)
+        context = self.flask_app.test_request_context(
+            scope['path'], base_url=f"{scope.get('scheme', 'http')}://{host}{scope.get('root_path', '')}",
+            query_string=scope['query_string'].decode('latin-1'), method=scope['method'], headers=headers, data=body,
+            environ_overrides={'REMOTE_ADDR': client[0], 'REMOTE_PORT': client[1]},
+        )
+        with context:
+            try:
+                rv = await view(**view_args)
+            except Exception as e:
+                try:
+                    rv = self.flask_app.handle_user_exception(e)
+                except Exception as e:
+                    rv = self.flask_app.handle_exception(e)
+            response = self.flask_app.make_response(rv)
+            observe_request(request.method, request.path, request.url_rule.rule, response.status_code,
+                            time.perf_counter() - started)
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in response.headers.items()],
+        })
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await close_async_off_client()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = AsyncApp(flask_app)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, port=int(os.environ.get('PORT', 8000)))
@@ -0,0 +1,14 @@
+"""
+Benchmarks for the recipe finder, run as modules from the repository root
+(python -m benchmarks.<name>):
+
+    synthetic_data      deterministic RecipeNLG-shaped CSVs of any size
+    fixtures            cached benchmark data: synthetic recipes and a food database
+    off_stub            local Open Food Facts stand-in with configurable latency and faults
+    microbenchmarks     hot functions over the fixtures, saved as JSON
+    load_test           throughput and tail latency per route under concurrent users
+    compare             flags regressions between two saved runs
+    parse_ingredients   ingredient parsing throughput on a real dataset sample
+    import_time         cold start and deferred imports
+    worker_memory       memory of forked workers sharing the recipe data
+"""
@@ -0,0 +1,92 @@
+"""
+Saves benchmark results as JSON and compares two result files, flagging
+benchmarks that got slower than a threshold allows. Exits with status 1 on
+a regression so CI can fail the build. Run from the repository root:
+
+    python -m benchmarks.compare baseline.json current.json [--threshold 0.25]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+
+def run_metadata(**extra):
+    """
+    Where and on what a run happened, so results are only compared with like.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        **extra,
+    }
+
+
+def save_results(path, suite, results, **metadata):
+    """
+    Writes {'suite', 'metadata', 'results'} to path. results maps benchmark
+    names to dicts that carry at least 'seconds_per_op'.
+    """
+    document = {'suite': suite, 'metadata': run_metadata(**metadata), 'results': results}
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+    return document
+
+
+def load_results(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_results(baseline, current, threshold=0.25, metric='seconds_per_op'):
+    """
+    Returns (name, baseline value, current value, relative change, regressed)
+    for every benchmark in both runs. Higher is worse for the metric.
+    """
+    rows = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name, {}).get(metric)
+        after = result.get(metric)
+        if not before or after is None:
+            continue
+        change = after / before - 1
+        rows.append((name, before, after, change, change > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown, as a fraction')
+    parser.add_argument('--metric', default='seconds_per_op')
+    args = parser.parse_args()
+
+    baseline, current = load_results(args.baseline), load_results(args.current)
+    if baseline['metadata'].get('platform') != current['metadata'].get('platform'):
+        print("warning: the runs come from different platforms")
+    rows = compare_results(baseline, current, args.threshold, args.metric)
+    print(f"{'benchmark':<28} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, before, after, change, regressed in rows:
+        print(f"{name:<28} {before:>12.6g} {after:>12.6g} {change:>+8.1%}{'  REGRESSION' if regressed else ''}")
+    regressions = [row[0] for row in rows if row[4]]
+    if regressions:
+        print(f"FAIL: {len(regressions)} benchmark(s) slower by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Data for the benchmarks: a synthetic recipe CSV and a food database built
+from the bundled FoodData Central CSVs, both cached under
+BENCHMARK_DATA_DIR so repeated runs reuse them.
+
+The app's modules read their paths from the environment when they are
+first imported, so call use_fixtures() before importing any of them.
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+
+BENCHMARK_DATA_DIR = os.environ.get(
+    'BENCHMARK_DATA_DIR', os.path.join(tempfile.gettempdir(), 'recipe-finder-benchmarks')
+)
+
+DEFAULT_ROWS = 100_000
+
+
+def recipe_csv_path(rows, seed=0, data_dir=BENCHMARK_DATA_DIR):
+    return os.path.join(data_dir, f'recipes-{rows}-{seed}.csv')
+
+
+def food_database_path(data_dir=BENCHMARK_DATA_DIR):
+    return os.path.join(data_dir, 'food_database.db')
+
+
+def use_fixtures(rows=DEFAULT_ROWS, seed=0, data_dir=BENCHMARK_DATA_DIR, off_base_url=None):
+    """
+    Points the app at the benchmark data, creating whatever is missing, and
+    returns {'recipes': csv path, 'food_database': db path}. Caches are kept
+    in memory and background work is off, so runs only measure the code.
+    """
+    paths = {'recipes': recipe_csv_path(rows, seed, data_dir), 'food_database': food_database_path(data_dir)}
+    os.environ['RECIPE_DATA_PATH'] = paths['recipes']
+    os.environ['RECIPE_SNAPSHOT_PATH'] = os.path.splitext(paths['recipes'])[0] + '.snapshot'
+    os.environ['FOOD_DATABASE_PATH'] = paths['food_database']
+    os.environ.setdefault('RESPONSE_CACHE_BACKEND', 'memory')
+    os.environ.setdefault('SESSION_BACKEND', 'memory')
+    os.environ.setdefault('PRODUCT_CACHE_WARMING', '0')
+    os.environ.setdefault('RECIPE_PRELOAD', '0')
+    if off_base_url is not None:
+        os.environ['OFF_BASE_URL'] = off_base_url
+
+    if not os.path.exists(paths['recipes']):
+        from benchmarks.synthetic_data import write_recipes_csv
+        print(f"Generating {rows} synthetic recipes in {paths['recipes']}")
+        write_recipes_csv(paths['recipes'], rows, seed)
+    if not os.path.exists(paths['food_database']):
+        build_food_database(paths['food_database'])
+    else:
+        # A database cached by an older version may need the current schema
+        from food_database import ensure_schema
+        ensure_schema(paths['food_database'])
+    return paths
+
+
+def build_food_database(db_path):
+    """
+    Imports the FoodData Central CSVs under FDC_CSV_DIR into a new database
+    at db_path. The release bundled under Static/ ships without its
+    food_nutrient file, so the import then starts from a copy of the
+    committed food_database.db, which has the nutrient amounts.
+    """
+    from import_fdc import FDC_CSV_DIR, import_fdc
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    tmp_path = db_path + '.tmp'
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(tmp_path + suffix):
+            os.remove(tmp_path + suffix)
+    if not os.path.exists(os.path.join(FDC_CSV_DIR, 'food_nutrient.csv')):
+        repository_database = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                           'food_database.db')
+        print(f"No food_nutrient.csv in {FDC_CSV_DIR}; starting from {repository_database}")
+        source = sqlite3.connect(f'file:{repository_database}?mode=ro', uri=True)
+        target = sqlite3.connect(tmp_path)
+        source.backup(target)
+        target.close()
+        source.close()
+    import_fdc(FDC_CSV_DIR, tmp_path)
+    os.replace(tmp_path, db_path)
+    return db_path
+
+
+def clear_fixtures(data_dir=BENCHMARK_DATA_DIR):
+    shutil.rmtree(data_dir, ignore_errors=True)
@@ -0,0 +1,102 @@
+"""
+Checks the app's cold start: how long `import app` takes in a fresh
+interpreter, which modules dominate it, and that heavy dependencies (pandas,
+pint, requests, aiohttp) are not imported up front. Exits with status 1 when
+the import exceeds the budget or a deferred module gets imported;
+tests/test_import_time.py runs the same check. Run from the repository root:
+
+    python -m benchmarks.import_time [--budget SECONDS] [--first-request]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Loaded on first use only; importing any of them at startup is a regression
+DEFERRED_MODULES = ('pandas', 'pint', 'requests', 'aiohttp')
+# Seconds `import app` may take in a fresh interpreter
+IMPORT_TIME_BUDGET = float(os.environ.get('IMPORT_TIME_BUDGET', 1.0))
+
+CHECK_MODULES = f'''
+import sys
+import app
+print(','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))
+'''
+
+FIRST_REQUEST = '''
+import time
+import app
+start = time.perf_counter()
+response = app.app.test_client().get('/')
+print(f"{time.perf_counter() - start:.3f} {response.status_code}")
+'''
+
+
+def run(code, importtime=False):
+    env = dict(os.environ, RECIPE_PRELOAD='0')
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code]
+    start = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True, env=env, cwd=REPOSITORY_ROOT, check=True)
+    return time.perf_counter() - start, result
+
+
+def deferred_imported(check_output):
+    """
+    Returns the deferred modules CHECK_MODULES found imported.
+    """
+    return [m for m in check_output.strip().split(',') if m]
+
+
+def slowest_imports(importtime_output, count):
+    """
+    Returns (cumulative microseconds, module) of the slowest modules imported
+    directly by app.py.
+    """
+    imports = []
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # A module is listed after everything it imports, one level deeper: '   flask' then ' app'
+        depth = len(name) - len(name.lstrip(' '))
+        if depth == 1:
+            if name.strip() == 'app':
+                break
+            imports = []
+        elif depth == 3:
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget', type=float, default=IMPORT_TIME_BUDGET, help='maximum seconds for `import app`')
+    parser.add_argument('--top', type=int, default=10, help='slowest imports to list')
+    parser.add_argument('--first-request', action='store_true', help='also time the first request to /')
+    args = parser.parse_args()
+
+    elapsed, result = run(CHECK_MODULES, importtime=True)
+    imported = deferred_imported(result.stdout)
+    print(f"import app: {elapsed:.3f}s in a fresh interpreter (budget {args.budget:.3f}s)")
+    for cumulative, name in slowest_imports(result.stderr, args.top):
+        print(f"    {cumulative / 1e6:7.3f}s  {name}")
+
+    if args.first_request:
+        _, result = run(FIRST_REQUEST)
+        seconds, status = result.stdout.split()
+        print(f"first request to /: {float(seconds):.3f}s (status {status})")
+
+    failures = []
+    if elapsed > args.budget:
+        failures.append(f"import took {elapsed:.3f}s, over the {args.budget:.3f}s budget")
+    if imported:
+        failures.append(f"imported at startup: {', '.join(imported)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+"""
+End-to-end load test: starts the app (and the Open Food Facts stub in place
+of the real API) on the benchmark fixtures, then runs concurrent virtual
+users through a realistic journey for a fixed time and reports requests/sec
+and p50/p95/p99 latency per route. Each user keeps its own session cookie:
+
+    /  (a few pages)  ->  /search with allergens  ->  /recipe_details
+    ->  /fetch_products for each ingredient  ->  /select_product (+ /saved_recipes)
+    ->  /calculate_nutrition  ->  /check_allergens
+
+The app runs in its own process, under the Werkzeug threaded server, under
+gunicorn with gunicorn.conf.py or as the ASGI app (asgi.py) under uvicorn,
+so servers, worker counts and configurations can be compared; --url drives
+an app that is already running instead.
+Results are saved as JSON for benchmarks/compare.py (use --metric p95).
+Run from the repository root:
+
+    python -m benchmarks.load_test [--users 16] [--duration 30] [--server werkzeug|gunicorn|uvicorn]
+                                   [--workers N] [--off-latency 0.05] [--output load_results.json]
+"""
+import argparse
+import html
+import os
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import quote
+import numpy as np
+from benchmarks.fixtures import BENCHMARK_DATA_DIR, DEFAULT_ROWS, use_fixtures
+
+ALLERGEN_CHOICES = ['milk', 'egg', 'peanut', 'wheat', 'soy', 'shellfish', 'sesame']
+SEARCH_TERMS = ['cake', 'chicken', 'cookies', 'soup', 'salad', 'easy', 'casserole', 'pie', 'butter', 'bread']
+
+NEXT_PAGE = re.compile(r'href="([^"]*)" aria-label="Next"')
+RECIPE_LINK = re.compile(r'/recipe_details/(\d+)')
+INGREDIENT_INPUT = re.compile(r'value="([^"]*)" id="ingredient-\d+"')
+# Concrete paths -> the route they hit, so latencies are grouped per route
+ROUTE_PATTERNS = [(re.compile(r'^/recipe_details/\d+'), '/recipe_details/<id>')]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_ready(base_url, timeout, process=None):
+    import requests
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"The server exited with status {process.returncode}")
+        try:
+            if requests.get(f'{base_url}/ready', timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{base_url} was not ready after {timeout:.0f}s")
+
+
+def start_server(kind, port, workers, threads, log):
+    """
+    Starts the app in a subprocess on port, logging to the open file log;
+    the environment carries the fixture paths and OFF_BASE_URL.
+    """
+    env = dict(os.environ)
+    if kind == 'gunicorn':
+        env.update(WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads), GUNICORN_BIND=f'127.0.0.1:{port}')
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py']
+    elif kind == 'uvicorn':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port),
+                   '--workers', str(workers), '--log-level', 'warning']
+    else:
+        command = [sys.executable, '-c',
+                   f'from app import app; app.run(host="127.0.0.1", port={port}, threaded=True)']
+    return subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+class Recorder:
+    """
+    Collects (route, seconds, ok) per request from every virtual user.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+        self.recording = False
+
+    def record(self, route, seconds, ok):
+        if not self.recording:
+            return
+        with self._lock:
+            self.samples.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def summary(self, elapsed):
+        results = {}
+        everything = []
+        for route, samples in sorted(self.samples.items()):
+            everything.extend(samples)
+            results[route] = self._stats(samples, self.errors.get(route, 0), elapsed)
+        if everything:
+            results['all'] = self._stats(everything, sum(self.errors.values()), elapsed)
+        return results
+
+    @staticmethod
+    def _stats(samples, errors, elapsed):
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        return {
+            'requests': len(samples),
+            'errors': errors,
+            'requests_per_sec': len(samples) / elapsed,
+            'mean': float(np.mean(samples)),
+            'p50': float(p50),
+            'p95': float(p95),
+            'p99': float(p99),
+        }
+
+
+class VirtualUser:
+    """
+    One user with its own session cookie, going through the journey in a
+    loop until stopped.
+    """
+
+    def __init__(self, base_url, recorder, seed, think_time=0.0, max_ingredients=6):
+        import requests
+        from benchmarks.off_stub import synthetic_search
+        self.base_url = base_url
+        self.recorder = recorder
+        self.session = requests.Session()
+        self.random = np.random.default_rng(seed)
+        self.think_time = think_time
+        self.max_ingredients = max_ingredients
+        self.synthetic_search = synthetic_search
+
+    def request(self, method, path, **kwargs):
+        route = path.split('?', 1)[0]
+        for pattern, name in ROUTE_PATTERNS:
+            if pattern.match(route):
+                route = name
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, allow_redirects=False, timeout=60, **kwargs)
+            ok = response.status_code < 400
+        except Exception:
+            self.recorder.record(route, time.perf_counter() - start, False)
+            return None
+        self.recorder.record(route, time.perf_counter() - start, ok)
+        if self.think_time:
+            time.sleep(self.random.exponential(self.think_time))
+        return response
+
+    def journey(self):
+        path = '/'
+        for _ in range(int(self.random.integers(1, 4))):
+            response = self.request('GET', path)
+            next_page = NEXT_PAGE.search(response.text) if response is not None else None
+            if next_page is None:
+                break
+            path = html.unescape(next_page.group(1))
+
+        query = SEARCH_TERMS[self.random.integers(len(SEARCH_TERMS))]
+        allergens = ','.join(self.random.choice(ALLERGEN_CHOICES, size=int(self.random.integers(0, 3)), replace=False))
+        response = self.request('GET', f'/search?recipe={quote(query)}&allergens={quote(allergens)}')
+        recipe_ids = RECIPE_LINK.findall(response.text) if response is not None else []
+        if not recipe_ids:
+            return
+        recipe_id = recipe_ids[self.random.integers(len(recipe_ids))]
+
+        response = self.request('GET', f'/recipe_details/{recipe_id}')
+        ingredients = [html.unescape(name) for name in INGREDIENT_INPUT.findall(response.text)] if response else []
+        selected = {}
+        for ingredient in ingredients[:self.max_ingredients]:
+            self.request('GET', f'/fetch_products?ingredient={quote(ingredient)}&source=openfoodfacts')
+            # The stub's answers are deterministic, so the user can pick from them without parsing the page
+            products = self.synthetic_search(ingredient, 6)['products']
+            if products:
+                selected[ingredient] = products[0]
+
+        for ingredient, product in list(selected.items())[:2]:
+            response = self.request('POST', '/select_product', data={
+                'recipe_id': recipe_id, 'ingredient': ingredient, 'code': product['code'],
+                'product_name': product['product_name'], 'nutriscore': product['nutriscore_grade'],
+                'ecoscore': product['ecoscore_grade'],
+            })
+            if response is not None and response.is_redirect:
+                self.request('GET', '/saved_recipes')
+
+        from api_requests import extract_nutrients
+        selected_products = {
+            ingredient: {
+                'product_name': product['product_name'],
+                'nutrients': extract_nutrients(product),
+                'allergens_hierarchy': product['allergens_hierarchy'],
+                'serving_size': product['serving_size'],
+            }
+            for ingredient, product in selected.items()
+        }
+        self.request('POST', '/calculate_nutrition', json={'selectedProducts': selected_products})
+        self.request('POST', '/check_allergens', json={'selectedProducts': selected_products})
+
+    def run(self, stop):
+        while not stop.is_set():
+            try:
+                self.journey()
+            except Exception as e:
+                self.recorder.record('journey', 0.0, False)
+                print(f"journey failed: {e!r}", file=sys.stderr)
+
+
+def run_load(base_url, users, duration, warmup, think_time, seed):
+    """
+    Runs users virtual users against base_url; latencies from the first
+    warmup seconds are not recorded. Returns (results per route, elapsed).
+    """
+    recorder = Recorder()
+    stop = threading.Event()
+    threads = [threading.Thread(target=VirtualUser(base_url, recorder, [seed, i], think_time).run, args=(stop,),
+                                daemon=True) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    time.sleep(warmup)
+    recorder.recording = True
+    started = time.perf_counter()
+    time.sleep(duration)
+    recorder.recording = False
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=60)
+    return recorder.summary(elapsed), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=16, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds of measured load')
+    parser.add_argument('--warmup', type=float, default=5.0, help='seconds of load before measuring')
+    parser.add_argument('--think-time', type=float, default=0.0, help='mean seconds a user waits between requests')
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help='synthetic recipes in the dataset')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--server', choices=['werkzeug', 'gunicorn', 'uvicorn'], default='werkzeug')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn or uvicorn worker processes')
+    parser.add_argument('--threads', type=int, default=4, help='threads per gunicorn worker')
+    parser.add_argument('--url', default=None, help='drive an already running app instead of starting one')
+    parser.add_argument('--off-latency', type=float, default=0.05, help='seconds the OFF stub takes per response')
+    parser.add_argument('--off-jitter', type=float, default=0.02)
+    parser.add_argument('--output', default='load_results.json')
+    args = parser.parse_args()
+
+    processes = []
+    try:
+        base_url = args.url
+        if base_url is None:
+            off_port, app_port = free_port(), free_port()
+            processes.append(subprocess.Popen(
+                [sys.executable, '-m', 'benchmarks.off_stub', '--port', str(off_port),
+                 '--latency', str(args.off_latency), '--jitter', str(args.off_jitter)],
+                stdout=subprocess.DEVNULL))
+            # Production-like stores, fresh for every run
+            state_dir = os.path.join(BENCHMARK_DATA_DIR, 'load_test')
+            os.makedirs(state_dir, exist_ok=True)
+            for name in os.listdir(state_dir):
+                os.remove(os.path.join(state_dir, name))
+            os.environ.update(RESPONSE_CACHE_BACKEND='sqlite', SESSION_BACKEND='sqlite', PRODUCT_CACHE_WARMING='1',
+                              RESPONSE_CACHE_PATH=os.path.join(state_dir, 'response_cache.db'),
+                              SESSION_STORE_PATH=os.path.join(state_dir, 'session_store.db'),
+                              RECIPE_PRELOAD='1', LOG_LEVEL='WARNING')
+            use_fixtures(args.rows, args.seed, off_base_url=f'http://127.0.0.1:{off_port}')
+            server_log = open(os.path.join(state_dir, 'server.log'), 'w')
+            server = start_server(args.server, app_port, args.workers, args.threads, server_log)
+            processes.append(server)
+            print(f"Server log: {server_log.name}")
+            base_url = f'http://127.0.0.1:{app_port}'
+            wait_until_ready(base_url, timeout=600, process=server)
+        else:
+            wait_until_ready(base_url, timeout=60)
+
+        print(f"{args.users} users for {args.duration:.0f}s against {base_url} ({args.server if not args.url else 'external'})")
+        results, elapsed = run_load(base_url, args.users, args.duration, args.warmup, args.think_time, args.seed)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    print(f"{'route':<24} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route, result in results.items():
+        print(f"{route:<24} {result['requests']:>9} {result['errors']:>7} {result['requests_per_sec']:>8.1f} "
+              f"{result['p50'] * 1000:>8.1f} {result['p95'] * 1000:>8.1f} {result['p99'] * 1000:>8.1f}")
+
+    from benchmarks.compare import save_results
+    save_results(args.output, 'load_test', results, users=args.users, duration=elapsed, server=args.server,
+                 workers=args.workers if args.server != 'werkzeug' else 1, rows=args.rows,
+                 off_latency=args.off_latency, url=args.url)
+    print(f"Saved results to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+Microbenchmarks of the app's hot functions over synthetic recipes and the
+bundled FoodData Central foods (see benchmarks/fixtures.py). Every benchmark
+runs a warm-up round and then times several rounds of the same operations,
+so the figures are for warm caches, as in a long-running worker. Results are
+saved as JSON; compare two runs with benchmarks/compare.py, or pass
+--compare to fail on a regression right away. Run from the repository root:
+
+    python -m benchmarks.microbenchmarks [--rows N] [--only NAME ...] [--rounds R]
+                                         [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import statistics
+import sys
+import time
+from functools import cached_property
+import numpy as np
+from benchmarks.fixtures import DEFAULT_ROWS, use_fixtures
+
+ALLERGEN_CHOICES = ['milk', 'egg', 'peanut', 'wheat', 'soy', 'shellfish', 'tree nuts', 'sesame', 'fish']
+
+# name -> (setup(workload) returning run(i), operations per round)
+BENCHMARKS = {}
+
+
+def benchmark(name, ops):
+    def register(setup):
+        BENCHMARKS[name] = (setup, ops)
+        return setup
+    return register
+
+
+class Workload:
+    """
+    Inputs shared by the benchmarks, drawn deterministically from the
+    synthetic dataset: sample recipes, title queries, allergen selections
+    and, per recipe, the local products a user would pick.
+    """
+
+    def __init__(self, seed=0, sample=200):
+        from recipe_data_handler import iter_recipes
+        from recipe_store import get_recipe_store
+        store = get_recipe_store()
+        self.random = np.random.default_rng(seed)
+        rows = self.random.choice(len(store), size=min(sample, len(store)), replace=False)
+        self.recipes = list(iter_recipes(rows))
+        self.queries = [' '.join(recipe['title'].split()[:int(self.random.integers(1, 3))]).lower()
+                        for recipe in self.recipes]
+        self.allergens = [list(self.random.choice(ALLERGEN_CHOICES, size=int(self.random.integers(0, 3)),
+                                                  replace=False)) for _ in self.recipes]
+
+    @cached_property
+    def selections(self):
+        """
+        {ingredient: product} per recipe, as the nutrition and allergen
+        routes receive them: the best local match for each NER term, with
+        the quantity and unit parsed from its ingredient line.
+        """
+        from fetch_from_localdb import fetch_from_localdb
+        from recipe_parser import parse_ingredient
+        selections = []
+        for recipe in self.recipes[:50]:
+            selected = {}
+            for line, name in zip(recipe['ingredients'], recipe['NER']):
+                products = fetch_from_localdb(name, limit=1)
+                if not products:
+                    continue
+                parsed = parse_ingredient(line)
+                selected[name] = dict(products[0], quantity=parsed.quantity, unit=parsed.unit)
+            selections.append(selected)
+        return selections
+
+
+@benchmark('fetch_filtered_recipes', ops=200)
+def bench_fetch_filtered_recipes(workload):
+    from recipe_data_handler import fetch_filtered_recipes
+    queries, allergens = workload.queries, workload.allergens
+    return lambda i: fetch_filtered_recipes(queries[i % len(queries)], allergens[i % len(allergens)])
+
+
+@benchmark('recipe_details', ops=200)
+def bench_recipe_details(workload):
+    from app import app
+    client = app.test_client()
+    ids = [recipe['id'] for recipe in workload.recipes]
+    return lambda i: client.get(f'/recipe_details/{ids[i % len(ids)]}')
+
+
+@benchmark('parse_multiple_ingredients', ops=1000)
+def bench_parse_multiple_ingredients(workload):
+    from recipe_parser import parse_multiple_ingredients
+    lines = [recipe['ingredients'] for recipe in workload.recipes]
+    return lambda i: parse_multiple_ingredients(lines[i % len(lines)])
+
+
+@benchmark('calculate_nutrition', ops=1000)
+def bench_calculate_nutrition(workload):
+    from nutrition_calculator import calculate_nutrition
+    selections = workload.selections
+    return lambda i: calculate_nutrition(selections[i % len(selections)])
+
+
+@benchmark('check_allergens', ops=5000)
+def bench_check_allergens(workload):
+    from allergen_checker import check_allergens
+    from benchmarks.off_stub import synthetic_search
+    # Local products and Open Food Facts ones, which carry allergen tags
+    selections = list(workload.selections)
+    for recipe in workload.recipes[:50]:
+        selections.append({name: synthetic_search(name, 1)['products'][0] for name in recipe['NER']})
+    allergens = workload.allergens
+    return lambda i: check_allergens(selections[i % len(selections)], allergens[i % len(allergens)] or ['milk'])
+
+
+@benchmark('convert_to_grams', ops=20000)
+def bench_convert_to_grams(workload):
+    from unit_conversion import convert_to_grams
+    conversions = [(product['quantity'], product['unit'], product.get('food_id'))
+                   for selected in workload.selections for product in selected.values()
+                   if product['quantity'] is not None]
+    return lambda i: convert_to_grams(*conversions[i % len(conversions)])
+
+
+@benchmark('fetch_from_localdb', ops=2000)
+def bench_fetch_from_localdb(workload):
+    from fetch_from_localdb import fetch_from_localdb
+    terms = [name for recipe in workload.recipes for name in recipe['NER']]
+    return lambda i: fetch_from_localdb(terms[i % len(terms)])
+
+
+def run_benchmark(run, ops, rounds):
+    for i in range(ops):
+        run(i)
+    seconds_per_op = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for i in range(ops):
+            run(i)
+        seconds_per_op.append((time.perf_counter() - start) / ops)
+    median = statistics.median(seconds_per_op)
+    return {
+        'ops': ops,
+        'rounds': rounds,
+        'seconds_per_op': median,
+        'best_seconds_per_op': min(seconds_per_op),
+        'ops_per_sec': 1 / median,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help='synthetic recipes in the dataset')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), default=None)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplies the operations per round')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', default=None, help='baseline results to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown, as a fraction')
+    args = parser.parse_args()
+
+    use_fixtures(args.rows, args.seed)
+    from benchmarks.compare import compare_results, load_results, save_results
+    workload = Workload(args.seed)
+
+    results = {}
+    print(f"{'benchmark':<28} {'ops/sec':>12} {'median us/op':>13} {'best us/op':>11}")
+    for name in args.only or BENCHMARKS:
+        setup, ops = BENCHMARKS[name]
+        result = run_benchmark(setup(workload), max(int(ops * args.scale), 1), args.rounds)
+        results[name] = result
+        print(f"{name:<28} {result['ops_per_sec']:>12,.0f} {result['seconds_per_op'] * 1e6:>13.1f} "
+              f"{result['best_seconds_per_op'] * 1e6:>11.1f}")
+
+    document = save_results(args.output, 'microbenchmarks', results, rows=args.rows, seed=args.seed)
+    print(f"Saved results to {args.output}")
+    if args.compare:
+        regressions = [row for row in compare_results(load_results(args.compare), document, args.threshold) if row[4]]
+        for name, before, after, change, _ in regressions:
+            print(f"REGRESSION: {name} {before * 1e6:.1f} -> {after * 1e6:.1f} us/op ({change:+.1%})")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+"""
+A local stand-in for the Open Food Facts API, for benchmarks and load tests.
+It answers the search (/cgi/search.pl) and product (/api/v2/product/<code>.json)
+endpoints the app uses, after a configurable latency, so upstream waits are
+part of what gets measured without calling the real service.
+
+Responses are replayed from a recordings file when it has them. Other
+requests get a deterministic synthetic response of the same shape, or, with
+--record, are fetched once from the real API and added to the recordings.
+Faults (an error status, a slow response) can be injected per path with
+inject(), for the client tests in tests/test_off_client.py.
+Point the app at it with OFF_BASE_URL. Run from the repository root:
+
+    python -m benchmarks.off_stub [--port 8099] [--latency 0.05] [--jitter 0.02]
+                                  [--recordings path.json] [--record]
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+DEFAULT_PAGE_SIZE = 24
+GRADES = 'abcde'
+PRODUCT_PATH = re.compile(r'^/api/v2/product/([^/]+)\.json$')
+
+
+def _digest(*parts):
+    return hashlib.sha1('|'.join(map(str, parts)).encode()).digest()
+
+
+def normalize_terms(search_terms):
+    return re.sub(r'\s+', ' ', search_terms or '').strip().lower()
+
+
+def synthetic_product(code, name=None):
+    """
+    A product with the fields the app reads, derived from its code so the
+    same code always gives the same product.
+    """
+    from allergen_index import ALLERGEN_MATCHER
+    digest = _digest(code)
+    name = name or f'Product {code}'
+    per_100g = {
+        'energy-kcal': 50 + digest[0] * 2,
+        'fat': digest[1] / 8,
+        'saturated-fat': digest[2] / 20,
+        'carbohydrates': digest[3] / 3,
+        'sugars': digest[4] / 6,
+        'fiber': digest[5] / 25,
+        'proteins': digest[6] / 8,
+        'salt': digest[7] / 100,
+        'sodium': digest[7] / 250,
+    }
+    nutriments = {f'{nutrient}_100g': round(amount, 2) for nutrient, amount in per_100g.items()}
+    nutriments.update({f'{nutrient}_unit': 'kcal' if nutrient == 'energy-kcal' else 'g' for nutrient in per_100g})
+    if digest[8] % 2:
+        # Some products also give per-serving amounts, as on the real API
+        nutriments.update({f'{nutrient}_serving': round(amount * 0.3, 2) for nutrient, amount in per_100g.items()})
+    families = sorted(ALLERGEN_MATCHER.families_in(name.lower()))
+    return {
+        'code': code,
+        'product_name': name,
+        'brands': f'Brand {digest[9] % 40}',
+        'image_url': f'https://images.openfoodfacts.org/images/products/{code}/front.jpg',
+        'ingredients_text': f'{name.lower()}, water, salt',
+        'nutriments': nutriments,
+        'nutriscore_grade': GRADES[digest[10] % 5],
+        'ecoscore_grade': GRADES[digest[11] % 5],
+        'allergens_hierarchy': [f"en:{family.replace('_', '-')}" for family in families],
+        'serving_size': f'{10 + digest[12] % 50 * 5} g',
+    }
+
+
+def synthetic_search(search_terms, page_size=DEFAULT_PAGE_SIZE):
+    terms = normalize_terms(search_terms)
+    count = _digest(terms)[0] % 20 + 5 if terms else 0
+    products = []
+    for i in range(min(count, page_size)):
+        code = str(int.from_bytes(_digest(terms, i)[:6], 'big') % 10**13).zfill(13)
+        products.append(synthetic_product(code, f'{terms.title()} {i + 1}'))
+    return {'count': count, 'page': 1, 'page_size': page_size, 'products': products}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default listen backlog of 5 drops connections when hundreds of lookups arrive at once
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # A client that timed out and hung up is expected, not worth a traceback
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class OffStub:
+    """
+    Serves the stub API on a background thread:
+
+        with OffStub(latency=0.05) as stub:
+            os.environ['OFF_BASE_URL'] = stub.base_url
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, recordings_path=None, record=False,
+                 upstream='https://world.openfoodfacts.org'):
+        self.latency = latency
+        self.jitter = jitter
+        self.recordings_path = recordings_path
+        self.record = record
+        self.upstream = upstream.rstrip('/')
+        self.recordings = {'search': {}, 'product': {}}
+        if recordings_path and os.path.exists(recordings_path):
+            with open(recordings_path, 'r', encoding='utf-8') as f:
+                self.recordings.update(json.load(f))
+        self._lock = threading.Lock()
+        self._served = {}  # code -> product from a search, so product lookups agree with it
+        self._faults = defaultdict(deque)  # path -> (status, delay, headers) for its next requests
+        self.requests = 0
+        self.faults = 0
+        self.replayed = 0
+        self._server = _Server((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='off-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self.record and self.recordings_path:
+            tmp_path = self.recordings_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.recordings, f)
+            os.replace(tmp_path, self.recordings_path)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def inject(self, path, status=None, delay=0.0, times=1, retry_after=None):
+        """
+        Makes the next times requests for path wait delay extra seconds and,
+        if status is given, answer with that status (and a Retry-After header
+        if retry_after is given) instead of the usual response.
+        """
+        headers = {'Retry-After': str(retry_after)} if retry_after is not None else {}
+        with self._lock:
+            self._faults[path].extend([(status, delay, headers)] * times)
+
+    def clear_faults(self):
+        """
+        Drops the injected faults not requested yet.
+        """
+        with self._lock:
+            self._faults.clear()
+
+    def take_fault(self, path):
+        """
+        Returns the next (status, delay, headers) injected for path, or None.
+        """
+        with self._lock:
+            faults = self._faults.get(path)
+            if not faults:
+                return None
+            self.faults += 1
+            return faults.popleft()
+
+    def respond(self, path, params):
+        """
+        Returns (status, body) for a request path and its query parameters.
+        """
+        match = PRODUCT_PATH.match(path)
+        if path == '/cgi/search.pl':
+            kind, key = 'search', normalize_terms(params.get('search_terms', ''))
+            page_size = int(params.get('page_size') or DEFAULT_PAGE_SIZE)
+        elif match:
+            kind, key = 'product', match.group(1)
+        else:
+            return 404, {'status': 0, 'status_verbose': 'unknown endpoint'}
+
+        with self._lock:
+            self.requests += 1
+            body = self.recordings[kind].get(key)
+            if body is not None:
+                self.replayed += 1
+        if body is None and self.record:
+            body = self._fetch_upstream(path, params)
+            with self._lock:
+                self.recordings[kind][key] = body
+        if body is None:
+            if kind == 'search':
+                body = synthetic_search(key, page_size)
+            else:
+                with self._lock:
+                    product = self._served.get(key)
+                body = {'code': key, 'status': 1, 'product': product or synthetic_product(key)}
+        if kind == 'search':
+            body = dict(body, products=body.get('products', [])[:page_size])
+            with self._lock:
+                self._served.update((product.get('code'), product) for product in body['products'])
+        elif params.get('fields') and body.get('product'):
+            fields = params['fields'].split(',')
+            body = dict(body, product={field: body['product'][field] for field in fields if field in body['product']})
+        return 200, body
+
+    def _fetch_upstream(self, path, params):
+        from urllib.request import Request, urlopen
+        query = dict(params)
+        query.pop('fields', None)  # Record whole products; fields are applied on replay
+        request = Request(f'{self.upstream}{path}?{urlencode(query)}', headers={'User-Agent': 'RecipeFinder/1.0'})
+        with urlopen(request, timeout=30) as response:
+            return json.load(response)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately; with Nagle's algorithm every keep-alive response stalls ~40 ms
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                delay = stub.latency + (random.uniform(0, stub.jitter) if stub.jitter else 0.0)
+                fault = stub.take_fault(url.path)
+                status, headers = None, {}
+                if fault is not None:
+                    status, fault_delay, headers = fault
+                    delay += fault_delay
+                if delay:
+                    time.sleep(delay)
+                if status is None:
+                    status, body = stub.respond(url.path, params)
+                else:
+                    body = {'status': 0, 'status_verbose': f'injected {status}'}
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many extra seconds, uniformly')
+    parser.add_argument('--recordings', default=None, help='JSON file of recorded responses to replay')
+    parser.add_argument('--record', action='store_true', help='fetch and record responses missing from --recordings')
+    args = parser.parse_args()
+
+    stub = OffStub(args.host, args.port, args.latency, args.jitter, args.recordings, args.record)
+    print(f"Open Food Facts stub on {stub.base_url}; run the app with OFF_BASE_URL={stub.base_url}")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Measures ingredient parsing throughput (lines/sec) over a sample of the
+RecipeNLG ingredients column. Run from the repository root:
+
+    python -m benchmarks.parse_ingredients [path/to/Recipedata.csv] [--recipes N]
+"""
+import argparse
+import time
+import pandas as pd
+import recipe_parser
+from recipe_snapshot import parse_list
+from recipe_store import RECIPE_CSV_PATH
+
+
+def load_lines(csv_path, recipes):
+    ingredients = pd.read_csv(csv_path, usecols=['ingredients'], nrows=recipes, dtype=str, keep_default_na=False)
+    return [line for text in ingredients['ingredients'] for line in parse_list(text)]
+
+
+def timed(function, lines):
+    start = time.perf_counter()
+    function(lines)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('csv_path', nargs='?', default=RECIPE_CSV_PATH)
+    parser.add_argument('--recipes', type=int, default=100_000, help='number of recipes to sample')
+    args = parser.parse_args()
+
+    lines = load_lines(args.csv_path, args.recipes)
+    distinct = len(set(lines))
+    print(f"{len(lines)} ingredient lines from {args.recipes} recipes ({distinct} distinct)")
+
+    # Cold: every distinct line goes through the patterns once
+    recipe_parser._parse.cache_clear()
+    elapsed = timed(recipe_parser.parse_batch, lines)
+    print(f"parse_batch, cold cache: {elapsed:.2f}s ({len(lines) / elapsed:,.0f} lines/sec)")
+
+    elapsed = timed(recipe_parser.parse_batch, lines)
+    print(f"parse_batch, warm cache: {elapsed:.2f}s ({len(lines) / elapsed:,.0f} lines/sec)")
+
+    # Uncached: the cost of the patterns alone, as for a sample of all-distinct lines
+    uncached = recipe_parser._parse.__wrapped__
+    elapsed = timed(lambda sample: [uncached(line) for line in sample], lines)
+    print(f"patterns only, no cache: {elapsed:.2f}s ({len(lines) / elapsed:,.0f} lines/sec)")
+
+
+if __name__ == '__main__':
+    main()
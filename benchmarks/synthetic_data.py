@@ -0,0 +1,204 @@
+"""
+Writes a deterministic RecipeNLG-shaped CSV (the unnamed row number column,
+title, ingredients, directions, link, source and NER) for benchmarks, so
+performance can be measured without the multi-GB Kaggle download. Rows are
+generated in fixed-size blocks seeded by (seed, block), so a smaller file
+is always a prefix of a larger one with the same seed. Run from the
+repository root:
+
+    python -m benchmarks.synthetic_data path/to/Recipedata.csv [--rows N] [--seed S]
+"""
+import argparse
+import csv
+import json
+import os
+import time
+import numpy as np
+
+BLOCK_ROWS = 10_000
+
+# (NER term, how it is measured, words that may precede it on the line).
+# Ingredient frequencies follow a Zipf-like curve in this order, as in the
+# real dataset, where a few staples appear in most recipes.
+INGREDIENTS = [
+    ('sugar', 'volume', ['', 'granulated ', 'brown ']),
+    ('salt', 'spoon', ['', 'kosher ']),
+    ('butter', 'volume', ['', 'melted ', 'softened ']),
+    ('flour', 'volume', ['', 'all-purpose ', 'sifted ']),
+    ('eggs', 'count', ['', 'large ', 'beaten ']),
+    ('milk', 'volume', ['', 'evaporated ', 'skim ']),
+    ('onion', 'count', ['', 'chopped ', 'large ']),
+    ('water', 'volume', ['', 'boiling ', 'cold ']),
+    ('vanilla', 'spoon', ['']),
+    ('garlic', 'clove', ['', 'minced ']),
+    ('baking powder', 'spoon', ['']),
+    ('pepper', 'spoon', ['', 'black ']),
+    ('baking soda', 'spoon', ['']),
+    ('oil', 'volume', ['', 'vegetable ', 'olive ']),
+    ('cheese', 'mass', ['', 'grated ', 'Cheddar ']),
+    ('cinnamon', 'spoon', ['', 'ground ']),
+    ('lemon juice', 'spoon', ['', 'fresh ']),
+    ('sour cream', 'volume', ['']),
+    ('celery', 'volume', ['', 'chopped ']),
+    ('chicken', 'mass', ['', 'boneless ', 'cooked ']),
+    ('tomatoes', 'count', ['', 'diced ', 'ripe ']),
+    ('cream cheese', 'package', ['', 'softened ']),
+    ('nuts', 'volume', ['', 'chopped ']),
+    ('pecans', 'volume', ['', 'chopped ']),
+    ('ground beef', 'mass', ['', 'lean ']),
+    ('mayonnaise', 'volume', ['']),
+    ('honey', 'spoon', ['']),
+    ('green pepper', 'count', ['', 'chopped ']),
+    ('cream of mushroom soup', 'can', ['']),
+    ('walnuts', 'volume', ['', 'chopped ']),
+    ('carrots', 'count', ['', 'sliced ']),
+    ('potatoes', 'count', ['', 'peeled ']),
+    ('rice', 'volume', ['', 'cooked ', 'long grain ']),
+    ('soy sauce', 'spoon', ['', 'light ']),
+    ('peanut butter', 'volume', ['', 'creamy ', 'chunky ']),
+    ('almonds', 'volume', ['', 'slivered ', 'toasted ']),
+    ('shrimp', 'mass', ['', 'cooked ', 'peeled ']),
+    ('tuna', 'can', ['']),
+    ('salmon', 'mass', ['', 'fresh ']),
+    ('sesame seeds', 'spoon', ['', 'toasted ']),
+    ('sesame oil', 'spoon', ['']),
+    ('heavy cream', 'volume', ['']),
+    ('yogurt', 'volume', ['', 'plain ']),
+    ('chocolate chips', 'package', ['', 'semi-sweet ']),
+    ('oats', 'volume', ['', 'quick ']),
+    ('raisins', 'volume', ['']),
+    ('bacon', 'slice', ['', 'crisp ']),
+    ('mushrooms', 'volume', ['', 'sliced ']),
+    ('broccoli', 'package', ['', 'frozen ']),
+    ('spinach', 'package', ['', 'frozen ']),
+    ('cornstarch', 'spoon', ['']),
+    ('mustard', 'spoon', ['', 'dry ', 'prepared ']),
+    ('ketchup', 'volume', ['']),
+    ('parsley', 'spoon', ['', 'chopped ']),
+    ('basil', 'spoon', ['', 'dried ']),
+    ('oregano', 'spoon', ['', 'dried ']),
+    ('paprika', 'spoon', ['']),
+    ('bread crumbs', 'volume', ['', 'dry ']),
+    ('crackers', 'count', ['', 'crushed ']),
+    ('apples', 'count', ['', 'tart ']),
+    ('bananas', 'count', ['', 'ripe ']),
+    ('strawberries', 'volume', ['', 'sliced ']),
+    ('coconut', 'volume', ['', 'flaked ']),
+    ('tofu', 'mass', ['', 'firm ']),
+    ('pork', 'mass', ['', 'lean ']),
+    ('crab', 'mass', ['', 'lump ']),
+    ('cod', 'mass', ['']),
+    ('cashews', 'volume', ['', 'roasted ']),
+    ('hazelnuts', 'volume', ['']),
+    ('wheat germ', 'spoon', ['']),
+    ('buttermilk', 'volume', ['']),
+    ('zucchini', 'count', ['', 'grated ']),
+]
+
+UNITS = {
+    'volume': ['c.', 'cup', 'cups', 'Tbsp.', 'tsp.', 'qt.', 'pt.'],
+    'spoon': ['tsp.', 'Tbsp.', 'teaspoon', 'tablespoons', 'pinch'],
+    'mass': ['lb.', 'oz.', 'g', 'kg', 'pound'],
+    'count': [''],
+    'clove': ['clove', 'cloves'],
+    'slice': ['slices', 'strips'],
+    'can': ['(10 oz.) can', '(6 oz.) can', 'can'],
+    'package': ['(8 oz.) pkg.', '(10 oz.) pkg.', 'pkg.'],
+}
+
+QUANTITIES = ['1', '2', '3', '4', '1/2', '1/4', '3/4', '1/3', '2/3', '1 1/2', '2 1/2', '1 to 2', '6', '12']
+
+TITLE_WORDS = ['Easy', 'Best', "Grandma's", 'Quick', 'Baked', 'Creamy', 'Spicy', 'Old Fashioned', 'Holiday',
+               'Crunchy', 'No-Bake', 'Southern', 'Classic', 'Healthy', 'Homemade', 'Sweet', 'Hot']
+DISHES = ['Cake', 'Cookies', 'Casserole', 'Salad', 'Soup', 'Pie', 'Bread', 'Dip', 'Chili', 'Muffins', 'Stew',
+          'Bars', 'Fudge', 'Pudding', 'Stir Fry', 'Pasta', 'Brownies', 'Sauce', 'Cobbler', 'Punch', 'Scampi']
+
+DIRECTIONS = ['Preheat oven to 350°.', 'Mix all ingredients well.', 'Combine dry ingredients.',
+              'Add eggs one at a time, beating well.', 'Pour into a greased pan.', 'Bake for 30 minutes.',
+              'Simmer for 1 hour.', 'Chill before serving.', 'Stir in remaining ingredients.',
+              'Serve hot.', 'Cool and cut into squares.', 'Drain well.']
+
+SOURCES = ['Gathered', 'Recipes1M']
+
+
+def _ingredient_cdf():
+    ranks = np.arange(1, len(INGREDIENTS) + 1)
+    weights = 1.0 / ranks ** 0.9
+    return np.cumsum(weights / weights.sum())
+
+
+def _block(seed, block, start, rows):
+    # Every random draw of the block is made up front; the loop only formats
+    random = np.random.default_rng([seed, block])
+    lengths = random.integers(4, 13, rows)
+    line_offsets = np.concatenate([[0], np.cumsum(lengths)])
+    ingredients = np.minimum(np.searchsorted(_ingredient_cdf(), random.random(line_offsets[-1])),
+                             len(INGREDIENTS) - 1)
+    picks = random.integers(0, 1 << 30, (line_offsets[-1], 3))
+    title_picks = random.integers(0, 1 << 30, (rows, 3))
+    step_counts = random.integers(2, 7, rows)
+    steps = random.integers(0, len(DIRECTIONS), (rows, 6))
+    # Python ints index lists much faster than numpy scalars
+    line_offsets, ingredients, picks = line_offsets.tolist(), ingredients.tolist(), picks.tolist()
+    title_picks, step_counts, steps = title_picks.tolist(), step_counts.tolist(), steps.tolist()
+
+    for i in range(rows):
+        lines, ner = [], []
+        for line in range(line_offsets[i], line_offsets[i + 1]):
+            name, measure, modifiers = INGREDIENTS[ingredients[line]]
+            if name in ner:
+                continue
+            units = UNITS[measure]
+            quantity, unit, modifier = picks[line]
+            unit = units[unit % len(units)]
+            parts = (QUANTITIES[quantity % len(QUANTITIES)], unit, modifiers[modifier % len(modifiers)] + name)
+            lines.append(' '.join(part for part in parts if part))
+            ner.append(name)
+        # Titles repeat across the dataset; the main ingredient names many of them
+        word, dish, style = title_picks[i]
+        dish = DISHES[dish % len(DISHES)]
+        if style % 2:
+            title = f"{TITLE_WORDS[word % len(TITLE_WORDS)]} {dish}"
+        else:
+            title = f"{ner[0].title()} {dish}"
+        directions = [DIRECTIONS[step] for step in dict.fromkeys(steps[i][:step_counts[i]])]
+        recipe_id = start + i
+        source = SOURCES[recipe_id % 7 == 0]
+        if source == 'Gathered':
+            link = f'www.cookbooks.com/Recipe-Details.cfm?recipeid={recipe_id}'
+        else:
+            link = f'www.food.com/recipe/{title.lower().replace(" ", "-")}-{recipe_id}'
+        yield recipe_id, title, json.dumps(lines), json.dumps(directions), link, source, json.dumps(ner)
+
+
+def write_recipes_csv(path, rows, seed=0):
+    """
+    Writes rows synthetic recipes to path. The same (rows, seed) always
+    gives the same file.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['', 'title', 'ingredients', 'directions', 'link', 'source', 'NER'])
+        for block, start in enumerate(range(0, rows, BLOCK_ROWS)):
+            writer.writerows(_block(seed, block, start, min(BLOCK_ROWS, rows - start)))
+    os.replace(tmp_path, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path')
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    write_recipes_csv(args.path, args.rows, args.seed)
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {args.rows} recipes to {args.path} in {elapsed:.1f}s ({args.rows / max(elapsed, 1e-9):.0f} rows/sec)")
+
+
+if __name__ == '__main__':
+    main()
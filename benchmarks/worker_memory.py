@@ -0,0 +1,140 @@
+"""
+Measures the memory of forked worker processes serving the recipe data,
+the way gunicorn runs the app (see gunicorn.conf.py). For each worker count,
+the workers run the same searches and page reads, and then report their RSS,
+PSS (shared pages divided among the processes sharing them) and private
+memory from /proc/self/smaps_rollup while all of them are still alive.
+
+With --mode preload the parent loads the data before forking, as the
+gunicorn master does; with --mode per-worker every worker loads its own.
+Preloaded workers should show flat private memory as workers are added;
+tests/test_worker_memory.py checks that. Linux only. Run from the repository
+root:
+
+    python -m benchmarks.worker_memory [--workers 1 2 4 8] [--mode preload|per-worker]
+                                       [--max-private-mb MB] [--output results.json]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import numpy as np
+
+
+def memory_usage():
+    """
+    Returns this process's {'rss', 'pss', 'private', 'shared'} in MB.
+    """
+    fields = {}
+    with open('/proc/self/smaps_rollup', 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[-1] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {
+        'rss': fields.get('Rss', 0.0),
+        'pss': fields.get('Pss', 0.0),
+        'private': fields.get('Private_Clean', 0.0) + fields.get('Private_Dirty', 0.0),
+        'shared': fields.get('Shared_Clean', 0.0) + fields.get('Shared_Dirty', 0.0),
+    }
+
+
+def workload(seed):
+    """
+    What a worker does in a while of serving: title searches, allergen
+    filters over the whole dataset, browsing and recipe pages.
+    """
+    from recipe_data_handler import fetch_recipe, iter_recipes, search_recipe_page
+    from recipe_store import get_recipe_store
+    store = get_recipe_store()
+    random = np.random.default_rng(seed)
+    titles = [recipe['title'] for recipe in iter_recipes(random.integers(0, len(store), 20), ('title',))]
+    for title in titles:
+        page = search_recipe_page(title, ['milk'], None, 20)
+        list(iter_recipes(page.rows))
+    page = search_recipe_page('', ['egg', 'peanut'], None, 50)
+    list(iter_recipes(page.rows))
+    for recipe_id in random.integers(0, len(store), 1000):
+        fetch_recipe(int(store.recipe_ids[recipe_id]), [])
+
+
+def run_workers(count, preloaded):
+    """
+    Forks count workers and returns their memory_usage() after the workload,
+    measured while every worker is still alive.
+    """
+    workers = []
+    for i in range(count):
+        result_read, result_write = os.pipe()
+        exit_read, exit_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(result_read)
+            os.close(exit_write)
+            # Otherwise an earlier worker would never see its exit pipe close
+            for _, other_read, other_write in workers:
+                os.close(other_read)
+                os.close(other_write)
+            try:
+                if preloaded:
+                    gc.unfreeze()
+                workload(seed=i)
+                os.write(result_write, json.dumps(memory_usage()).encode())
+                os.close(result_write)
+                os.read(exit_read, 1)  # Stay alive until every worker is measured
+            finally:
+                os._exit(0)
+        os.close(result_write)
+        os.close(exit_read)
+        workers.append((pid, result_read, exit_write))
+
+    usages = []
+    for pid, result_read, exit_write in workers:
+        with os.fdopen(result_read, 'rb') as f:
+            usages.append(json.loads(f.read() or b'{}'))
+    for pid, result_read, exit_write in workers:
+        os.close(exit_write)
+        os.waitpid(pid, 0)
+    return usages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--mode', choices=['preload', 'per-worker'], default='preload')
+    parser.add_argument('--max-private-mb', type=float, default=None,
+                        help='fail if a worker averages more private memory than this')
+    parser.add_argument('--output', help='also save the averages per worker count as JSON')
+    args = parser.parse_args()
+
+    preloaded = args.mode == 'preload'
+    if preloaded:
+        from recipe_store import get_recipe_store
+        print(f"Loaded {len(get_recipe_store())} recipes in the parent")
+        gc.freeze()
+    parent = memory_usage()
+    print(f"parent: rss {parent['rss']:.1f} MB, pss {parent['pss']:.1f} MB")
+
+    print(f"{'workers':>7} {'total pss MB':>13} {'rss/worker':>11} {'pss/worker':>11} {'private/worker':>15}")
+    worst_private = 0.0
+    results = []
+    for count in args.workers:
+        usages = run_workers(count, preloaded)
+        total_pss = sum(usage['pss'] for usage in usages)
+        rss, pss, private = (sum(usage[key] for usage in usages) / count for key in ('rss', 'pss', 'private'))
+        worst_private = max(worst_private, private)
+        results.append({'workers': count, 'total_pss': total_pss, 'rss': rss, 'pss': pss, 'private': private})
+        print(f"{count:>7} {total_pss:>13.1f} {rss:>11.1f} {pss:>11.1f} {private:>15.1f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'mode': args.mode, 'parent': parent, 'results': results}, f, indent=2)
+
+    if args.max_private_mb is not None and worst_private > args.max_private_mb:
+        print(f"FAIL: workers average {worst_private:.1f} MB of private memory, over {args.max_private_mb:.1f} MB")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
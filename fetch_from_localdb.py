@@ -1,31 +1,18 @@
-import sqlite3
+from food_database import get_foods, search_foods
+from food_matcher import match_foods
 
 def fetch_from_localdb(ingredient, limit=6):
-    conn = sqlite3.connect('food_database.db')
-    cursor = conn.cursor()
-
-    # Search for foods matching the ingredient
-    cursor.execute('''
-        SELECT id, description FROM foods
-        WHERE description LIKE ?
-        LIMIT ?
-    ''', (f'%{ingredient}%', limit))
-
-    foods = cursor.fetchall()
+    # Match the ingredient to foods, best match first, nutrients included;
+    # full-text search covers terms the matcher has no candidates for
+    food_ids = match_foods(ingredient, limit)
+    foods = get_foods(food_ids) if food_ids else search_foods(ingredient, limit)
 
     products = []
-    for food_id, description in foods:
-        # Get nutrient information for each food
-        cursor.execute('''
-            SELECT nutrient_name, amount, unit
-            FROM nutrients
-            WHERE food_id = ?
-        ''', (food_id,))
-        nutrients = cursor.fetchall()
-
+    for food_id, description, nutrients in foods:
         # Construct a product dictionary similar to Open Food Facts data
         product = {
             'product_name': description,
+            'food_id': food_id,  # Lets the nutrition calculator use the food's portion weights
             'image_url': 'https://via.placeholder.com/150',  # Placeholder image
             'nutrients': [{'name': n[0], 'amount': n[1], 'unit': n[2]} for n in nutrients],
             # 'brands' and 'code' can be set to None or omitted
@@ -33,5 +20,4 @@ def fetch_from_localdb(ingredient, limit=6):
 
         products.append(product)
 
-    conn.close()
     return products
@@ -0,0 +1,307 @@
+import os
+import re
+import sqlite3
+import threading
+from observability import span
+
+FOOD_DATABASE_PATH = os.environ.get(
+    'FOOD_DATABASE_PATH', os.path.join(os.path.dirname(__file__), 'food_database.db')
+)
+
+# Nutrients are normalized: one row per nutrient in the nutrient dimension
+# table and one (food, nutrient, amount) row per measurement. Foods imported
+# from FoodData Central keep their fdc_id as foods.id.
+FOOD_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS foods (
+        id INTEGER PRIMARY KEY,
+        description TEXT,
+        data_type TEXT,
+        food_category_id INTEGER,
+        publication_date TEXT
+    );
+    CREATE TABLE IF NOT EXISTS food_category (
+        id INTEGER PRIMARY KEY,
+        code TEXT,
+        description TEXT
+    );
+    CREATE TABLE IF NOT EXISTS nutrient (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        unit_name TEXT,
+        nutrient_nbr TEXT,
+        rank REAL
+    );
+    CREATE TABLE IF NOT EXISTS food_nutrient (
+        id INTEGER PRIMARY KEY,
+        food_id INTEGER NOT NULL,
+        nutrient_id INTEGER NOT NULL,
+        amount REAL
+    );
+    CREATE TABLE IF NOT EXISTS measure_unit (
+        id INTEGER PRIMARY KEY,
+        name TEXT
+    );
+    CREATE TABLE IF NOT EXISTS food_portion (
+        id INTEGER PRIMARY KEY,
+        food_id INTEGER NOT NULL,
+        seq_num INTEGER,
+        amount REAL,
+        measure_unit_id INTEGER,
+        portion_description TEXT,
+        modifier TEXT,
+        gram_weight REAL
+    );
+    CREATE TABLE IF NOT EXISTS food_match_cache (
+        term TEXT PRIMARY KEY,
+        signature TEXT NOT NULL,
+        food_ids TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS import_log (
+        file_name TEXT PRIMARY KEY,
+        size INTEGER,
+        mtime REAL,
+        rows INTEGER,
+        imported_at REAL
+    );
+'''
+
+# The flat view the lookups read, one row per nutrient of a food
+NUTRIENTS_VIEW = '''
+    CREATE VIEW IF NOT EXISTS nutrients AS
+        SELECT fn.id AS id, fn.food_id AS food_id, n.name AS nutrient_name, fn.amount AS amount,
+               n.unit_name AS unit, n.rank AS rank
+        FROM food_nutrient fn
+        JOIN nutrient n ON n.id = fn.nutrient_id;
+'''
+
+# Secondary indexes and the full-text index over foods.description, kept in
+# sync with foods by triggers. The bulk importer drops these while loading and
+# recreates them afterwards. The porter stemmer lets 'tomatoes' match
+# 'Tomatoes, grape, raw' and 'egg' match 'Eggs'.
+SEARCH_SCHEMA = '''
+    CREATE INDEX IF NOT EXISTS idx_food_nutrient_food_id ON food_nutrient(food_id, nutrient_id);
+    CREATE INDEX IF NOT EXISTS idx_food_portion_food_id ON food_portion(food_id);
+    CREATE INDEX IF NOT EXISTS idx_nutrient_name_unit ON nutrient(name, unit_name);
+
+    CREATE VIRTUAL TABLE IF NOT EXISTS foods_fts USING fts5(
+        description, content='foods', content_rowid='id', tokenize='porter unicode61'
+    );
+
+    CREATE TRIGGER IF NOT EXISTS foods_fts_insert AFTER INSERT ON foods BEGIN
+        INSERT INTO foods_fts(rowid, description) VALUES (new.id, new.description);
+    END;
+    CREATE TRIGGER IF NOT EXISTS foods_fts_delete AFTER DELETE ON foods BEGIN
+        INSERT INTO foods_fts(foods_fts, rowid, description) VALUES ('delete', old.id, old.description);
+    END;
+    CREATE TRIGGER IF NOT EXISTS foods_fts_update AFTER UPDATE ON foods BEGIN
+        INSERT INTO foods_fts(foods_fts, rowid, description) VALUES ('delete', old.id, old.description);
+        INSERT INTO foods_fts(rowid, description) VALUES (new.id, new.description);
+    END;
+'''
+
+# Stored in PRAGMA user_version by ensure_schema. Bump it whenever the schema
+# above changes, so the app can tell an outdated database without touching it.
+FOOD_SCHEMA_VERSION = 1
+
+SEARCH_INDEX_NAMES = ('idx_food_nutrient_food_id', 'idx_food_portion_food_id', 'idx_nutrient_name_unit')
+SEARCH_TRIGGER_NAMES = ('foods_fts_insert', 'foods_fts_delete', 'foods_fts_update')
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+def _migrate_flat_nutrients(conn):
+    """
+    Moves the rows of the old flat nutrients table (name and unit repeated on
+    every row) into nutrient/food_nutrient, so the nutrients view replaces it.
+    """
+    conn.execute('''
+        INSERT INTO nutrient (name, unit_name)
+        SELECT DISTINCT nutrient_name, unit FROM nutrients
+        WHERE nutrient_name IS NOT NULL
+    ''')
+    conn.execute('''
+        INSERT INTO food_nutrient (id, food_id, nutrient_id, amount)
+        SELECT o.id, o.food_id, n.id, o.amount
+        FROM nutrients o
+        JOIN nutrient n ON n.name = o.nutrient_name AND n.unit_name IS o.unit
+    ''')
+    conn.execute('DROP TABLE nutrients')
+
+
+def ensure_schema(path=FOOD_DATABASE_PATH):
+    """
+    Creates the food tables, their indexes and the foods_fts full-text index
+    if they are missing, migrating a database in the old flat layout, and
+    switches the database to WAL so readers never block. Run by the
+    importers and `flask --app app upgrade-food-db`, never by the app
+    itself; a database that is already current is only read. Safe to call
+    repeatedly, also from several processes at once.
+    """
+    with _schema_lock:
+        if path in _schema_ready:
+            return
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        try:
+            if not _schema_is_current(conn):
+                _upgrade_schema(conn)
+        finally:
+            conn.close()
+        _schema_ready.add(path)
+
+
+def schema_is_current(path=FOOD_DATABASE_PATH):
+    """
+    Returns True if the database at path has the current schema version.
+    Only reads PRAGMA user_version, so it is safe on a read-only deploy.
+    """
+    if not os.path.exists(path):
+        return False
+    try:
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            return conn.execute('PRAGMA user_version').fetchone()[0] == FOOD_SCHEMA_VERSION
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+
+
+def _schema_is_current(conn):
+    # Also checks the objects themselves, which an import killed while loading may have left dropped
+    if conn.execute('PRAGMA user_version').fetchone()[0] != FOOD_SCHEMA_VERSION:
+        return False
+    objects = dict(conn.execute('SELECT name, type FROM sqlite_master'))
+    if objects.get('nutrients') != 'view' or 'foods_fts' not in objects:
+        return False
+    if any(name not in objects for name in (*re.findall(r'CREATE TABLE IF NOT EXISTS (\w+)', FOOD_SCHEMA),
+                                            *SEARCH_INDEX_NAMES, *SEARCH_TRIGGER_NAMES)):
+        return False
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(foods)')}
+    return {'data_type', 'food_category_id', 'publication_date'} <= columns
+
+
+def _upgrade_schema(conn):
+    conn.execute('PRAGMA journal_mode=WAL')
+    # The write lock is taken before looking at the schema, so a second process waits and then sees the result
+    conn.execute('BEGIN IMMEDIATE')
+    tables = dict(conn.execute("SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view')"))
+    if 'foods' in tables:
+        existing = {row[1] for row in conn.execute('PRAGMA table_info(foods)')}
+        for column in ('data_type TEXT', 'food_category_id INTEGER', 'publication_date TEXT'):
+            if column.split()[0] not in existing:
+                conn.execute(f'ALTER TABLE foods ADD COLUMN {column}')
+    for statement in _statements(FOOD_SCHEMA):
+        conn.execute(statement)
+    if tables.get('nutrients') == 'table':
+        conn.execute('DROP INDEX IF EXISTS idx_nutrients_food_id')
+        _migrate_flat_nutrients(conn)
+    conn.execute(NUTRIENTS_VIEW)
+    conn.execute('COMMIT')
+    conn.executescript(SEARCH_SCHEMA)
+    if 'foods_fts' not in tables:
+        conn.execute("INSERT INTO foods_fts(foods_fts) VALUES ('rebuild')")
+    conn.execute(f'PRAGMA user_version = {FOOD_SCHEMA_VERSION}')
+
+
+def _statements(script):
+    return [statement for statement in script.split(';') if statement.strip()]
+
+
+def get_read_connection(path=FOOD_DATABASE_PATH):
+    """
+    Returns this thread's read-only connection to the food database, opening
+    it on first use. Connections are reused for the life of the thread, but
+    never across a fork: a child process opens its own. The schema is not
+    checked here: the importers upgrade it and create_app warns if they have not.
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None or _local.pid != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+        conn.execute('PRAGMA query_only=ON')
+        conn.execute('PRAGMA mmap_size=268435456')
+        conn.execute('PRAGMA cache_size=-16000')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        connections[path] = conn
+    return conn
+
+
+def build_match_query(search_term):
+    """
+    Turns free text into an FTS5 query where every word must match. The last
+    word may also match as a prefix so partially typed words still find
+    foods; whole-word matches satisfy both branches and so rank first.
+    """
+    words = re.findall(r'\w+', search_term.lower())
+    if not words:
+        return None
+    terms = ' '.join(f'"{word}"' for word in words)
+    return f'({terms}) OR ({terms}*)'
+
+
+def search_foods(search_term, limit=6, path=FOOD_DATABASE_PATH):
+    """
+    Returns up to limit foods matching search_term, best match first, each as
+    (food_id, description, [(nutrient_name, amount, unit), ...]). Foods and
+    their nutrients come back from a single joined query.
+    """
+    match_query = build_match_query(search_term or '')
+    if match_query is None:
+        return []
+    # Nutrients are joined from the base tables, not the nutrients view: a
+    # LEFT JOIN onto the view makes SQLite materialize all of it per query
+    with span('sqlite.search_foods'):
+        rows = get_read_connection(path).execute('''
+            WITH matched AS (
+                SELECT rowid AS food_id, bm25(foods_fts) AS score
+                FROM foods_fts
+                WHERE foods_fts MATCH ?
+                ORDER BY score
+                LIMIT ?
+            )
+            SELECT f.id, f.description, n.name, fn.amount, n.unit_name
+            FROM matched m
+            JOIN foods f ON f.id = m.food_id
+            LEFT JOIN food_nutrient fn ON fn.food_id = f.id
+            LEFT JOIN nutrient n ON n.id = fn.nutrient_id
+            ORDER BY m.score, f.id, n.rank, fn.id
+        ''', (match_query, limit)).fetchall()
+
+    return _group_food_rows(rows)
+
+
+def get_foods(food_ids, path=FOOD_DATABASE_PATH):
+    """
+    Returns the foods with the given IDs, in that order, in the same shape as
+    search_foods. Unknown IDs are skipped.
+    """
+    food_ids = [int(food_id) for food_id in food_ids]
+    if not food_ids:
+        return []
+    with span('sqlite.get_foods'):
+        rows = get_read_connection(path).execute(f'''
+            WITH wanted(food_id, position) AS (VALUES {', '.join('(?, ?)' for _ in food_ids)})
+            SELECT f.id, f.description, n.name, fn.amount, n.unit_name
+            FROM wanted w
+            JOIN foods f ON f.id = w.food_id
+            LEFT JOIN food_nutrient fn ON fn.food_id = f.id
+            LEFT JOIN nutrient n ON n.id = fn.nutrient_id
+            ORDER BY w.position, n.rank, fn.id
+        ''', [value for position, food_id in enumerate(food_ids) for value in (food_id, position)]).fetchall()
+    return _group_food_rows(rows)
+
+
+def _group_food_rows(rows):
+    # (food_id, description, nutrient_name, amount, unit) rows, grouped by food in order
+    foods = []
+    for food_id, description, nutrient_name, amount, unit in rows:
+        if not foods or foods[-1][0] != food_id:
+            foods.append((food_id, description, []))
+        if nutrient_name is not None:
+            foods[-1][2].append((nutrient_name, amount, unit))
+    return foods
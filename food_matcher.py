@@ -0,0 +1,326 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
+from food_database import FOOD_DATABASE_PATH, get_read_connection
+from observability import register_cache, span
+
+# Bump whenever scoring changes so memoized matches are recomputed
+MATCHER_VERSION = 3
+
+STOPWORDS = {'a', 'an', 'and', 'or', 'with', 'without', 'of', 'in', 'the', 'to', 'for', 'fresh'}
+
+# Query tokens that do not occur in any description are matched to the most
+# similar description token with the same first letter by character trigrams,
+# if at least this similar: 'chiken' -> 'chicken' (0.44), 'yoghurt' -> 'yogurt'
+# (0.44). The first letter keeps 'vanilla' off 'manzanilla' and 'almons' off 'salmon'.
+MIN_TRIGRAM_SIMILARITY = 0.4
+
+# Weights of description tokens by comma-separated segment: 'Cheese, cheddar'
+# names the food first and then narrows it down. In the first segment only
+# its last word is the food; the others are modifiers ('Almond butter').
+SEGMENT_WEIGHTS = (1.0, 0.8, 0.5)
+MODIFIER_WEIGHT = 0.6
+HEAD_WEIGHT = 2.0
+HEAD_BONUS = 0.5
+# Extra bonus when the query names the whole first segment ('milk' -> 'Milk, whole')
+FIRST_SEGMENT_BONUS = 0.25
+MISSING_HEAD_FACTOR = 0.5
+EXTRA_TOKEN_PENALTY = 0.03
+# Plain forms are the better default for a recipe ingredient
+PREFERRED_TOKENS = {'raw': 0.1, 'whole': 0.05}
+
+# How many matches are memoized per term; callers may ask for fewer
+MEMO_SIZE = 10
+# Terms whose matches are kept in memory per process, least recently used dropped first
+FOOD_MATCH_MEMO_ENTRIES = int(os.environ.get('FOOD_MATCH_MEMO_ENTRIES', 10000))
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=65536)
+def singular(token):
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('es') and token[:-2].endswith(('s', 'x', 'ch', 'sh', 'o')):
+        return token[:-2]
+    if len(token) > 3 and token.endswith('s') and not token.endswith(('ss', 'us')):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    return [singular(token) for token in re.findall(r'[a-z]+', text.lower()) if token not in STOPWORDS]
+
+
+def normalize_term(term):
+    """
+    The memo key of an ingredient: 'Brown Sugars ' and 'brown sugar' share one.
+    """
+    return ' '.join(tokenize(term or ''))
+
+
+def trigrams(token):
+    padded = f' {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def foods_checksum(rows):
+    """
+    A short digest of (id, description) rows, so edited descriptions change
+    the matcher signature even when the IDs stay the same.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for food_id, description in rows:
+        digest.update(f'{food_id}\t{description}\n'.encode())
+    return digest.hexdigest()
+
+
+class FoodMatcher:
+    """
+    Matches ingredient names from recipes ('brown sugar', 'eggs') to foods
+    in the local database. Descriptions are indexed once into token postings
+    plus a trigram index over the token vocabulary for misspellings.
+    Candidates are scored by IDF-weighted token overlap, where the
+    ingredient's head noun (its last word) weighs double and matching the
+    food's leading noun ('Sugars, brown') earns a bonus, as does naming the
+    food's whole first segment ('milk' -> 'Milk, whole' over 'Soy milk'),
+    minus a small penalty per extra description token so plain foods beat
+    elaborate ones.
+
+    Results are memoized per normalized term in a bounded in-memory LRU and
+    read from the food_match_cache table, keyed on a signature of the foods
+    table (its IDs and descriptions) so a re-import invalidates them, even one
+    that only edits descriptions in place. Only the offline annotation job
+    writes that table (match with persist), so terms sent to the app can
+    never grow the database.
+    """
+
+    def __init__(self, path=FOOD_DATABASE_PATH, memo_entries=FOOD_MATCH_MEMO_ENTRIES):
+        self.path = path
+        self.memo_entries = memo_entries
+        rows = get_read_connection(path).execute(
+            'SELECT id, description FROM foods WHERE description IS NOT NULL ORDER BY id').fetchall()
+        self.signature = f'{MATCHER_VERSION}:{len(rows)}:{rows[-1][0] if rows else 0}:{foods_checksum(rows)}'
+        self.food_ids = np.array([food_id for food_id, _ in rows], dtype=np.int64)
+
+        vocabulary = {}
+        token_ids, food_rows, food_weights = array('q'), array('q'), array('d')
+        head_tokens = np.full(len(rows), -1, dtype=np.int64)
+        first_segment_counts = np.zeros(len(rows), dtype=np.int32)
+        preference = np.zeros(len(rows))
+        token_counts = np.zeros(len(rows), dtype=np.int32)
+        description_lengths = np.zeros(len(rows), dtype=np.int32)
+        for i, (_, description) in enumerate(rows):
+            description_lengths[i] = len(description)
+            weights = {}
+            for segment, text in enumerate(description.split(',')):
+                tokens = tokenize(text)
+                if segment == 0 and tokens:
+                    head_tokens[i] = vocabulary.setdefault(tokens[-1], len(vocabulary))
+                    first_segment_counts[i] = len(set(tokens))
+                for position, token in enumerate(tokens):
+                    if segment == 0 and position < len(tokens) - 1:
+                        weight = MODIFIER_WEIGHT
+                    else:
+                        weight = SEGMENT_WEIGHTS[min(segment, len(SEGMENT_WEIGHTS) - 1)]
+                    token_id = vocabulary.setdefault(token, len(vocabulary))
+                    # Marks first-segment tokens so the scorer can tell when all of them matched
+                    weights[token_id] = max(weights.get(token_id, 0.0), weight + (1.0 if segment == 0 else 0.0))
+                    preference[i] = max(preference[i], PREFERRED_TOKENS.get(token, 0.0))
+            token_counts[i] = len(weights)
+            token_ids.extend(weights)
+            food_rows.extend([i] * len(weights))
+            food_weights.extend(weights.values())
+
+        # CSR postings: the foods containing token t are posting_rows[offsets[t]:offsets[t + 1]]
+        token_ids = np.frombuffer(token_ids, dtype=np.int64)
+        order = np.argsort(token_ids, kind='stable')
+        self.posting_rows = np.frombuffer(food_rows, dtype=np.int64)[order]
+        posting_weights = np.frombuffer(food_weights, dtype=np.float64)[order]
+        self.posting_first_segment = posting_weights > 1.0
+        self.posting_weights = np.where(self.posting_first_segment, posting_weights - 1.0, posting_weights)
+        counts = np.bincount(token_ids, minlength=len(vocabulary))
+        self.posting_offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.idf = np.log1p(len(rows) / np.maximum(counts, 1))
+        self.vocabulary = vocabulary
+        self.head_tokens = head_tokens
+        self.first_segment_counts = first_segment_counts
+        self.preference = preference
+        self.token_counts = token_counts
+        self.description_lengths = description_lengths
+
+        self.trigram_index = {}
+        for token, token_id in vocabulary.items():
+            for trigram in trigrams(token):
+                self.trigram_index.setdefault(trigram, []).append(token_id)
+        self._tokens_by_id = list(vocabulary)
+
+        self._memo = OrderedDict()
+        self._memo_lock = threading.Lock()
+        # Terms answered from a memo, in memory or in food_match_cache, and terms scored
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+
+    def _closest_token(self, token):
+        """
+        Returns (token ID, similarity) of the most similar vocabulary token, or None.
+        """
+        if len(token) < 4:
+            return None
+        grams = trigrams(token)
+        shared = {}
+        for trigram in grams:
+            for token_id in self.trigram_index.get(trigram, ()):
+                shared[token_id] = shared.get(token_id, 0) + 1
+        best = None
+        for token_id, count in shared.items():
+            if self._tokens_by_id[token_id][0] != token[0]:
+                continue
+            similarity = count / (len(grams) + len(trigrams(self._tokens_by_id[token_id])) - count)
+            if similarity >= MIN_TRIGRAM_SIMILARITY and (best is None or similarity > best[1]):
+                best = (token_id, similarity)
+        return best
+
+    def score(self, term):
+        """
+        Returns (food row positions, scores) for every candidate food, best first.
+        """
+        tokens = list(dict.fromkeys(tokenize(term or '')))
+        if not tokens:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        query = []  # (token ID, weight)
+        head_id = None
+        for position, token in enumerate(tokens):
+            weight = HEAD_WEIGHT if position == len(tokens) - 1 else 1.0
+            token_id = self.vocabulary.get(token)
+            if token_id is None:
+                closest = self._closest_token(token)
+                if closest is None:
+                    continue
+                token_id, similarity = closest
+                weight *= similarity
+            query.append((token_id, weight))
+            if position == len(tokens) - 1:
+                head_id = token_id
+        if not query:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        rows, contributions, first_segment = [], [], []
+        for token_id, weight in dict(query).items():
+            start, stop = self.posting_offsets[token_id], self.posting_offsets[token_id + 1]
+            rows.append(self.posting_rows[start:stop])
+            contributions.append(self.posting_weights[start:stop] * weight * self.idf[token_id])
+            first_segment.append(self.posting_first_segment[start:stop])
+        candidates, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions), minlength=len(candidates))
+        matched = np.bincount(inverse, minlength=len(candidates))
+        matched_first_segment = np.bincount(inverse, weights=np.concatenate(first_segment), minlength=len(candidates))
+        scores /= sum(weight * self.idf[token_id] for token_id, weight in query)
+
+        if head_id is not None:
+            start, stop = self.posting_offsets[head_id], self.posting_offsets[head_id + 1]
+            has_head = np.isin(candidates, self.posting_rows[start:stop])
+            scores[~has_head] *= MISSING_HEAD_FACTOR
+            scores[self.head_tokens[candidates] == head_id] += HEAD_BONUS
+        scores[matched_first_segment == self.first_segment_counts[candidates]] += FIRST_SEGMENT_BONUS
+        scores += self.preference[candidates]
+        scores -= EXTRA_TOKEN_PENALTY * (self.token_counts[candidates] - matched)
+
+        order = np.lexsort((self.food_ids[candidates], self.description_lengths[candidates], -scores))
+        return candidates[order], scores[order]
+
+    def match(self, term, limit=6, persist=False):
+        """
+        Returns the IDs of up to limit foods best matching term, best first.
+        With persist, a newly scored term that matched is also stored in
+        food_match_cache; only the offline annotation job sets it.
+        """
+        key = normalize_term(term)
+        if not key:
+            return []
+        with self._memo_lock:
+            food_ids = self._memo.get(key)
+            if food_ids is not None:
+                self._memo.move_to_end(key)
+        scored = False
+        if food_ids is None:
+            food_ids = self._load_memo(key)
+            if food_ids is None:
+                with span('food_matcher.score'):
+                    rows, _ = self.score(key)
+                food_ids = self.food_ids[rows[:MEMO_SIZE]].tolist()
+                if persist and food_ids:
+                    self._save_memo(key, food_ids)
+                scored = True
+        with self._memo_lock:
+            self._memo[key] = food_ids
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.memo_entries:
+                self._memo.popitem(last=False)
+            if scored:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return food_ids[:limit]
+
+    def _write_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _load_memo(self, key):
+        with span('sqlite.food_match_cache'):
+            row = get_read_connection(self.path).execute(
+                'SELECT signature, food_ids FROM food_match_cache WHERE term = ?', (key,)).fetchone()
+        if row is None or row[0] != self.signature:
+            return None
+        return json.loads(row[1])
+
+    def _save_memo(self, key, food_ids):
+        # Best effort: a read-only or busy database only loses the persistent memo
+        try:
+            self._write_connection().execute(
+                'INSERT OR REPLACE INTO food_match_cache (term, signature, food_ids) VALUES (?, ?, ?)',
+                (key, self.signature, json.dumps(food_ids)))
+        except sqlite3.Error as e:
+            logger.warning("Could not store the food match for '%s': %s", key, e)
+
+
+_matchers = {}
+_matchers_lock = threading.Lock()
+
+
+def get_food_matcher(path=FOOD_DATABASE_PATH):
+    """
+    Returns the shared FoodMatcher for a food database, building its index on first use.
+    """
+    matcher = _matchers.get(path)
+    if matcher is None:
+        with _matchers_lock:
+            matcher = _matchers.get(path)
+            if matcher is None:
+                with span('food_matcher.build'):
+                    matcher = _matchers[path] = FoodMatcher(path)
+    return matcher
+
+
+def match_foods(term, limit=6, path=FOOD_DATABASE_PATH, persist=False):
+    return get_food_matcher(path).match(term, limit, persist)
+
+
+register_cache('food_match', lambda: (sum(m.hits for m in list(_matchers.values())),
+                                      sum(m.misses for m in list(_matchers.values()))))
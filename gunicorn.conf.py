@@ -0,0 +1,44 @@
+"""
+Gunicorn settings for serving the app with several worker processes:
+
+    gunicorn -c gunicorn.conf.py
+
+The master loads the app and the recipe data once, before forking, so every
+worker shares the same memory-mapped snapshot pages and the indexes built
+from them instead of loading its own copy. Resident memory per worker then
+stays roughly flat as workers are added (see benchmarks/worker_memory.py).
+"""
+import gc
+import multiprocessing
+import os
+
+# The master loads the recipe data synchronously in when_ready, rather than
+# in a background thread that forking could cut off halfway
+os.environ.setdefault('RECIPE_PRELOAD', '0')
+
+# The instance app.py builds at import, so the process holds a single app
+wsgi_app = 'app:app'
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+# Streamed API responses and keep-alive clients
+keepalive = 5
+preload_app = True
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before any worker is forked
+    from food_matcher import get_food_matcher
+    from recipe_store import get_recipe_store
+    store = get_recipe_store()
+    server.log.info(f"Recipe data loaded: {len(store)} recipes")
+    try:
+        get_food_matcher()
+    except Exception as e:
+        server.log.warning(f"Food matcher not preloaded: {e}")
+    # Objects created so far are never collected; the collector would
+    # otherwise write to their headers in each worker and unshare the pages
+    gc.freeze()
@@ -0,0 +1,303 @@
+import csv
+import logging
+import os
+import sqlite3
+import sys
+import time
+from food_database import (FOOD_DATABASE_PATH, SEARCH_INDEX_NAMES, SEARCH_SCHEMA, SEARCH_TRIGGER_NAMES,
+                           ensure_schema)
+
+logger = logging.getLogger(__name__)
+
+FDC_CSV_DIR = os.environ.get('FDC_CSV_DIR', os.path.join(
+    os.path.dirname(__file__), 'Static', 'FoodData_Central_foundation_food_csv_2024-04-18',
+    'FoodData_Central_foundation_food_csv_2024-04-18'))
+
+# Only real foods are imported; the sample/acquisition records of the
+# Foundation release are lab bookkeeping and would only pollute searches.
+FDC_DATA_TYPES = tuple(os.environ.get(
+    'FDC_DATA_TYPES', 'foundation_food,sr_legacy_food,survey_fndds_food,branded_food').split(','))
+
+BATCH_SIZE = 50_000
+COMMIT_ROWS = 1_000_000
+
+csv.field_size_limit(sys.maxsize)
+
+
+def _int(value):
+    return int(value) if value else None
+
+
+def _float(value):
+    return float(value) if value else None
+
+
+def _text(value):
+    return value or None
+
+
+class FdcTable:
+    """
+    How one FoodData Central CSV file maps onto a table: the CSV columns to
+    read as (csv column, table column, converter), and the upsert statement
+    to run. keep(row), if given, filters the converted rows; tables whose
+    rows reference foods are reloaded whenever the foods are. reader, if
+    given, replaces the plain CSV reader, and a file with fallback_for is
+    only read when that file is missing from the release.
+    """
+
+    def __init__(self, file_name, table, columns, keep=None, references_foods=False, reader=None,
+                 fallback_for=None):
+        self.file_name = file_name
+        self.table = table
+        self.columns = columns
+        self.keep = keep
+        self.references_foods = references_foods
+        self.reader = reader
+        self.fallback_for = fallback_for
+
+    def insert_sql(self, db_columns):
+        placeholders = ', '.join('?' * len(db_columns))
+        updates = ', '.join(f'{column} = excluded.{column}' for column in db_columns[1:])
+        return (f'INSERT INTO {self.table} ({", ".join(db_columns)}) VALUES ({placeholders}) '
+                f'ON CONFLICT(id) DO UPDATE SET {updates}')
+
+
+def fdc_tables(known_foods, data_types=FDC_DATA_TYPES):
+    """
+    The files of a FoodData Central CSV release in load order: dimensions
+    first, then foods, then the rows that reference foods. known_foods is
+    the set of imported food IDs, filled in as the foods are loaded. The
+    foods come from food.csv, or, in a Foundation release without it (such
+    as the one under Static/), from foundation_food.csv.
+    """
+    def keep_food(row):
+        if row[2] in data_types:
+            known_foods.add(row[0])
+            return True
+        return False
+
+    def references_known_food(row):
+        return row[1] in known_foods
+
+    return [
+        FdcTable('food_category.csv', 'food_category',
+                 [('id', 'id', _int), ('code', 'code', _text), ('description', 'description', _text)]),
+        FdcTable('measure_unit.csv', 'measure_unit',
+                 [('id', 'id', _int), ('name', 'name', _text)]),
+        FdcTable('nutrient.csv', 'nutrient',
+                 [('id', 'id', _int), ('name', 'name', _text), ('unit_name', 'unit_name', _text),
+                  ('nutrient_nbr', 'nutrient_nbr', _text), ('rank', 'rank', _float)]),
+        FdcTable('food.csv', 'foods',
+                 [('fdc_id', 'id', _int), ('description', 'description', _text), ('data_type', 'data_type', _text),
+                  ('food_category_id', 'food_category_id', _int), ('publication_date', 'publication_date', _text)],
+                 keep_food),
+        FdcTable('foundation_food.csv', 'foods',
+                 [('fdc_id', 'id', _int), ('description', 'description', _text), ('data_type', 'data_type', _text),
+                  ('food_category_id', 'food_category_id', _int), ('publication_date', 'publication_date', _text)],
+                 keep_food, reader=_read_foundation_foods, fallback_for='food.csv'),
+        FdcTable('food_nutrient.csv', 'food_nutrient',
+                 [('id', 'id', _int), ('fdc_id', 'food_id', _int), ('nutrient_id', 'nutrient_id', _int),
+                  ('amount', 'amount', _float)],
+                 references_known_food, references_foods=True),
+        FdcTable('food_portion.csv', 'food_portion',
+                 [('id', 'id', _int), ('fdc_id', 'food_id', _int), ('seq_num', 'seq_num', _int),
+                  ('amount', 'amount', _float), ('measure_unit_id', 'measure_unit_id', _int),
+                  ('portion_description', 'portion_description', _text), ('modifier', 'modifier', _text),
+                  ('gram_weight', 'gram_weight', _float)],
+                 references_known_food, references_foods=True),
+    ]
+
+
+def _read_rows(csv_path, table):
+    """
+    Streams the converted rows of one CSV file, never holding more than one
+    line in memory. Columns missing from this release are imported as NULL.
+    """
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        positions = [header.index(csv_column) if csv_column in header else None
+                     for csv_column, _, _ in table.columns]
+        converters = [converter for _, _, converter in table.columns]
+        for line in reader:
+            values = [converter(line[position]) if position is not None and position < len(line) else None
+                      for position, converter in zip(positions, converters)]
+            if table.keep is None or table.keep(values):
+                yield values
+
+
+def _read_foundation_foods(csv_path, table):
+    """
+    Streams the foods of foundation_food.csv, which lists only their FDC
+    IDs, with the description of each food's latest entry in
+    food_update_log_entry.csv. Rows are in the column order of food.csv.
+    """
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        fdc_ids = [_int(row['fdc_id']) for row in csv.DictReader(f)]
+    wanted = set(fdc_ids)
+    latest = {}
+    log_path = os.path.join(os.path.dirname(csv_path), 'food_update_log_entry.csv')
+    with open(log_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            fdc_id = _int(row['id'])
+            if fdc_id in wanted and row['last_updated'] >= latest.get(fdc_id, ('', None))[0]:
+                latest[fdc_id] = (row['last_updated'], row['description'])
+    for fdc_id in fdc_ids:
+        last_updated, description = latest.get(fdc_id, (None, None))
+        values = [fdc_id, _text(description), 'foundation_food', None, _text(last_updated)]
+        if table.keep is None or table.keep(values):
+            yield values
+
+
+def _adopt_legacy_foods(conn):
+    """
+    Foods loaded by the old populate_db.py have local IDs and no data type.
+    Each one whose description matches a food just imported hands its
+    nutrients to that food, unless the release gave it nutrients of its own,
+    and is then deleted, so the release's foods replace them instead of
+    duplicating them. Returns the number of foods replaced.
+    """
+    pairs = conn.execute('''
+        SELECT legacy.id, MIN(f.id)
+        FROM foods legacy
+        JOIN foods f ON f.description = legacy.description AND f.data_type IS NOT NULL
+        WHERE legacy.data_type IS NULL
+        GROUP BY legacy.id
+    ''').fetchall()
+    conn.execute('BEGIN')
+    for legacy_id, fdc_id in pairs:
+        conn.execute('''
+            UPDATE food_nutrient SET food_id = ?
+            WHERE food_id = ? AND NOT EXISTS (SELECT 1 FROM food_nutrient WHERE food_id = ?)
+        ''', (fdc_id, legacy_id, fdc_id))
+        conn.execute('DELETE FROM food_nutrient WHERE food_id = ?', (legacy_id,))
+        conn.execute('DELETE FROM food_portion WHERE food_id = ?', (legacy_id,))
+        conn.execute('DELETE FROM foods WHERE id = ?', (legacy_id,))
+    conn.execute('COMMIT')
+    return len(pairs)
+
+
+def _is_unchanged(conn, file_name, stat):
+    row = conn.execute('SELECT size, mtime FROM import_log WHERE file_name = ?', (file_name,)).fetchone()
+    return row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime
+
+
+def _load_table(conn, csv_path, table):
+    """
+    Upserts every row of csv_path with executemany, BATCH_SIZE rows at a
+    time, committing every COMMIT_ROWS rows. Returns the number of rows.
+    """
+    sql = table.insert_sql([db_column for _, db_column, _ in table.columns])
+    rows = 0
+    uncommitted = 0
+    batch = []
+    conn.execute('BEGIN')
+    rows_iter = table.reader(csv_path, table) if table.reader is not None else _read_rows(csv_path, table)
+    for values in rows_iter:
+        batch.append(values)
+        if len(batch) >= BATCH_SIZE:
+            conn.executemany(sql, batch)
+            rows += len(batch)
+            uncommitted += len(batch)
+            batch = []
+            if uncommitted >= COMMIT_ROWS:
+                conn.execute('COMMIT')
+                conn.execute('BEGIN')
+                uncommitted = 0
+    if batch:
+        conn.executemany(sql, batch)
+        rows += len(batch)
+    conn.execute('COMMIT')
+    return rows
+
+
+def import_fdc(csv_dir=FDC_CSV_DIR, db_path=FOOD_DATABASE_PATH, data_types=FDC_DATA_TYPES, force=False):
+    """
+    Imports a FoodData Central CSV release (Foundation, SR Legacy, FNDDS or
+    Branded) into the food database. Rows are upserted by their FDC IDs, so
+    the import can be re-run on the same or a newer release; files that have
+    not changed since the last import are skipped unless force is set.
+    Foods that populate_db.py loaded under local IDs are replaced by the
+    release's foods of the same description (see _adopt_legacy_foods).
+    A release without food_nutrient.csv, such as the Foundation download
+    under Static/, imports foods and portions but no nutrient amounts.
+
+    Search indexes and the full-text triggers are dropped for the load and
+    rebuilt once at the end, which is much faster than maintaining them row
+    by row. Returns {file name: rows imported}.
+    """
+    ensure_schema(db_path)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    counts = {}
+    started = time.perf_counter()
+    try:
+        conn.execute('PRAGMA journal_mode=MEMORY')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute('PRAGMA cache_size=-262144')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        for name in SEARCH_INDEX_NAMES:
+            conn.execute(f'DROP INDEX IF EXISTS {name}')
+        for name in SEARCH_TRIGGER_NAMES:
+            conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+        # Foods from earlier runs count as known, so food_nutrient.csv can be
+        # re-imported on its own when only it has changed.
+        known_foods = {row[0] for row in conn.execute('SELECT id FROM foods')}
+        for table in fdc_tables(known_foods, data_types):
+            csv_path = os.path.join(csv_dir, table.file_name)
+            if table.fallback_for and os.path.exists(os.path.join(csv_dir, table.fallback_for)):
+                continue
+            if not os.path.exists(csv_path):
+                if not table.fallback_for:
+                    logger.info("Skipping %s: not found in %s", table.file_name, csv_dir)
+                continue
+            stat = os.stat(csv_path)
+            foods_reloaded = table.references_foods and any(
+                file_name in counts for file_name in ('food.csv', 'foundation_food.csv'))
+            if not force and not foods_reloaded and _is_unchanged(conn, table.file_name, stat):
+                logger.info("Skipping %s: unchanged since the last import", table.file_name)
+                continue
+
+            file_started = time.perf_counter()
+            rows = _load_table(conn, csv_path, table)
+            elapsed = time.perf_counter() - file_started
+            conn.execute('INSERT OR REPLACE INTO import_log (file_name, size, mtime, rows, imported_at) '
+                         'VALUES (?, ?, ?, ?, ?)', (table.file_name, stat.st_size, stat.st_mtime, rows, time.time()))
+            counts[table.file_name] = rows
+            logger.info("Imported %d rows from %s in %.1fs (%.0f rows/sec)",
+                        rows, table.file_name, elapsed, rows / max(elapsed, 1e-9))
+        if 'food.csv' in counts or 'foundation_food.csv' in counts:
+            adopted = _adopt_legacy_foods(conn)
+            if adopted:
+                logger.info("Replaced %d foods with local IDs by the release's foods of the same description", adopted)
+    finally:
+        # Indexes and triggers come back even if the load failed part way
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        index_started = time.perf_counter()
+        conn.executescript(SEARCH_SCHEMA)
+        conn.execute("INSERT INTO foods_fts(foods_fts) VALUES ('rebuild')")
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.close()
+        logger.info("Rebuilt indexes in %.1fs", time.perf_counter() - index_started)
+
+    total = sum(counts.values())
+    elapsed = time.perf_counter() - started
+    logger.info("Imported %d rows in %.1fs (%.0f rows/sec)", total, elapsed, total / max(elapsed, 1e-9))
+    return counts
+
+
+if __name__ == '__main__':
+    import argparse
+    from observability import configure_logging
+    parser = argparse.ArgumentParser(description='Import a FoodData Central CSV release into the food database.')
+    parser.add_argument('csv_dir', nargs='?', default=FDC_CSV_DIR)
+    parser.add_argument('db_path', nargs='?', default=FOOD_DATABASE_PATH)
+    parser.add_argument('--data-types', default=','.join(FDC_DATA_TYPES),
+                        help='comma-separated FDC data types to import')
+    parser.add_argument('--force', action='store_true', help='re-import files even if they are unchanged')
+    args = parser.parse_args()
+    configure_logging()
+    import_fdc(args.csv_dir, args.db_path, tuple(args.data_types.split(',')), args.force)
@@ -0,0 +1,233 @@
+import csv
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from api_requests import OFF_NUTRIENTS
+from off_mirror import (MIRROR_SCHEMA, OFF_MIRROR_PATH, PRODUCT_COLUMNS, SEARCH_INDEX_NAMES, SEARCH_SCHEMA,
+                        SEARCH_TRIGGER_NAMES, ensure_schema)
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 10_000
+COMMIT_ROWS = 500_000
+
+# The nutriments kept per product: what extract_nutrients reads
+NUTRIMENT_KEYS = [f'{nutrient}_{suffix}' for nutrient in OFF_NUTRIENTS for suffix in ('100g', 'serving', 'unit')]
+
+csv.field_size_limit(sys.maxsize)
+
+
+def _open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def _first(product, *fields):
+    for field in fields:
+        value = product.get(field)
+        if value:
+            return value
+    return None
+
+
+def product_row(product):
+    """
+    The products row (PRODUCT_COLUMNS) for one product of the dump, or None
+    for products without a name, which no search could find.
+    """
+    name = _first(product, 'product_name', 'product_name_en')
+    code = product.get('code')
+    if not name or not code:
+        return None
+    nutriments = product.get('nutriments') or {}
+    kept = {key: nutriments[key] for key in NUTRIMENT_KEYS if nutriments.get(key) is not None}
+    allergens = _first(product, 'allergens_hierarchy', 'allergens_tags') or []
+    return (
+        str(code),
+        name,
+        product.get('brands') or None,
+        _first(product, 'image_url', 'image_front_url'),
+        product.get('ingredients_text') or None,
+        _first(product, 'nutriscore_grade', 'nutrition_grades'),
+        _first(product, 'ecoscore_grade', 'environmental_score_grade'),
+        ','.join(allergens) if isinstance(allergens, list) else allergens,
+        product.get('serving_size') or None,
+        json.dumps(kept, separators=(',', ':')) if kept else None,
+        int(float(product.get('unique_scans_n') or 0)),
+    )
+
+
+def read_jsonl(path):
+    """
+    Streams the products of the JSONL export (openfoodfacts-products.jsonl.gz),
+    one line at a time.
+    """
+    with _open_text(path) as f:
+        for line in f:
+            try:
+                product = json.loads(line)
+            except ValueError:
+                continue  # The export has the odd truncated line
+            row = product_row(product)
+            if row is not None:
+                yield row
+
+
+def read_csv(path):
+    """
+    Streams the products of the tab-separated CSV export
+    (en.openfoodfacts.org.products.csv.gz). It has per-100 g nutrient
+    values only, in grams except energy-kcal; allergen tags are in the
+    allergens column.
+    """
+    with _open_text(path) as f:
+        reader = csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE)
+        header = next(reader)
+        positions = {column: position for position, column in enumerate(header)}
+        for line in reader:
+            product = {column: line[position] for column, position in positions.items()
+                       if position < len(line) and line[position]}
+            nutriments = {}
+            for nutrient in OFF_NUTRIENTS:
+                amount = product.get(f'{nutrient}_100g')
+                if amount is not None:
+                    try:
+                        nutriments[f'{nutrient}_100g'] = float(amount)
+                    except ValueError:
+                        continue
+                    nutriments[f'{nutrient}_unit'] = 'kcal' if nutrient == 'energy-kcal' else 'g'
+            product['nutriments'] = nutriments
+            product['allergens_hierarchy'] = [tag for tag in product.get('allergens', '').split(',') if tag]
+            row = product_row(product)
+            if row is not None:
+                yield row
+
+
+def read_dump(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith(('.jsonl', '.json')):
+        return read_jsonl(path)
+    if name.endswith(('.csv', '.tsv')):
+        return read_csv(path)
+    raise ValueError(f"Unknown Open Food Facts export format: {path} (expected .jsonl or .csv, optionally .gz)")
+
+
+def _is_unchanged(conn, file_name, stat):
+    row = conn.execute('SELECT size, mtime FROM import_log WHERE file_name = ?', (file_name,)).fetchone()
+    return row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime
+
+
+def _load_products(conn, rows_iter):
+    """
+    Upserts the products by barcode with executemany, BATCH_SIZE rows at a
+    time, committing every COMMIT_ROWS rows. Returns the number of rows.
+    """
+    placeholders = ', '.join('?' * len(PRODUCT_COLUMNS))
+    updates = ', '.join(f'{column} = excluded.{column}' for column in PRODUCT_COLUMNS[1:])
+    sql = (f'INSERT INTO products ({", ".join(PRODUCT_COLUMNS)}) VALUES ({placeholders}) '
+           f'ON CONFLICT(code) DO UPDATE SET {updates}')
+    rows = 0
+    uncommitted = 0
+    batch = []
+    conn.execute('BEGIN')
+    for values in rows_iter:
+        batch.append(values)
+        if len(batch) >= BATCH_SIZE:
+            conn.executemany(sql, batch)
+            rows += len(batch)
+            uncommitted += len(batch)
+            batch = []
+            if uncommitted >= COMMIT_ROWS:
+                conn.execute('COMMIT')
+                conn.execute('BEGIN')
+                uncommitted = 0
+    if batch:
+        conn.executemany(sql, batch)
+        rows += len(batch)
+    conn.execute('COMMIT')
+    return rows
+
+
+def _renumber_by_popularity(conn):
+    """
+    Copies the products into a fresh table in popularity order, so their IDs
+    (and the full-text index's rowids) run from most to least scanned.
+    """
+    columns = ', '.join(PRODUCT_COLUMNS)
+    conn.execute('BEGIN')
+    conn.execute('ALTER TABLE products RENAME TO products_unsorted')
+    for statement in MIRROR_SCHEMA.split(';'):
+        if statement.strip():
+            conn.execute(statement)
+    conn.execute(f'INSERT INTO products ({columns}) SELECT {columns} FROM products_unsorted ORDER BY popularity DESC, id')
+    conn.execute('DROP TABLE products_unsorted')
+    conn.execute('COMMIT')
+
+
+def import_off(dump_path, db_path=OFF_MIRROR_PATH, force=False):
+    """
+    Imports an Open Food Facts export (the JSONL or the CSV one, gzipped or
+    not) into the local mirror that off_mirror.py searches. Products are
+    upserted by barcode, so a newer export can be imported over an older
+    one; an export unchanged since the last import is skipped unless force
+    is set. As in import_fdc.py, the search indexes are dropped for the load
+    and rebuilt once at the end, after the products are renumbered in
+    popularity order. Returns the number of products imported.
+    """
+    ensure_schema(db_path)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    file_name = os.path.basename(dump_path)
+    stat = os.stat(dump_path)
+    if not force and _is_unchanged(conn, file_name, stat):
+        conn.close()
+        logger.info("Skipping %s: unchanged since the last import", file_name)
+        return 0
+
+    started = time.perf_counter()
+    rows = 0
+    try:
+        conn.execute('PRAGMA journal_mode=MEMORY')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute('PRAGMA cache_size=-262144')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        for name in SEARCH_INDEX_NAMES:
+            conn.execute(f'DROP INDEX IF EXISTS {name}')
+        for name in SEARCH_TRIGGER_NAMES:
+            conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+        rows = _load_products(conn, read_dump(dump_path))
+        _renumber_by_popularity(conn)
+        elapsed = time.perf_counter() - started
+        conn.execute('INSERT OR REPLACE INTO import_log (file_name, size, mtime, rows, imported_at) '
+                     'VALUES (?, ?, ?, ?, ?)', (file_name, stat.st_size, stat.st_mtime, rows, time.time()))
+        logger.info("Imported %d products from %s in %.1fs (%.0f rows/sec)",
+                    rows, file_name, elapsed, rows / max(elapsed, 1e-9))
+    finally:
+        # Indexes and triggers come back even if the load failed part way
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        index_started = time.perf_counter()
+        conn.executescript(SEARCH_SCHEMA)
+        conn.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.close()
+        logger.info("Rebuilt indexes in %.1fs", time.perf_counter() - index_started)
+    return rows
+
+
+if __name__ == '__main__':
+    import argparse
+    from observability import configure_logging
+    parser = argparse.ArgumentParser(description='Import an Open Food Facts export into the local product mirror.')
+    parser.add_argument('dump_path', help='openfoodfacts-products.jsonl.gz or en.openfoodfacts.org.products.csv.gz')
+    parser.add_argument('db_path', nargs='?', default=OFF_MIRROR_PATH)
+    parser.add_argument('--force', action='store_true', help='re-import the export even if it is unchanged')
+    args = parser.parse_args()
+    configure_logging()
+    import_off(args.dump_path, args.db_path, args.force)
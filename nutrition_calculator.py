@@ -1,94 +1,180 @@
+import re
+import numpy as np
+from observability import span
 from utils import convert_to_grams
 
-def calculate_nutrition(selected_products):
+# The nutrients totalled for a recipe, in the order they are reported
+NUTRIENTS_WANTED = [
+    'Energy',
+    'Fat',
+    'Saturated Fat',
+    'Carbohydrates',
+    'Sugars',
+    'Fiber',
+    'Proteins',
+    'Salt',
+    'Sodium'
+]
+NUTRIENT_COLUMNS = {name: column for column, name in enumerate(NUTRIENTS_WANTED)}
+
+SERVING_SIZE_PATTERN = re.compile(r'([\d\.]+)\s*([a-zA-Z]+)')
+
+
+class ProductMatrix:
     """
-    Calculates the total nutrition of the recipe based on selected products.
+    Products as rows of dense products x nutrients matrices: amounts given
+    per 100g (scaled by the quantity used) and amounts given per serving
+    (added as they are). Identical products share a row.
     """
-    # Initialize total nutrients
-    total_nutrients = {}
-
-    # Define the nutrients you want to calculate
-    nutrients_wanted = [
-        'Energy',
-        'Fat',
-        'Saturated Fat',
-        'Carbohydrates',
-        'Sugars',
-        'Fiber',
-        'Proteins',
-        'Salt',
-        'Sodium'
-    ]
-
-    for ingredient_name, product_data in selected_products.items():
-        print(f"Processing ingredient: {ingredient_name}")  # Debugging statement
-        print(f"Product data: {product_data}")  # Debugging statement
-
-        # Get the quantity and unit for the ingredient
-        quantity = product_data.get('quantity', None)  # User-specified quantity
-        unit = product_data.get('unit', None)          # User-specified unit
-
-        # If user hasn't specified quantity, use serving size or default to 100g
-        if quantity is None or unit is None:
-            serving_size = product_data.get('serving_size', '100g')
-            # Parse serving size into quantity and unit
-            quantity, unit = parse_serving_size(serving_size)
-            if quantity is None or unit is None:
-                print(f"Could not determine serving size for '{ingredient_name}'. Skipping.")
-                continue
 
-        # Convert quantity to grams
-        quantity_in_grams = convert_to_grams(quantity, unit)
-        if quantity_in_grams is None:
-            print(f"Could not convert quantity for '{ingredient_name}'. Skipping.")
-            continue
+    def __init__(self):
+        self._rows = {}
+        self._per_100g = []
+        self._per_serving = []
+        self._units = []
 
-        # Get the nutrient data
-        nutrients = product_data.get('nutrients', [])
+    def __len__(self):
+        return len(self._rows)
 
-        # Calculate nutrient values based on available data
+    def add(self, nutrients):
+        """
+        Returns the row of a product given its nutrient list, adding it if it is new.
+        """
+        values = []
         for nutrient_info in nutrients:
-            nutrient_name = nutrient_info['name']
-            if nutrient_name in nutrients_wanted:
-                amount = nutrient_info['amount']
-                unit_nutrient = nutrient_info['unit']
-                per_100g_available = nutrient_info.get('per_100g_available', False)
-
-                if per_100g_available:
-                    # Calculate nutrient amount based on quantity in grams
-                    total_amount = (amount * quantity_in_grams) / 100
-                else:
-                    # Nutrient amount is per serving, scale according to user's quantity
-                    # Assuming user's quantity matches the serving size
-                    total_amount = amount * (quantity_in_grams / quantity_in_grams)  # Simplifies to amount
+            column = NUTRIENT_COLUMNS.get(nutrient_info.get('name'))
+            if column is None:
+                continue
+            try:
+                amount = float(nutrient_info['amount'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            values.append((column, amount, nutrient_info.get('unit'), bool(nutrient_info.get('per_100g_available'))))
+        key = tuple(values)
 
-                # Add to total nutrients
-                if nutrient_name in total_nutrients:
-                    total_nutrients[nutrient_name]['amount'] += total_amount
+        row = self._rows.get(key)
+        if row is None:
+            row = self._rows[key] = len(self._rows)
+            per_100g = np.zeros(len(NUTRIENTS_WANTED))
+            per_serving = np.zeros(len(NUTRIENTS_WANTED))
+            units = [None] * len(NUTRIENTS_WANTED)
+            for column, amount, unit, is_per_100g in values:
+                if is_per_100g:
+                    per_100g[column] += amount
                 else:
-                    total_nutrients[nutrient_name] = {
-                        'amount': total_amount,
-                        'unit': unit_nutrient
-                    }
-                print(f"Nutrient: {nutrient_name}, Total Amount: {total_amount}, Unit: {unit_nutrient}")  # Debugging statement
+                    per_serving[column] += amount
+                if units[column] is None:
+                    units[column] = unit
+            self._per_100g.append(per_100g)
+            self._per_serving.append(per_serving)
+            self._units.append(units)
+        return row
+
+    def arrays(self):
+        """
+        Returns (per_100g, per_serving, present, units), each products x nutrients.
+        """
+        shape = (len(self), len(NUTRIENTS_WANTED))
+        per_100g = np.array(self._per_100g).reshape(shape)
+        per_serving = np.array(self._per_serving).reshape(shape)
+        units = np.array(self._units, dtype=object).reshape(shape)
+        present = np.not_equal(units, None)
+        return per_100g, per_serving, present, units
+
+
+def product_grams(product_data, conversions):
+    """
+    Returns how many grams of a product the recipe uses: the user's quantity
+    and unit, else the product's serving size, else 100g. None if it cannot
+    be converted. Products from the local food database carry their food_id,
+    so household units can use its portion weights. conversions memoizes
+    convert_to_grams within a batch.
+    """
+    quantity = product_data.get('quantity', None)  # User-specified quantity
+    unit = product_data.get('unit', None)          # User-specified unit
+    if quantity is None or unit is None:
+        quantity, unit = parse_serving_size(product_data.get('serving_size', '100g'))
+        if quantity is None or unit is None:
+            return None
+
+    key = (str(quantity), unit, product_data.get('food_id'))
+    if key not in conversions:
+        with span('unit_conversion'):
+            conversions[key] = convert_to_grams(quantity, unit, food_id=product_data.get('food_id'))
+    return conversions[key]
+
 
-            print("Total Nutrients:", total_nutrients)  # Debugging statement
-            
-    # Return the total nutrients dictionary
-    return total_nutrients
+def calculate_nutrition_batch(recipes):
+    """
+    Calculates the total nutrition of many recipes at once. Each recipe is
+    a mapping of ingredient name to selected product data. The products of
+    every recipe become one products x nutrients matrix and the quantities a
+    recipes x products matrix, so all the totals come from one matrix
+    multiply. Returns one {nutrient: {'amount', 'unit'}} dict per recipe.
+    """
+    with span('nutrition.batch'):
+        return _calculate_nutrition_batch(recipes)
+
+
+def _calculate_nutrition_batch(recipes):
+    products = ProductMatrix()
+    conversions = {}
+    recipe_index, product_index, grams = [], [], []
+    for i, selected_products in enumerate(recipes):
+        for product_data in selected_products.values():
+            if not isinstance(product_data, dict):
+                continue
+            quantity_in_grams = product_grams(product_data, conversions)
+            if quantity_in_grams is None:
+                continue
+            recipe_index.append(i)
+            product_index.append(products.add(product_data.get('nutrients', [])))
+            grams.append(quantity_in_grams)
+
+    per_100g, per_serving, present, units = products.arrays()
+    recipe_index = np.array(recipe_index, dtype=np.intp)
+    product_index = np.array(product_index, dtype=np.intp)
+
+    quantities = np.zeros((len(recipes), len(products)))
+    uses = np.zeros((len(recipes), len(products)))
+    np.add.at(quantities, (recipe_index, product_index), np.array(grams, dtype=float) / 100)
+    np.add.at(uses, (recipe_index, product_index), 1)
+
+    totals = quantities @ per_100g + uses @ per_serving
+    found = (uses @ present) > 0
+
+    # Each total takes its unit from the first product in the recipe that has the nutrient
+    recipe_units = np.full((len(recipes), len(NUTRIENTS_WANTED)), None, dtype=object)
+    for column in range(len(NUTRIENTS_WANTED)):
+        uses_with_nutrient = np.flatnonzero(present[product_index, column])
+        first_recipes, first = np.unique(recipe_index[uses_with_nutrient], return_index=True)
+        recipe_units[first_recipes, column] = units[product_index[uses_with_nutrient[first]], column]
+
+    results = []
+    for i in range(len(recipes)):
+        results.append({
+            NUTRIENTS_WANTED[column]: {'amount': float(totals[i, column]), 'unit': recipe_units[i, column]}
+            for column in np.flatnonzero(found[i])
+        })
+    return results
+
+
+def calculate_nutrition(selected_products):
+    """
+    Calculates the total nutrition of the recipe based on selected products.
+    """
+    return calculate_nutrition_batch([selected_products])[0]
 
 def parse_serving_size(serving_size_str):
     """
     Parses the serving size string into quantity and unit.
     """
-    import re
     # Example serving_size_str: "30g", "1 cup (240ml)", "2 pieces (50g)"
-    match = re.match(r'([\d\.]+)\s*([a-zA-Z]+)', serving_size_str)
+    match = SERVING_SIZE_PATTERN.match(str(serving_size_str))
     if match:
         quantity = float(match.group(1))
         unit = match.group(2)
         return quantity, unit
     else:
         # Handle complex serving sizes if necessary
-        print(f"Could not parse serving size: {serving_size_str}")
         return None, None
@@ -0,0 +1,273 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')  # text or json
+# Requests slower than this are logged as warnings; the others only at DEBUG
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 1.0))
+
+# Latency buckets in seconds, from cached lookups to cold loads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+logger = logging.getLogger(__name__)
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formats records with the fields passed through extra=, either as one
+    JSON object per line or as key=value pairs after the message.
+    """
+
+    def __init__(self, json_output=False):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+        self.json_output = json_output
+
+    def format(self, record):
+        fields = {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+        if self.json_output:
+            entry = {
+                'time': self.formatTime(record),
+                'level': record.levelname,
+                'logger': record.name,
+                'message': record.getMessage(),
+                **fields,
+            }
+            if record.exc_info:
+                entry['exception'] = self.formatException(record.exc_info)
+            return json.dumps(entry, default=str)
+        line = super().format(record)
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        return line
+
+
+def configure_logging(level=LOG_LEVEL, log_format=LOG_FORMAT):
+    """
+    Sends log records to stderr at the given level, unless logging was
+    already configured (e.g. by gunicorn or the embedding application).
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(StructuredFormatter(json_output=log_format == 'json'))
+    logging.basicConfig(level=level, handlers=[handler])
+
+
+def _label_text(labelnames, labelvalues, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _number(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class Counter:
+    """
+    A monotonically increasing count per combination of label values.
+    """
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labelvalues, value in values:
+            yield f'{self.name}{_label_text(self.labelnames, labelvalues)} {_number(value)}'
+
+
+class Histogram:
+    """
+    Counts observations into cumulative buckets per combination of label
+    values, with their sum and count, as Prometheus histograms do.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 2)
+            series[bucket] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            series = [(labelvalues, list(values)) for labelvalues, values in self._series.items()]
+        for labelvalues, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values[:-1]):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f'{self.name}_bucket{_label_text(self.labelnames, labelvalues, le)} {cumulative}'
+            labels = _label_text(self.labelnames, labelvalues)
+            yield f'{self.name}_sum{labels} {_number(values[-1])}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Time to handle a request, until the response headers.',
+    ('method', 'route', 'status'),
+)
+SPAN_DURATION = Histogram('span_duration_seconds', 'Time spent in named spans of the hot paths.', ('span',))
+SPAN_ERRORS = Counter('span_errors_total', 'Spans that ended with an exception.', ('span',))
+
+_metrics = [REQUEST_DURATION, SPAN_DURATION, SPAN_ERRORS]
+_caches = {}
+
+
+def register_cache(name, stats):
+    """
+    Reports a cache's hits and misses at /metrics. stats() returns
+    (hits, misses) or None if the cache does not exist yet.
+    """
+    _caches[name] = stats
+
+
+def register_lru_cache(name, function):
+    register_cache(name, lambda: function.cache_info()[:2])
+
+
+@contextmanager
+def span(name):
+    """
+    Times the enclosed block into span_duration_seconds{span=name}.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        SPAN_ERRORS.inc(name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        SPAN_DURATION.observe(elapsed, name)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('span %s took %.2f ms', name, elapsed * 1000, extra={'span': name, 'seconds': elapsed})
+
+
+def timed(name):
+    """
+    Decorator form of span().
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render_metrics():
+    """
+    Returns every metric of this process in the Prometheus text format.
+    Under gunicorn each worker keeps its own metrics, so a scrape reports
+    the worker that answered it.
+    """
+    lines = []
+    for metric in _metrics:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        lines.extend(metric.samples())
+
+    cache_stats = []
+    for name, stats in list(_caches.items()):
+        try:
+            counts = stats()
+        except Exception:
+            logger.exception('Reading the stats of cache %s failed', name)
+            continue
+        if counts is not None:
+            cache_stats.append((name, *counts))
+    for metric, kind, documentation, value in (
+        ('cache_hits_total', 'counter', 'Cache lookups answered from the cache.', lambda h, m: h),
+        ('cache_misses_total', 'counter', 'Cache lookups that had to compute or fetch the value.', lambda h, m: m),
+        ('cache_hit_ratio', 'gauge', 'Hits over lookups since the process started.',
+         lambda h, m: h / (h + m) if h + m else 0.0),
+    ):
+        lines.append(f'# HELP {metric} {documentation}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for name, hits, misses in cache_stats:
+            lines.append(f'{metric}{_label_text(("cache",), (name,))} {_number(value(hits, misses))}')
+    return '\n'.join(lines) + '\n'
+
+
+def observe_request(method, path, route, status, elapsed):
+    """
+    Records a handled request in http_request_duration_seconds and logs it,
+    as a warning if it took SLOW_REQUEST_SECONDS or longer.
+    """
+    REQUEST_DURATION.observe(elapsed, method, route, status)
+    level = logging.WARNING if elapsed >= SLOW_REQUEST_SECONDS else logging.DEBUG
+    if logger.isEnabledFor(level):
+        logger.log(level, '%s %s %s in %.1f ms', method, path, status, elapsed * 1000,
+                   extra={'route': route, 'status': status, 'seconds': elapsed})
+
+
+def instrument_app(app):
+    """
+    Times every request of a Flask app into http_request_duration_seconds,
+    labelled by route pattern rather than URL so the label set stays small,
+    and every render_template call into the template span.
+    """
+    from flask import before_render_template, g, request, template_rendered
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_duration(response):
+        started = g.pop('request_started', None)
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        observe_request(request.method, request.path, route, response.status_code, time.perf_counter() - started)
+        return response
+
+    def start_template_timer(sender, template, context, **extra):
+        g.setdefault('template_started', []).append(time.perf_counter())
+
+    def record_template_duration(sender, template, context, **extra):
+        started = g.get('template_started')
+        if started:
+            SPAN_DURATION.observe(time.perf_counter() - started.pop(), f'template.{template.name}')
+
+    before_render_template.connect(start_template_timer, app, weak=False)
+    template_rendered.connect(record_template_duration, app, weak=False)
+    return app
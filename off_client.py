@@ -0,0 +1,265 @@
+import asyncio
+import os
+import threading
+import weakref
+from observability import span
+
+OFF_BASE_URL = os.environ.get('OFF_BASE_URL', 'https://world.openfoodfacts.org')
+OFF_CONNECT_TIMEOUT = float(os.environ.get('OFF_CONNECT_TIMEOUT', 3.05))
+OFF_READ_TIMEOUT = float(os.environ.get('OFF_READ_TIMEOUT', 10))
+OFF_MAX_RETRIES = int(os.environ.get('OFF_MAX_RETRIES', 2))
+OFF_BACKOFF_FACTOR = float(os.environ.get('OFF_BACKOFF_FACTOR', 0.5))
+OFF_POOL_SIZE = int(os.environ.get('OFF_POOL_SIZE', 20))
+OFF_USER_AGENT = os.environ.get('OFF_USER_AGENT', 'RecipeFinder/1.0')
+# Connections the async client opens at most; further lookups wait for a free one
+OFF_ASYNC_MAX_CONNECTIONS = int(os.environ.get('OFF_ASYNC_MAX_CONNECTIONS', 100))
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the
+    function, the others wait for it and share its result (or its exception).
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines on one event loop: concurrent callers with
+    the same key await a single task running fn().
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.coalesced += 1
+        # A caller that is cancelled does not cancel the call the others wait for
+        return await asyncio.shield(task)
+
+
+def request_error():
+    """
+    The base class of the errors a client call raises. requests is only
+    imported with the first client, so this is looked up when needed.
+    """
+    import requests
+    return requests.exceptions.RequestException
+
+
+class OpenFoodFactsClient:
+    """
+    Shared client for the Open Food Facts API. It reuses pooled keep-alive
+    connections, applies connect/read timeouts, retries failed GETs with
+    exponential backoff, and makes one upstream call for identical
+    concurrent requests.
+    """
+
+    def __init__(self, base_url=OFF_BASE_URL, connect_timeout=OFF_CONNECT_TIMEOUT, read_timeout=OFF_READ_TIMEOUT,
+                 max_retries=OFF_MAX_RETRIES, backoff_factor=OFF_BACKOFF_FACTOR, pool_size=OFF_POOL_SIZE,
+                 user_agent=OFF_USER_AGENT):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(['GET']),
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['User-Agent'] = user_agent
+        self._single_flight = SingleFlight()
+
+    @property
+    def search_url(self):
+        return f'{self.base_url}/cgi/search.pl'
+
+    def get_json(self, url, params=None):
+        """
+        GETs url and returns the decoded JSON body. Raises
+        requests.exceptions.RequestException on network/HTTP errors and
+        ValueError on an invalid body.
+        """
+        key = (url, tuple(sorted((params or {}).items())))
+
+        def fetch():
+            with span('off.http'):
+                response = self.session.get(url, params=params, timeout=self.timeout)
+                response.raise_for_status()  # Raise an error for bad status codes
+                return response.json()
+
+        return self._single_flight.do(key, fetch)
+
+    def search(self, params):
+        return self.get_json(self.search_url, params)
+
+    def close(self):
+        self.session.close()
+
+
+def async_request_error():
+    """
+    The errors an async client call raises, as a tuple for except clauses.
+    """
+    import aiohttp
+    return aiohttp.ClientError, asyncio.TimeoutError
+
+
+class AsyncOpenFoodFactsClient:
+    """
+    Asynchronous counterpart of OpenFoodFactsClient for the ASGI app (see
+    asgi.py), on aiohttp: a waiting lookup holds no thread, so one process
+    can keep hundreds of them in flight. It applies the same timeouts,
+    retries and request coalescing, and opens at most max_connections
+    connections. Create it on the event loop it will be used from.
+    """
+
+    def __init__(self, base_url=OFF_BASE_URL, connect_timeout=OFF_CONNECT_TIMEOUT, read_timeout=OFF_READ_TIMEOUT,
+                 max_retries=OFF_MAX_RETRIES, backoff_factor=OFF_BACKOFF_FACTOR,
+                 max_connections=OFF_ASYNC_MAX_CONNECTIONS, user_agent=OFF_USER_AGENT):
+        import aiohttp
+
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        # Waiting for a free connection is bounded by the read timeout too
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=max_connections),
+            timeout=aiohttp.ClientTimeout(connect=read_timeout, sock_connect=connect_timeout, sock_read=read_timeout),
+            headers={'User-Agent': user_agent},
+        )
+        self._single_flight = AsyncSingleFlight()
+
+    @property
+    def search_url(self):
+        return f'{self.base_url}/cgi/search.pl'
+
+    async def get_json(self, url, params=None):
+        """
+        GETs url and returns the decoded JSON body. Raises one of
+        async_request_error() on network/HTTP errors and ValueError on an
+        invalid body.
+        """
+        key = (url, tuple(sorted((params or {}).items())))
+
+        async def fetch():
+            with span('off.http'):
+                return await self._get_json(url, params)
+
+        return await self._single_flight.do(key, fetch)
+
+    async def _get_json(self, url, params):
+        # Retries connection errors, timeouts and retryable statuses with exponential backoff, like urllib3's Retry
+        import aiohttp
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                async with self.session.get(url, params=params) as response:
+                    if response.status not in RETRY_STATUSES or last_attempt:
+                        response.raise_for_status()  # Raise an error for bad status codes
+                        return await response.json(content_type=None)
+                    retry_after = response.headers.get('Retry-After', '')
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if last_attempt:
+                    raise
+                retry_after = ''
+            await asyncio.sleep(float(retry_after) if retry_after.isdigit() else self._backoff(attempt))
+
+    def _backoff(self, attempt):
+        return self.backoff_factor * 2 ** attempt if attempt else 0.0
+
+    async def search(self, params):
+        return await self.get_json(self.search_url, params)
+
+    async def close(self):
+        await self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+# aiohttp sessions belong to the event loop that opened them, so there is one async client per loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_off_client():
+    """
+    Returns the shared Open Food Facts client, configured from the OFF_* environment variables.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenFoodFactsClient()
+    return _client
+
+
+def get_async_off_client():
+    """
+    Returns the async Open Food Facts client of the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncOpenFoodFactsClient()
+    return client
+
+
+async def close_async_off_client():
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
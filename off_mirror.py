@@ -0,0 +1,172 @@
+import json
+import os
+import sqlite3
+import threading
+from food_database import build_match_query
+from observability import span
+
+OFF_MIRROR_PATH = os.environ.get('OFF_MIRROR_PATH', os.path.join(os.path.dirname(__file__), 'off_mirror.db'))
+# auto: answer from the mirror when it has matches, else ask the API; only: never call the API; off: API only
+OFF_MIRROR = os.environ.get('OFF_MIRROR', 'auto')
+# Matches ranked per search: the most scanned ones, which are then ordered by relevance
+OFF_MIRROR_CANDIDATES = int(os.environ.get('OFF_MIRROR_CANDIDATES', 200))
+
+# One row per product, with only the fields the app reads. Allergen tags are
+# kept comma separated and the nutriments as the JSON object of the API. IDs
+# follow popularity, most scanned first (import_off.py renumbers the products
+# after every import), so the full-text index lists matches in that order.
+MIRROR_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY,
+        code TEXT NOT NULL UNIQUE,
+        product_name TEXT,
+        brands TEXT,
+        image_url TEXT,
+        ingredients_text TEXT,
+        nutriscore_grade TEXT,
+        ecoscore_grade TEXT,
+        allergens TEXT,
+        serving_size TEXT,
+        nutriments TEXT,
+        popularity INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS import_log (
+        file_name TEXT PRIMARY KEY,
+        size INTEGER,
+        mtime REAL,
+        rows INTEGER,
+        imported_at REAL
+    );
+'''
+
+# Grade indexes and the full-text index over product names and brands, kept in
+# sync with products by triggers; import_off.py drops these while loading.
+SEARCH_SCHEMA = '''
+    CREATE INDEX IF NOT EXISTS idx_products_nutriscore ON products(nutriscore_grade);
+    CREATE INDEX IF NOT EXISTS idx_products_ecoscore ON products(ecoscore_grade);
+
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        product_name, brands, content='products', content_rowid='id', tokenize='porter unicode61'
+    );
+
+    CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, product_name, brands) VALUES (new.id, new.product_name, new.brands);
+    END;
+    CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, product_name, brands)
+        VALUES ('delete', old.id, old.product_name, old.brands);
+    END;
+    CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, product_name, brands)
+        VALUES ('delete', old.id, old.product_name, old.brands);
+        INSERT INTO products_fts(rowid, product_name, brands) VALUES (new.id, new.product_name, new.brands);
+    END;
+'''
+
+SEARCH_INDEX_NAMES = ('idx_products_nutriscore', 'idx_products_ecoscore')
+SEARCH_TRIGGER_NAMES = ('products_fts_insert', 'products_fts_delete', 'products_fts_update')
+
+PRODUCT_COLUMNS = ('code', 'product_name', 'brands', 'image_url', 'ingredients_text', 'nutriscore_grade',
+                   'ecoscore_grade', 'allergens', 'serving_size', 'nutriments', 'popularity')
+
+# A match in the product name counts this many times more than one in the brands
+NAME_WEIGHT = 10.0
+
+_local = threading.local()
+
+
+def ensure_schema(path=OFF_MIRROR_PATH):
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(MIRROR_SCHEMA)
+        conn.executescript(SEARCH_SCHEMA)
+    finally:
+        conn.close()
+
+
+def get_read_connection(path=OFF_MIRROR_PATH):
+    """
+    Returns this thread's read-only connection to the mirror, or None if it
+    has not been imported. As with the food database, connections are kept
+    per thread and never reused across a fork.
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None or _local.pid != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+    conn = connections.get(path)
+    if conn is None:
+        if not os.path.exists(path):
+            return None
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+        conn.execute('PRAGMA query_only=ON')
+        conn.execute('PRAGMA mmap_size=268435456')
+        conn.execute('PRAGMA cache_size=-16000')
+        connections[path] = conn
+    return conn
+
+
+def _product(row):
+    # A products row as the API returns the product
+    product = dict(zip(PRODUCT_COLUMNS, row))
+    allergens = product.pop('allergens')
+    product['allergens_hierarchy'] = allergens.split(',') if allergens else []
+    product['nutriments'] = json.loads(product['nutriments']) if product['nutriments'] else {}
+    del product['popularity']
+    return product
+
+
+def search_products(search_terms, page_size=24, nutriscore_grades=None, ecoscore_grades=None,
+                    candidates=OFF_MIRROR_CANDIDATES, path=OFF_MIRROR_PATH):
+    """
+    Returns up to page_size products whose name or brands match
+    search_terms, in the shape of the API's search results: of the
+    candidates most scanned matches, the best matches first. The grade
+    arguments, if given, keep only products with one of those grades.
+    Returns None if there is no mirror.
+    """
+    conn = get_read_connection(path)
+    if conn is None:
+        return None
+    match_query = build_match_query(search_terms or '')
+    if match_query is None:
+        return []
+    filters, params = '', [match_query]
+    for column, grades in (('nutriscore_grade', nutriscore_grades), ('ecoscore_grade', ecoscore_grades)):
+        if grades:
+            filters += f" AND p.{column} IN ({', '.join('?' * len(grades))})"
+            params.extend(grade.lower() for grade in grades)
+    # Scanning the index in ID order stops after the candidates, so common
+    # terms cost no more than rare ones; bm25 is only computed for those
+    with span('sqlite.off_mirror_search'):
+        rows = conn.execute(f'''
+            WITH matched AS (
+                SELECT f.rowid AS id, bm25(products_fts, {NAME_WEIGHT}, 1.0) AS score
+                FROM products_fts f
+                JOIN products p ON p.id = f.rowid
+                WHERE products_fts MATCH ? {filters}
+                ORDER BY f.rowid
+                LIMIT ?
+            )
+            SELECT {', '.join(f'p.{column}' for column in PRODUCT_COLUMNS)}
+            FROM matched m
+            JOIN products p ON p.id = m.id
+            ORDER BY m.score, m.id
+            LIMIT ?
+        ''', (*params, candidates, page_size)).fetchall()
+    return [_product(row) for row in rows]
+
+
+def mirror_search(params, mode=OFF_MIRROR):
+    """
+    Answers an API search (the /cgi/search.pl parameters) from the mirror,
+    as the API's JSON. Returns None when the API should be asked instead:
+    the mirror is off, missing, or (in auto mode) has no match.
+    """
+    if mode == 'off':
+        return None
+    products = search_products(params.get('search_terms'), int(params.get('page_size') or 24))
+    if not products and mode != 'only':
+        return None
+    return {'count': len(products or []), 'page': 1, 'products': products or []}
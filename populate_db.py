@@ -1,90 +1,52 @@
 import sqlite3
 import json
+from food_database import FOOD_DATABASE_PATH, ensure_schema, search_foods
 
-# Step 1: Create the SQLite database and table
-def create_database():
-    conn = sqlite3.connect('food_database.db')
-    cursor = conn.cursor()
-    
-    # Create a table to store food information
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS foods (
-            id INTEGER PRIMARY KEY,
-            description TEXT
-        )
-    ''')
-    
-    # Create a table to store nutrient information
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS nutrients (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            food_id INTEGER,
-            nutrient_name TEXT,
-            amount REAL,
-            unit TEXT,
-            FOREIGN KEY(food_id) REFERENCES foods(id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+# Step 1: Create the SQLite database and tables (foods, the nutrient dimension and food_nutrient)
+def create_database(db_path=FOOD_DATABASE_PATH):
+    ensure_schema(db_path)
 
 # Step 2: Populate the database from JSON file
-def populate_database(json_file_path):
-    conn = sqlite3.connect('food_database.db')
+# For the CSV releases (including SR Legacy and Branded) use import_fdc.py, which streams instead
+def populate_database(json_file_path, db_path=FOOD_DATABASE_PATH):
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
     
     with open(json_file_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
     
     for food in data['FoundationFoods']:
-        # Insert food description into the foods table
-        cursor.execute('INSERT INTO foods (description) VALUES (?)', (food['description'],))
-        food_id = cursor.lastrowid
+        # Foods keep their FDC ID, so this and the CSV importer never duplicate a food
+        food_id = food['fdcId']
+        cursor.execute('''
+            INSERT INTO foods (id, description, data_type) VALUES (?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET description = excluded.description, data_type = excluded.data_type
+        ''', (food_id, food['description'], 'foundation_food'))
         
-        # Insert nutrient information into the nutrients table
-        for nutrient in food['foodNutrients']:
-            nutrient_name = nutrient['nutrient']['name']
-            amount = nutrient.get('amount', 0)
-            unit = nutrient['nutrient']['unitName']
-            cursor.execute('''
-                INSERT INTO nutrients (food_id, nutrient_name, amount, unit)
-                VALUES (?, ?, ?, ?)
-            ''', (food_id, nutrient_name, amount, unit))
+        # Insert nutrient information into the nutrient and food_nutrient tables
+        food_nutrients = food['foodNutrients']
+        cursor.executemany('''
+            INSERT OR IGNORE INTO nutrient (id, name, unit_name, nutrient_nbr, rank)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(n['nutrient']['id'], n['nutrient']['name'], n['nutrient']['unitName'],
+               n['nutrient'].get('number'), n['nutrient'].get('rank')) for n in food_nutrients])
+        cursor.executemany('''
+            INSERT OR REPLACE INTO food_nutrient (id, food_id, nutrient_id, amount)
+            VALUES (?, ?, ?, ?)
+        ''', [(n.get('id'), food_id, n['nutrient']['id'], n.get('amount', 0)) for n in food_nutrients])
     
     conn.commit()
     conn.close()
 
 # Step 3: Query the database for a specific ingredient
 def fetch_nutritional_info(search_term, limit=5):
-    conn = sqlite3.connect('food_database.db')
-    cursor = conn.cursor()
-    
-    # Search for foods matching the search term
-    cursor.execute('''
-        SELECT id, description FROM foods
-        WHERE description LIKE ?
-        LIMIT ?
-    ''', (f'%{search_term}%', limit))
-    
-    foods = cursor.fetchall()
-    
+    # Full-text search with the nutrients joined in, instead of one query per food
     results = []
-    for food_id, description in foods:
-        # Get nutrient information for each food
-        cursor.execute('''
-            SELECT nutrient_name, amount, unit
-            FROM nutrients
-            WHERE food_id = ?
-        ''', (food_id,))
-        nutrients = cursor.fetchall()
-        
+    for food_id, description, nutrients in search_foods(search_term, limit):
         results.append({
             'name': description,
             'nutrients': [{'name': n[0], 'amount': n[1], 'unit': n[2]} for n in nutrients]
         })
-    
-    conn.close()
     return results
 
 # Step 4: Main script
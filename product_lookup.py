@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from api_requests import fetch_ingredient_data, fetch_ingredient_data_async
+from fetch_from_localdb import fetch_from_localdb
+
+PRODUCT_LOOKUP_WORKERS = int(os.environ.get('PRODUCT_LOOKUP_WORKERS', 8))
+PRODUCT_LOOKUP_DEADLINE = float(os.environ.get('PRODUCT_LOOKUP_DEADLINE', 5.0))
+PRODUCT_WARM_WORKERS = int(os.environ.get('PRODUCT_WARM_WORKERS', 2))
+PRODUCT_WARM_QUEUE_SIZE = int(os.environ.get('PRODUCT_WARM_QUEUE_SIZE', 100))
+PRODUCT_CACHE_WARMING = os.environ.get('PRODUCT_CACHE_WARMING', '1') == '1'
+
+# Batch lookups and background cache warming get separate pools, so warming
+# can never starve a user's request for threads.
+_lookup_executor = ThreadPoolExecutor(max_workers=PRODUCT_LOOKUP_WORKERS, thread_name_prefix='product-lookup')
+_warm_executor = ThreadPoolExecutor(max_workers=PRODUCT_WARM_WORKERS, thread_name_prefix='product-warm')
+_warm_slots = threading.BoundedSemaphore(PRODUCT_WARM_QUEUE_SIZE)
+
+logger = logging.getLogger(__name__)
+
+# Async lookups still running after their batch's deadline; the event loop only keeps weak references to tasks
+_background_lookups = set()
+
+
+def fetch_products(ingredient, source='openfoodfacts', limit=6):
+    """
+    Returns candidate products for one ingredient from the given source, or
+    none for a missing or blank ingredient.
+    """
+    if not ingredient or not ingredient.strip():
+        return []
+    if source == 'openfoodfacts':
+        return fetch_ingredient_data(ingredient, limit=limit)
+    elif source == 'localdb':
+        return fetch_from_localdb(ingredient, limit=limit)
+    return []
+
+
+def fetch_products_batch(ingredients, source='openfoodfacts', limit=6, deadline=PRODUCT_LOOKUP_DEADLINE):
+    """
+    Looks up all ingredients concurrently on the bounded lookup pool.
+    Returns (products by ingredient, ingredients still pending when the
+    deadline passed). Pending lookups keep running and fill the response
+    cache, so asking again shortly afterwards usually completes.
+    """
+    ingredients = list(dict.fromkeys(i.strip() for i in ingredients if i and i.strip()))
+    futures = {_lookup_executor.submit(fetch_products, ingredient, source, limit): ingredient
+               for ingredient in ingredients}
+    done, not_done = wait(futures, timeout=deadline)
+
+    results = {}
+    for future in done:
+        try:
+            results[futures[future]] = future.result()
+        except Exception as e:
+            logger.warning("Product lookup failed for '%s': %s", futures[future], e)
+            results[futures[future]] = []
+    pending = [ingredient for ingredient in ingredients if ingredient not in results]
+    return results, pending
+
+
+async def fetch_products_async(ingredient, source='openfoodfacts', limit=6):
+    """
+    fetch_products for the ASGI app. Open Food Facts lookups wait on the
+    async client; local database lookups run on the lookup pool.
+    """
+    if not ingredient or not ingredient.strip():
+        return []
+    if source == 'openfoodfacts':
+        return await fetch_ingredient_data_async(ingredient, limit=limit)
+    elif source == 'localdb':
+        return await asyncio.get_running_loop().run_in_executor(_lookup_executor, fetch_from_localdb, ingredient, limit)
+    return []
+
+
+async def fetch_products_batch_async(ingredients, source='openfoodfacts', limit=6, deadline=PRODUCT_LOOKUP_DEADLINE):
+    """
+    fetch_products_batch for the ASGI app: all lookups run as tasks on the
+    event loop, with the same deadline and return value.
+    """
+    async def lookup(ingredient):
+        try:
+            return await fetch_products_async(ingredient, source, limit)
+        except Exception as e:
+            logger.warning("Product lookup failed for '%s': %s", ingredient, e)
+            return []
+
+    ingredients = list(dict.fromkeys(i.strip() for i in ingredients if i and i.strip()))
+    tasks = {ingredient: asyncio.ensure_future(lookup(ingredient)) for ingredient in ingredients}
+    if tasks:
+        await asyncio.wait(tasks.values(), timeout=deadline)
+
+    results = {ingredient: task.result() for ingredient, task in tasks.items() if task.done()}
+    pending = [ingredient for ingredient in ingredients if ingredient not in results]
+    for ingredient in pending:
+        task = tasks[ingredient]
+        _background_lookups.add(task)
+        task.add_done_callback(_background_lookups.discard)
+    return results, pending
+
+
+def warm_products(ingredients, source='openfoodfacts', limit=6):
+    """
+    Starts background lookups for ingredients without waiting for them, so
+    the response cache is already filled when the user asks for products.
+    Warming is best effort: once PRODUCT_WARM_QUEUE_SIZE lookups are queued,
+    further ones are dropped.
+    """
+    if not PRODUCT_CACHE_WARMING:
+        return
+    for ingredient in dict.fromkeys(i.strip() for i in ingredients if i and i.strip()):
+        if not _warm_slots.acquire(blocking=False):
+            return
+        future = _warm_executor.submit(fetch_products, ingredient, source, limit)
+        future.add_done_callback(lambda _: _warm_slots.release())
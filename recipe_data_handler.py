@@ -1,34 +1,39 @@
-import pandas as pd
-import os
-
-def fetch_filtered_recipes(recipe_name, allergens):
-    # Load recipe data from CSV file
-    csv_path = os.path.join(os.path.dirname(__file__), 'recipedata.csv')
-    try:
-        recipe_data = pd.read_csv(csv_path, nrows=300)  # Limiting to 300 rows for performance
-        print("Recipe data loaded successfully. Total recipes:", len(recipe_data))
-    except FileNotFoundError:
-        raise FileNotFoundError("The recipe data file could not be found.")
-    
-    # Debugging statement to verify data loaded
-    print(recipe_data.head())
-
-    # Filter recipes by name if provided
-    if recipe_name:
-        recipe_data = recipe_data[recipe_data['title'].str.contains(recipe_name, case=False, na=False)]
-        print("Recipes after filtering by name:", len(recipe_data))
+from recipe_store import RECIPE_FIELDS, get_recipe_store
+
+def search_recipes(recipe_name, allergens, limit=20, offset=0):
+    # The dataset and its title index are loaded once and shared by every request
+    recipe_store = get_recipe_store()
 
     # Remove any empty strings from the allergens list
-    allergens = [allergen for allergen in allergens if allergen.strip()]
-    print("Filtered allergens list:", allergens)
-
-    # Filter out recipes containing any of the selected allergens
-    if allergens:
-        for allergen in allergens:
-            recipe_data = recipe_data[~recipe_data['ingredients'].str.contains(allergen, case=False, na=False)]
-            print(f"Recipes after filtering allergen '{allergen}':", len(recipe_data))
-
-    # Convert filtered recipes to a list of dictionaries
-    recipes_list = recipe_data.to_dict(orient='records')
-    print("Number of recipes passed to the template:", len(recipes_list))
+    allergens = [allergen.strip() for allergen in allergens if allergen.strip()]
+
+    # Rank by title match and drop recipes containing any of the selected allergens
+    rows = recipe_store.search(recipe_name or '', allergens)
+
+    # Only build dictionaries for the requested page
+    recipes_list = recipe_store.take(rows[offset:offset + limit])
+    return recipes_list, len(rows)
+
+def search_recipe_page(recipe_name, allergens, cursor=None, limit=20):
+    # Keyset pagination: cursor is the next_cursor of the previous page, or None for the first
+    allergens = [allergen.strip() for allergen in allergens if allergen.strip()]
+    return get_recipe_store().search_page(recipe_name or '', allergens, cursor, limit)
+
+def iter_recipes(rows, fields=RECIPE_FIELDS):
+    # Builds the recipes one at a time, so a response can stream them as they come
+    recipe_store = get_recipe_store()
+    for row in rows:
+        yield recipe_store.take_one(row, fields)
+
+def fetch_filtered_recipes(recipe_name, allergens, limit=300, offset=0):
+    recipes_list, _ = search_recipes(recipe_name, allergens, limit=limit, offset=offset)
     return recipes_list
+
+def fetch_recipe(recipe_id, allergens):
+    # Look up a single recipe by ID, honouring the allergen filter
+    allergens = [allergen.strip() for allergen in allergens if allergen.strip()]
+    return get_recipe_store().get(recipe_id, allergens)
+
+def fetch_saved_recipes(recipe_ids):
+    # Look up the saved recipes by ID, in the order they were saved
+    return get_recipe_store().get_many(recipe_ids)
@@ -1,12 +1,174 @@
+import logging
 import re
 from dataclasses import dataclass
+from functools import lru_cache
+import numpy as np
+from observability import register_lru_cache
+from unit_conversion import MASS_UNITS, VOLUME_UNITS, normalize_unit
+
+logger = logging.getLogger(__name__)
+
+# Units that are counted rather than measured; FoodData Central portions give
+# the weight of one ('1 large egg', '1 clove garlic') for many foods
+COUNT_UNITS = (
+    'can', 'package', 'jar', 'bottle', 'box', 'bag', 'carton', 'container', 'envelope', 'packet',
+    'stick', 'slice', 'piece', 'clove', 'head', 'bunch', 'sprig', 'stalk', 'leaf', 'sheet',
+    'pinch', 'dash', 'drop', 'handful', 'large', 'medium', 'small',
+)
+COUNT_UNIT_ALIASES = {
+    'pkg': 'package', 'pkgs': 'package', 'pk': 'package', 'pkt': 'packet', 'env': 'envelope',
+    'lg': 'large', 'med': 'medium', 'sm': 'small', 'pc': 'piece', 'pcs': 'piece', 'leaves': 'leaf',
+}
+
+# Unit IDs used by parse_batch: UNITS[unit_id] is the canonical unit name
+UNITS = tuple(MASS_UNITS) + tuple(VOLUME_UNITS) + COUNT_UNITS
+UNIT_IDS = {unit: unit_id for unit_id, unit in enumerate(UNITS)}
+NO_UNIT = -1
+
+VULGAR_FRACTIONS = {
+    '½': 1 / 2, '⅓': 1 / 3, '⅔': 2 / 3, '¼': 1 / 4, '¾': 3 / 4, '⅕': 1 / 5, '⅖': 2 / 5, '⅗': 3 / 5,
+    '⅘': 4 / 5, '⅙': 1 / 6, '⅚': 5 / 6, '⅛': 1 / 8, '⅜': 3 / 8, '⅝': 5 / 8, '⅞': 7 / 8,
+}
+_FRACTION_CHARS = ''.join(VULGAR_FRACTIONS)
+
+# One amount: '1 1/2', '1-1/2', '1/2', '1½', '½', '1.5', '.5' or '2'
+_NUMBER = (rf'(?:\d+(?:\s+|-))?\d+\s*[/⁄]\s*\d+|\d+\s*[{_FRACTION_CHARS}]|\d*\.\d+|\d+|[{_FRACTION_CHARS}]')
+INGREDIENT_PATTERN = re.compile(
+    rf'\s*(?:(?P<quantity>{_NUMBER})(?:\s*(?:-|–|to|or)\s*(?P<quantity_max>{_NUMBER}))?)?'
+    r'\s*(?:\([^)]*\)\s*)?'  # Package sizes, as in '1 (10 oz.) can soup'
+    r'(?P<rest>.*)', re.DOTALL)
+UNIT_PATTERN = re.compile(r'([A-Za-z]+)\.?(?:\s+([A-Za-z]+)\.?)?(?=\s|$|,)\s*')
+NUMBER_PARTS_PATTERN = re.compile(rf'(\d+)?(?:\s+|-)?(?:(\d+)\s*[/⁄]\s*(\d+)|([{_FRACTION_CHARS}]))?$')
+
 
 @dataclass
 class ParsedIngredient:
     ingredient_text: str
     name: str
-    quantity: str = None
+    quantity: float = None
     unit: str = None
+    # Upper end of a range such as '2-3 cups'; quantity holds the lower end
+    quantity_max: float = None
+
+
+@lru_cache(maxsize=4096)
+def parse_number(text):
+    """
+    Returns the value of an amount written as '1 1/2', '1½', '¾', '1.5' or '2', or None.
+    """
+    text = text.strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    match = NUMBER_PARTS_PATTERN.match(text)
+    if match is None:
+        return None
+    whole, numerator, denominator, vulgar = match.groups()
+    value = float(whole) if whole else 0.0
+    if numerator is not None:
+        if int(denominator) == 0:
+            return None
+        if whole is None and match.group(0) != text:
+            return None
+        value += int(numerator) / int(denominator)
+    elif vulgar is not None:
+        value += VULGAR_FRACTIONS[vulgar]
+    elif whole is None:
+        return None
+    return value
+
+
+@lru_cache(maxsize=4096)
+def unit_id(word):
+    """
+    Returns the unit ID of a unit spelling ('Tbsp', 'c', 'cups', 'pkg') or NO_UNIT.
+    """
+    lowered = word.lower()
+    if lowered in COUNT_UNIT_ALIASES:
+        return UNIT_IDS[COUNT_UNIT_ALIASES[lowered]]
+    return UNIT_IDS.get(normalize_unit(word), NO_UNIT)
+
+
+@lru_cache(maxsize=65536)
+def _parse(text):
+    """
+    Returns (quantity, quantity_max, unit ID, name) of one ingredient line.
+    RecipeNLG repeats lines like '1 c. sugar' many times, hence the cache.
+    """
+    match = INGREDIENT_PATTERN.match(text)
+    quantity = parse_number(match.group('quantity')) if match.group('quantity') else None
+    quantity_max = parse_number(match.group('quantity_max')) if match.group('quantity_max') else None
+    rest = match.group('rest')
+    if quantity is None:
+        quantity_max = None
+        rest = text.strip()
+
+    unit = NO_UNIT
+    words = UNIT_PATTERN.match(rest)
+    if words is not None:
+        first, second = words.groups()
+        if second is not None and unit_id(f'{first} {second}') != NO_UNIT:
+            unit, name_start = unit_id(f'{first} {second}'), words.end()
+        else:
+            unit, name_start = unit_id(first), words.start(2) if second is not None else words.end()
+        name = rest[name_start:]
+        if name[:3].lower() == 'of ':
+            name = name[3:]
+        elif quantity is None:
+            # Without an amount the leading word is only a unit in 'pinch of salt'
+            unit = NO_UNIT
+        if unit != NO_UNIT:
+            rest = name
+    return quantity, quantity_max, unit, rest.strip().strip(',').strip()
+
+
+register_lru_cache('ingredient_parse', _parse)
+
+
+def parse_ingredient(ingredient_text):
+    """
+    Splits an ingredient line such as '1 1/2 c. brown sugar' or '2-3 large
+    eggs' into its quantity, canonical unit and name. Lines without an amount
+    ('salt to taste') come back with only a name.
+    """
+    quantity, quantity_max, unit, name = _parse(ingredient_text or '')
+    return ParsedIngredient(
+        ingredient_text,
+        name=name,
+        quantity=quantity,
+        unit=UNITS[unit] if unit != NO_UNIT else None,
+        quantity_max=quantity_max,
+    )
+
+
+def parse_batch(ingredient_lines):
+    """
+    Parses many ingredient lines at once into columns: 'quantity' and
+    'quantity_max' (float64, NaN where absent), 'unit' (int16 unit IDs into
+    UNITS, NO_UNIT where absent) and 'name' (a list of strings).
+    """
+    parsed = [_parse(line or '') for line in ingredient_lines]
+    count = len(parsed)
+    quantity = np.fromiter((p[0] if p[0] is not None else np.nan for p in parsed), dtype=np.float64, count=count)
+    quantity_max = np.fromiter((p[1] if p[1] is not None else np.nan for p in parsed), dtype=np.float64, count=count)
+    unit = np.fromiter((p[2] for p in parsed), dtype=np.int16, count=count)
+    return {
+        'quantity': quantity,
+        'quantity_max': quantity_max,
+        'unit': unit,
+        'name': [p[3] for p in parsed],
+    }
+
+
+def format_quantity(quantity):
+    """
+    Formats a parsed quantity for display: 2.0 -> '2', 1.5 -> '1.5', None -> ''.
+    """
+    if quantity is None:
+        return ''
+    return f'{quantity:g}' if quantity != int(quantity) else str(int(quantity))
+
 
 def parse_multiple_ingredients(ingredient_lines):
     parsed_ingredients = []
@@ -15,35 +177,19 @@ def parse_multiple_ingredients(ingredient_lines):
         # Only add the ingredient if the name is not empty
         if parsed_ingredient.name:
             parsed_ingredients.append(parsed_ingredient)
-    
+
     # Create a list with only the ingredient names for the 'NER' field
     ner_list = [ingredient.name for ingredient in parsed_ingredients if ingredient.name]
 
     # Return the formatted recipe dictionary and parsed ingredients
     parsed_recipe = {
         'title': 'Custom Recipe',
-        'directions': 'Step 1: Mix all ingredients. Step 2: Cook as required.',  # Placeholder directions
-        'NER': ', '.join(ner_list),
-        'ingredients': ', '.join([f"{ing.quantity or ''} {ing.unit or ''} {ing.name}".strip() for ing in parsed_ingredients])
+        'directions': ['Step 1: Mix all ingredients.', 'Step 2: Cook as required.'],  # Placeholder directions
+        'NER': ner_list,
+        'ingredients': [f"{format_quantity(ing.quantity)} {ing.unit or ''} {ing.name}".strip().replace('  ', ' ')
+                        for ing in parsed_ingredients]
     }
 
-    # Debug print statements
-    print("Parsed Ingredients List:", parsed_ingredients)
-    print("Formatted Recipe Dictionary:", parsed_recipe)
+    logger.debug("Parsed %d of %d ingredient lines", len(parsed_ingredients), len(ingredient_lines))
 
     return parsed_recipe, parsed_ingredients
-
-def parse_ingredient(ingredient_text):
-    # Simple parsing logic
-    pattern = r'(?P<quantity>\d*\.?\d+)?\s*(?P<unit>\w+)?\s*(?P<name>.+)'
-    match = re.match(pattern, ingredient_text)
-    print(ingredient_text)
-    if match:
-        return ParsedIngredient(
-            ingredient_text,
-            name=match.group('name').strip() if match.group('name') else '',
-            quantity=match.group('quantity'),
-            unit=match.group('unit')
-        )
-    else:
-        return ParsedIngredient(name=ingredient_text.strip())
@@ -0,0 +1,336 @@
+import ast
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from functools import lru_cache
+import numpy as np
+from allergen_index import ALLERGEN_FAMILIES, ALLERGEN_MATCHER, combine_list_masks, compute_allergen_masks
+from search_index import TitleSearchIndex
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the on-disk layout changes so stale snapshots get rebuilt
+SNAPSHOT_VERSION = 2
+
+# RecipeNLG ships its row number as an unnamed first column; it becomes the recipe ID
+ID_COLUMN_NAMES = ['id', 'Unnamed: 0', '']
+
+
+def parse_list(text):
+    """
+    Parses a stringified list column ('["1 c. sugar", "2 eggs"]') into a list
+    of strings. RecipeNLG writes these as JSON; Python reprs are accepted too.
+    """
+    if not text:
+        return []
+    try:
+        value = json.loads(text)
+    except ValueError:
+        try:
+            value = ast.literal_eval(text)
+        except (ValueError, SyntaxError):
+            return [text]
+    if isinstance(value, (list, tuple)):
+        return [str(item) for item in value]
+    return [str(value)]
+
+
+class StringColumn:
+    """
+    Read-only column of strings stored as one UTF-8 byte buffer plus offsets:
+    string i is data[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+    def take(self, rows):
+        return [self[i] for i in rows]
+
+    def to_list(self):
+        return self.take(range(len(self)))
+
+
+class ListColumn:
+    """
+    Read-only column of string lists: the items of row i are
+    items[list_offsets[i]:list_offsets[i + 1]].
+    """
+
+    def __init__(self, list_offsets, items):
+        self.list_offsets = list_offsets
+        self.items = items
+
+    def __len__(self):
+        return len(self.list_offsets) - 1
+
+    def __getitem__(self, i):
+        return self.items.take(range(self.list_offsets[i], self.list_offsets[i + 1]))
+
+
+class CodedListColumn(ListColumn):
+    """
+    List column whose items are dictionary-encoded: codes index into a small
+    vocabulary of distinct strings (NER has far fewer distinct terms than items).
+    """
+
+    def __init__(self, list_offsets, codes, vocabulary):
+        super().__init__(list_offsets, codes)
+        self.vocabulary = vocabulary
+
+    def __getitem__(self, i):
+        return self.vocabulary.take(self.items[self.list_offsets[i]:self.list_offsets[i + 1]])
+
+
+class _StringColumnWriter:
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+        self.file = open(os.path.join(directory, f'{name}.data.bin'), 'wb')
+        self.lengths = []
+
+    def append_many(self, strings):
+        encoded = [s.encode('utf-8') for s in strings]
+        self.file.write(b''.join(encoded))
+        self.lengths.append(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)))
+
+    def close(self):
+        self.file.close()
+        _save_offsets(self.directory, f'{self.name}.offsets', self.lengths)
+
+
+class _ListColumnWriter:
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+        self.items = _StringColumnWriter(directory, f'{name}.items')
+        self.lengths = []
+
+    def append_many(self, lists):
+        self.items.append_many([item for items in lists for item in items])
+        self.lengths.append(np.fromiter(map(len, lists), dtype=np.int64, count=len(lists)))
+
+    def close(self):
+        self.items.close()
+        _save_offsets(self.directory, f'{self.name}.list_offsets', self.lengths)
+
+
+class _DictionaryEncoder:
+    def __init__(self):
+        self.codes = {}
+
+    def encode_many(self, values):
+        codes = self.codes
+        return np.fromiter((codes.setdefault(value, len(codes)) for value in values), dtype=np.int32,
+                           count=len(values))
+
+    def vocabulary(self):
+        return list(self.codes)
+
+
+def _save_offsets(directory, name, length_chunks):
+    lengths = np.concatenate(length_chunks) if length_chunks else np.empty(0, dtype=np.int64)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    np.save(os.path.join(directory, f'{name}.npy'), offsets)
+
+
+def _save_strings(directory, name, strings):
+    writer = _StringColumnWriter(directory, name)
+    writer.append_many(strings)
+    writer.close()
+
+
+def build_snapshot(csv_path, snapshot_path, chunksize=100_000):
+    """
+    Converts the recipe CSV into a columnar snapshot directory of .npy arrays
+    and UTF-8 byte buffers, with the list columns already parsed and the ID,
+    title search and allergen indexes precomputed. The CSV is streamed in
+    chunks so memory stays bounded on the full dataset.
+    """
+    import pandas as pd
+
+    start_time = time.time()
+    tmp_path = snapshot_path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    header = pd.read_csv(csv_path, nrows=0).columns
+    id_column = next((column for column in ID_COLUMN_NAMES if column in header), None)
+
+    ids, title_codes, source_codes, ner_codes, ner_lengths = [], [], [], [], []
+    titles, sources, ner_terms = _DictionaryEncoder(), _DictionaryEncoder(), _DictionaryEncoder()
+    links = _StringColumnWriter(tmp_path, 'link')
+    ingredients = _ListColumnWriter(tmp_path, 'ingredients')
+    directions = _ListColumnWriter(tmp_path, 'directions')
+    num_rows = 0
+
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize, dtype=str, keep_default_na=False):
+        if id_column is not None:
+            ids.append(chunk[id_column].astype(np.int64).to_numpy())
+        else:
+            ids.append(np.arange(num_rows, num_rows + len(chunk), dtype=np.int64))
+        title_codes.append(titles.encode_many(chunk['title'].tolist()))
+        source_codes.append(sources.encode_many(chunk.get('source', pd.Series('', index=chunk.index)).tolist()))
+        links.append_many(chunk['link'].tolist())
+        ingredients.append_many([parse_list(text) for text in chunk['ingredients']])
+        directions.append_many([parse_list(text) for text in chunk['directions']])
+
+        ner_lists = [parse_list(text) for text in chunk['NER']]
+        ner_codes.append(ner_terms.encode_many([term for terms in ner_lists for term in terms]))
+        ner_lengths.append(np.fromiter(map(len, ner_lists), dtype=np.int64, count=len(ner_lists)))
+        num_rows += len(chunk)
+
+    links.close()
+    ingredients.close()
+    directions.close()
+
+    def save(name, array):
+        np.save(os.path.join(tmp_path, f'{name}.npy'), array)
+
+    save('ids', np.concatenate(ids) if ids else np.empty(0, dtype=np.int64))
+    title_codes = np.concatenate(title_codes) if title_codes else np.empty(0, dtype=np.int32)
+    save('title_codes', title_codes)
+    title_vocabulary = titles.vocabulary()
+    _save_strings(tmp_path, 'title_vocabulary', title_vocabulary)
+    save('source_codes', np.concatenate(source_codes) if source_codes else np.empty(0, dtype=np.int32))
+    _save_strings(tmp_path, 'source_vocabulary', sources.vocabulary())
+
+    # NER is dictionary-encoded: one code per item, plus the distinct terms
+    ner_codes = np.concatenate(ner_codes) if ner_codes else np.empty(0, dtype=np.int32)
+    save('ner_codes', ner_codes)
+    _save_offsets(tmp_path, 'ner.list_offsets', ner_lengths)
+    ner_vocabulary = ner_terms.vocabulary()
+    _save_strings(tmp_path, 'ner_vocabulary', ner_vocabulary)
+
+    # Allergen masks: classify each distinct NER term once, then OR per recipe
+    term_masks = compute_allergen_masks(ner_vocabulary)
+    ner_offsets = np.load(os.path.join(tmp_path, 'ner.list_offsets.npy'))
+    save('allergen_masks', combine_list_masks(term_masks[ner_codes], ner_offsets))
+
+    # Title search index
+    index = TitleSearchIndex.build(title_vocabulary, title_codes)
+    _save_strings(tmp_path, 'index_terms', list(index.vocabulary))
+    save('index_term_offsets', index.term_offsets)
+    save('index_posting_title_ids', index.posting_title_ids)
+    save('index_posting_tfs', index.posting_tfs)
+    save('index_title_lengths', index.title_lengths)
+    save('index_document_frequency', index.document_frequency)
+
+    source_stat = os.stat(csv_path)
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'rows': num_rows,
+        'source_csv': os.path.abspath(csv_path),
+        'source_size': source_stat.st_size,
+        'source_mtime': source_stat.st_mtime,
+        'allergen_families': list(ALLERGEN_FAMILIES),
+        'allergen_pattern': ALLERGEN_MATCHER.pattern.pattern,
+    }
+    with open(os.path.join(tmp_path, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(snapshot_path, ignore_errors=True)
+    os.replace(tmp_path, snapshot_path)
+    elapsed = time.time() - start_time
+    logger.info("Built recipe snapshot with %d recipes in %.1fs (%.0f rows/sec)",
+                num_rows, elapsed, num_rows / max(elapsed, 1e-9))
+    return manifest
+
+
+def snapshot_is_fresh(snapshot_path, csv_path):
+    """
+    Returns True if the snapshot exists, has the current layout and was built
+    from the CSV as it is now (or if there is no CSV to compare against).
+    """
+    manifest_path = os.path.join(snapshot_path, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != SNAPSHOT_VERSION:
+        return False
+    # Masks built with other keywords or matching rules are stale too
+    if manifest.get('allergen_families') != list(ALLERGEN_FAMILIES) or \
+            manifest.get('allergen_pattern') != ALLERGEN_MATCHER.pattern.pattern:
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    source_stat = os.stat(csv_path)
+    return manifest.get('source_size') == source_stat.st_size and manifest.get('source_mtime') == source_stat.st_mtime
+
+
+class RecipeSnapshot:
+    """
+    Memory-mapped view of a snapshot directory written by build_snapshot.
+    Nothing is parsed at load time; pages are faulted in as rows are read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'manifest.json'), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.num_rows = self.manifest['rows']
+
+        self.ids = self._array('ids')
+        self.title_codes = self._array('title_codes')
+        self.title_vocabulary = self._strings('title_vocabulary')
+        self.source_codes = self._array('source_codes')
+        self.source_vocabulary = self._strings('source_vocabulary').to_list()
+        self.link = self._strings('link')
+        self.ingredients = ListColumn(self._array('ingredients.list_offsets'), self._strings('ingredients.items'))
+        self.directions = ListColumn(self._array('directions.list_offsets'), self._strings('directions.items'))
+        self.ner_vocabulary = self._strings('ner_vocabulary')
+        self.ner = CodedListColumn(self._array('ner.list_offsets'), self._array('ner_codes'), self.ner_vocabulary)
+        self.allergen_masks = self._array('allergen_masks')
+
+    def _array(self, name):
+        return np.load(os.path.join(self.path, f'{name}.npy'), mmap_mode='r')
+
+    def _strings(self, name):
+        data_path = os.path.join(self.path, f'{name}.data.bin')
+        if os.path.getsize(data_path):
+            data = np.memmap(data_path, dtype=np.uint8, mode='r')
+        else:
+            data = np.empty(0, dtype=np.uint8)
+        return StringColumn(self._array(f'{name}.offsets'), data)
+
+    def title_index(self):
+        return TitleSearchIndex(
+            self.title_codes,
+            self._strings('index_terms').to_list(),
+            self._array('index_term_offsets'),
+            self._array('index_posting_title_ids'),
+            self._array('index_posting_tfs'),
+            self._array('index_title_lengths'),
+            self._array('index_document_frequency'),
+        )
+
+    @lru_cache(maxsize=64)
+    def ner_term_hits(self, pattern):
+        """
+        Returns a boolean array over the distinct NER terms matching a regex.
+        Cached per pattern, since the vocabulary is small and reused by every row.
+        """
+        import pandas as pd
+        terms = pd.Series(self.ner_vocabulary.to_list(), dtype=object)
+        return terms.str.contains(pattern, case=False, regex=True).to_numpy()
+
+
+if __name__ == '__main__':
+    from observability import configure_logging
+    from recipe_store import RECIPE_CSV_PATH, RECIPE_SNAPSHOT_PATH
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else RECIPE_CSV_PATH
+    snapshot_path = sys.argv[2] if len(sys.argv) > 2 else RECIPE_SNAPSHOT_PATH
+    configure_logging()
+    build_snapshot(csv_path, snapshot_path)
@@ -0,0 +1,272 @@
+import base64
+import os
+import struct
+import threading
+from dataclasses import dataclass
+import numpy as np
+from allergen_index import allergen_bits, combine_list_masks, keyword_pattern
+from observability import span
+from recipe_snapshot import RecipeSnapshot, build_snapshot, snapshot_is_fresh
+
+RECIPE_CSV_PATH = os.environ.get(
+    'RECIPE_DATA_PATH', os.path.join(os.path.dirname(__file__), 'Recipedata.csv')
+)
+RECIPE_SNAPSHOT_PATH = os.environ.get(
+    'RECIPE_SNAPSHOT_PATH', os.path.splitext(RECIPE_CSV_PATH)[0] + '.snapshot'
+)
+
+RECIPE_FIELDS = ('id', 'title', 'ingredients', 'directions', 'link', 'source', 'NER')
+
+# A cursor is the (score, recipe ID) sort key of the last recipe of a page
+_CURSOR_FORMAT = struct.Struct('<fq')
+
+
+def encode_cursor(score, recipe_id):
+    return base64.urlsafe_b64encode(_CURSOR_FORMAT.pack(score, recipe_id)).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Returns the (score, recipe ID) of a cursor. Raises ValueError if it is malformed.
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        score, recipe_id = _CURSOR_FORMAT.unpack(data)
+    except (TypeError, ValueError, struct.error) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    return np.float32(score), recipe_id
+
+
+@dataclass
+class SearchPage:
+    rows: np.ndarray  # row positions of the page's recipes
+    start: int  # position of the page's first recipe among all matches
+    total: int
+    next_cursor: str = None
+    # None on the first page; '' when the previous page is the first one
+    previous_cursor: str = None
+
+
+class RecipeStore:
+    """
+    Holds the whole recipe dataset in memory so routes never re-read the CSV.
+    The columns are memory-mapped from a snapshot built once from the CSV
+    (see recipe_snapshot.py), so nothing is parsed at startup or per request.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        # One uint32 per recipe, one bit per allergen family found in its NER list
+        self.allergen_masks = snapshot.allergen_masks
+
+        # Titles repeat a lot across RecipeNLG, so they are dictionary-encoded
+        # and the search index is built over the distinct titles only.
+        with span('recipe_store.title_index'):
+            self.title_index = snapshot.title_index()
+
+        # ID -> row. The RecipeNLG IDs are simply 0..N-1, in which case the row
+        # is the ID itself. Otherwise rows are found by binary search over the
+        # sorted IDs: two flat arrays rather than a dict of Python ints, so
+        # worker processes forked after loading share them instead of copying.
+        self.recipe_ids = snapshot.ids
+        if np.array_equal(self.recipe_ids, np.arange(len(self.recipe_ids))):
+            self._id_order = None
+            self._sorted_ids = None
+        else:
+            self._id_order = np.argsort(self.recipe_ids, kind='stable')
+            self._sorted_ids = np.asarray(self.recipe_ids[self._id_order])
+
+    @classmethod
+    def from_csv(cls, csv_path=RECIPE_CSV_PATH, snapshot_path=RECIPE_SNAPSHOT_PATH):
+        """
+        Loads the snapshot for csv_path, building it first if it is missing
+        or older than the CSV.
+        """
+        if not snapshot_is_fresh(snapshot_path, csv_path):
+            if not os.path.exists(csv_path):
+                raise FileNotFoundError("The recipe data file could not be found.")
+            with span('recipe_store.build_snapshot'):
+                build_snapshot(csv_path, snapshot_path)
+        with span('recipe_store.load'):
+            return cls(RecipeSnapshot(snapshot_path))
+
+    def __len__(self):
+        return self.snapshot.num_rows
+
+    def row_for_id(self, recipe_id):
+        """
+        Returns the row position of a recipe ID, or None if it is unknown.
+        """
+        if self._id_order is not None:
+            position = int(np.searchsorted(self._sorted_ids, recipe_id))
+            if position < len(self._sorted_ids) and self._sorted_ids[position] == recipe_id:
+                return int(self._id_order[position])
+            return None
+        if 0 <= recipe_id < len(self):
+            return recipe_id
+        return None
+
+    def allergen_free_mask(self, allergens, rows=None):
+        """
+        Returns a boolean mask of the recipes (all of them, or only rows)
+        containing none of the allergens. Known allergen families are a single
+        bitwise AND over the precomputed masks; free-text allergens are matched
+        against the distinct NER terms once and then looked up per recipe.
+        """
+        masks = self.allergen_masks if rows is None else self.allergen_masks[rows]
+        bits, unknown = allergen_bits(allergens)
+        mask = (masks & bits) == 0
+        ner = self.snapshot.ner
+        for allergen in unknown:
+            term_hits = self.snapshot.ner_term_hits(keyword_pattern([allergen.lower()]))
+            if rows is None:
+                item_hits = term_hits[ner.items].astype(np.uint32)
+                mask &= combine_list_masks(item_hits, ner.list_offsets) == 0
+            else:
+                for i, row in enumerate(rows):
+                    codes = ner.items[ner.list_offsets[row]:ner.list_offsets[row + 1]]
+                    if term_hits[codes].any():
+                        mask[i] = False
+        return mask
+
+    def search(self, recipe_name='', allergens=()):
+        """
+        Returns the row positions of the recipes matching recipe_name that
+        contain none of the allergens, best title match first.
+        """
+        row_mask = self.allergen_free_mask(allergens) if allergens else None
+        if recipe_name:
+            rows, _ = self.title_index.search(recipe_name, row_mask=row_mask)
+        elif row_mask is not None:
+            rows = np.flatnonzero(row_mask)
+        else:
+            rows = np.arange(len(self))
+        return rows
+
+    def search_page(self, recipe_name='', allergens=(), cursor=None, limit=20):
+        """
+        Returns one SearchPage of the recipes matching recipe_name that contain
+        none of the allergens, ordered by title score (best first) and then
+        recipe ID. cursor is the next_cursor of the previous page; because it
+        holds a sort key rather than an offset, pages stay consistent however
+        deep they go. Raises ValueError for a malformed cursor.
+        """
+        after = decode_cursor(cursor) if cursor else None
+        if not recipe_name and not allergens and self._id_order is None:
+            # Browsing everything: rows are IDs, so pages are plain ranges
+            start = min(max(after[1] + 1, 0), len(self)) if after is not None else 0
+            return self._page(lambda position: (0.0, position), start, len(self), limit)
+
+        row_mask = self.allergen_free_mask(allergens) if allergens else None
+        if recipe_name:
+            rows, scores = self.title_index.search(recipe_name, row_mask=row_mask)
+            ids = self.recipe_ids[rows]
+            if self._id_order is not None:
+                # The index breaks ties by row; the cursor order needs IDs
+                order = np.lexsort((ids, -scores))
+                rows, scores, ids = rows[order], scores[order], ids[order]
+        else:
+            rows = self._rows_in_id_order()
+            if row_mask is not None:
+                rows = rows[row_mask[rows]]
+            ids = self.recipe_ids[rows]
+            scores = None
+
+        start = 0
+        if after is not None:
+            score, last_id = after
+            if scores is None:
+                start = int(np.searchsorted(ids, last_id, side='right'))
+            else:
+                start = int(np.count_nonzero((scores > score) | ((scores == score) & (ids <= last_id))))
+        page = self._page(lambda position: (scores[position] if scores is not None else 0.0, int(ids[position])),
+                          start, len(rows), limit)
+        page.rows = rows[page.rows]
+        return page
+
+    def _rows_in_id_order(self):
+        if self._id_order is None:
+            return np.arange(len(self))
+        return self._id_order
+
+    @staticmethod
+    def _page(sort_keys, start, total, limit):
+        """
+        The SearchPage of positions start..start + limit among total ordered
+        matches; sort_keys(position) gives the (score, recipe ID) there.
+        """
+        stop = min(start + limit, total)
+        next_cursor = encode_cursor(*sort_keys(stop - 1)) if stop < total else None
+        previous_start = max(start - limit, 0)
+        if start == 0:
+            previous_cursor = None
+        else:
+            previous_cursor = encode_cursor(*sort_keys(previous_start - 1)) if previous_start > 0 else ''
+        return SearchPage(np.arange(start, stop), start, total, next_cursor, previous_cursor)
+
+    def take(self, rows, fields=RECIPE_FIELDS):
+        """
+        Builds the recipe dictionaries for the given row positions, with only
+        the given fields. List columns come back as real lists, already
+        parsed by the snapshot.
+        """
+        return [self.take_one(row, fields) for row in rows]
+
+    def take_one(self, row, fields=RECIPE_FIELDS):
+        snapshot = self.snapshot
+        recipe = {}
+        for field in fields:
+            if field == 'id':
+                recipe['id'] = int(snapshot.ids[row])
+            elif field == 'title':
+                recipe['title'] = snapshot.title_vocabulary[snapshot.title_codes[row]]
+            elif field == 'ingredients':
+                recipe['ingredients'] = snapshot.ingredients[row]
+            elif field == 'directions':
+                recipe['directions'] = snapshot.directions[row]
+            elif field == 'link':
+                recipe['link'] = snapshot.link[row]
+            elif field == 'source':
+                recipe['source'] = snapshot.source_vocabulary[snapshot.source_codes[row]]
+            elif field == 'NER':
+                recipe['NER'] = snapshot.ner[row]
+        return recipe
+
+    def get(self, recipe_id, allergens=()):
+        """
+        Returns one recipe by ID, or None if it is unknown or contains one of
+        the allergens.
+        """
+        row = self.row_for_id(recipe_id)
+        if row is None:
+            return None
+        if allergens and not self.allergen_free_mask(allergens, [row])[0]:
+            return None
+        return self.take([row])[0]
+
+    def get_many(self, recipe_ids):
+        """
+        Returns the recipes for a list of IDs, in that order, skipping unknown IDs.
+        """
+        rows = [row for row in map(self.row_for_id, recipe_ids) if row is not None]
+        return self.take(rows)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def recipe_store_loaded():
+    return _store is not None
+
+
+def get_recipe_store():
+    """
+    Returns the shared RecipeStore, loading the dataset on first use.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = RecipeStore.from_csv()
+    return _store
@@ -0,0 +1,338 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from observability import register_cache, timed
+
+RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'sqlite')  # sqlite, memory or none
+RESPONSE_CACHE_PATH = os.environ.get(
+    'RESPONSE_CACHE_PATH', os.path.join(os.path.dirname(__file__), 'response_cache.db')
+)
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 24 * 60 * 60))
+RESPONSE_CACHE_NEGATIVE_TTL = float(os.environ.get('RESPONSE_CACHE_NEGATIVE_TTL', 5 * 60))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 10000))
+# Seconds between sweeps of expired and least recently used entries in the SQLite cache
+RESPONSE_CACHE_EVICT_INTERVAL = float(os.environ.get('RESPONSE_CACHE_EVICT_INTERVAL', 60))
+# Cache hits whose access times are written to the SQLite cache together
+TOUCH_BATCH_SIZE = 256
+
+_MISSING = object()
+
+
+def normalize_search_terms(search_terms):
+    """
+    Normalizes search terms so 'Brown  Sugar ' and 'brown sugar' share a cache entry.
+    """
+    return re.sub(r'\s+', ' ', str(search_terms or '')).strip().lower()
+
+
+def make_cache_key(namespace, search_terms, page_size=None):
+    return f"{namespace}|{normalize_search_terms(search_terms)}|{page_size if page_size is not None else ''}"
+
+
+class ResponseCache:
+    """
+    Base class for response caches. Values must be JSON-serializable.
+    Empty results are cached with a shorter TTL than real ones, so a
+    transient miss upstream is retried soon instead of being kept forever.
+    """
+
+    # Whether lookups wait on I/O, so that async callers run them on a thread
+    blocking = False
+
+    def __init__(self, ttl=RESPONSE_CACHE_TTL, negative_ttl=RESPONSE_CACHE_NEGATIVE_TTL,
+                 max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        value = self._get(key, time.time())
+        with self._stats_lock:
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            if not value:
+                self.negative_hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl if value else self.negative_ttl
+        if ttl <= 0:
+            return
+        self._set(key, value, time.time() + ttl)
+
+    def get_or_fetch(self, key, fetch):
+        """
+        Returns the cached value for key, calling fetch() and caching its
+        result on a miss. Exceptions from fetch() propagate and are not cached.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = fetch()
+            self.set(key, value)
+        return value
+
+    async def get_or_fetch_async(self, key, fetch):
+        """
+        get_or_fetch for coroutines: fetch() returns an awaitable. A blocking
+        backend is read and written on a worker thread, so the event loop
+        keeps serving other requests meanwhile.
+        """
+        if self.blocking:
+            value = await asyncio.to_thread(self.get, key, _MISSING)
+        else:
+            value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = await fetch()
+            if self.blocking:
+                await asyncio.to_thread(self.set, key, value)
+            else:
+                self.set(key, value)
+        return value
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'negative_hits': self.negative_hits,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+    def _count_evictions(self, count):
+        if count:
+            with self._stats_lock:
+                self.evictions += count
+
+    def _get(self, key, now):
+        raise NotImplementedError
+
+    def _set(self, key, value, expires_at):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class NullResponseCache(ResponseCache):
+    """
+    Cache that stores nothing; every lookup is a miss.
+    """
+
+    def _get(self, key, now):
+        return _MISSING
+
+    def _set(self, key, value, expires_at):
+        pass
+
+    def clear(self):
+        pass
+
+
+class MemoryResponseCache(ResponseCache):
+    """
+    Per-process LRU cache with expiry.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value, expires_at):
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        self._count_evictions(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteResponseCache(ResponseCache):
+    """
+    Cache stored in a SQLite file, so it survives restarts and is shared by
+    every worker process on the machine. Expired entries, and those past
+    max_entries (least recently used first), are swept at most every
+    evict_interval seconds rather than on every write, so max_entries may be
+    exceeded in between. Hits record their access time in batches.
+    """
+
+    blocking = True
+
+    def __init__(self, path=RESPONSE_CACHE_PATH, evict_interval=RESPONSE_CACHE_EVICT_INTERVAL, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.evict_interval = evict_interval
+        self._local = threading.local()
+        self._touch_lock = threading.Lock()
+        self._pending_touches = {}
+        self._next_eviction = 0.0
+        conn = self._connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS response_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_response_cache_accessed ON response_cache(accessed_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_response_cache_expires ON response_cache(expires_at)')
+        conn.commit()
+
+    def _connection(self):
+        # One connection per thread, and never one inherited across a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @timed('sqlite.response_cache_get')
+    def _get(self, key, now):
+        conn = self._connection()
+        row = conn.execute('SELECT value, expires_at FROM response_cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return _MISSING
+        value, expires_at = row
+        if expires_at <= now:
+            return _MISSING  # Left for the next sweep, or replaced by the refetched value
+        with self._touch_lock:
+            self._pending_touches[key] = now
+            touches = self._take_touches() if len(self._pending_touches) >= TOUCH_BATCH_SIZE else None
+        if touches:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._write_touches(conn, touches)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return json.loads(value)
+
+    @timed('sqlite.response_cache_set')
+    def _set(self, key, value, expires_at):
+        conn = self._connection()
+        now = time.time()
+        with self._touch_lock:
+            touches = self._take_touches()
+        evict = now >= self._next_eviction
+        if evict:
+            self._next_eviction = now + self.evict_interval
+        evicted = 0
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO response_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), expires_at, now))
+            self._write_touches(conn, touches)
+            if evict:
+                evicted = self._evict(conn, now)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._count_evictions(evicted)
+
+    def _take_touches(self):
+        # Called with _touch_lock held
+        touches, self._pending_touches = self._pending_touches, {}
+        return touches
+
+    @staticmethod
+    def _write_touches(conn, touches):
+        if touches:
+            conn.executemany('UPDATE response_cache SET accessed_at = max(accessed_at, ?) WHERE key = ?',
+                             [(accessed_at, key) for key, accessed_at in touches.items()])
+
+    def _evict(self, conn, now):
+        """
+        Deletes the expired entries, then the least recently used ones past
+        max_entries. Returns how many of the latter were deleted.
+        """
+        conn.execute('DELETE FROM response_cache WHERE expires_at <= ?', (now,))
+        overflow = conn.execute('SELECT COUNT(*) FROM response_cache').fetchone()[0] - self.max_entries
+        if overflow <= 0:
+            return 0
+        conn.execute('''
+            DELETE FROM response_cache WHERE key IN (
+                SELECT key FROM response_cache ORDER BY accessed_at LIMIT ?
+            )
+        ''', (overflow,))
+        return overflow
+
+    def clear(self):
+        with self._touch_lock:
+            self._pending_touches.clear()
+        self._connection().execute('DELETE FROM response_cache')
+
+
+def create_response_cache(backend=RESPONSE_CACHE_BACKEND, **kwargs):
+    if backend == 'sqlite':
+        return SQLiteResponseCache(**kwargs)
+    if backend == 'memory':
+        return MemoryResponseCache(**kwargs)
+    if backend == 'none':
+        return NullResponseCache(**kwargs)
+    raise ValueError(f"Unknown response cache backend: {backend}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Returns the shared response cache, configured from the RESPONSE_CACHE_* environment variables.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = create_response_cache()
+    return _cache
+
+
+def _cache_counts():
+    if _cache is None:
+        return None
+    stats = _cache.stats()
+    return stats['hits'], stats['misses']
+
+
+register_cache('off_response', _cache_counts)
@@ -0,0 +1,151 @@
+import re
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    """
+    Splits text into lowercase alphanumeric tokens.
+    """
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+class TitleSearchIndex:
+    """
+    In-memory inverted index over recipe titles with BM25 ranking.
+
+    RecipeNLG titles repeat a lot, so the index is built over the distinct
+    titles (the categories of the title column). Scores are computed per
+    distinct title and then expanded to the rows carrying that title,
+    ordered by score and then row position.
+
+    Postings are kept in CSR form (sorted terms, term offsets, title ids and
+    term frequencies) so the whole index can be saved to and memory-mapped
+    from a recipe snapshot.
+    """
+
+    def __init__(self, title_codes, terms, term_offsets, posting_title_ids, posting_tfs,
+                 title_lengths, document_frequency, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.title_codes = title_codes
+        self.num_rows = len(title_codes)
+        self.vocabulary = np.asarray(terms, dtype=object)
+        self.term_offsets = term_offsets
+        self.posting_title_ids = posting_title_ids
+        self.posting_tfs = posting_tfs
+        self.title_lengths = title_lengths
+        self.document_frequency = document_frequency
+        self.term_ids = {term: term_id for term_id, term in enumerate(self.vocabulary)}
+
+        row_counts = np.bincount(title_codes[title_codes >= 0], minlength=len(title_lengths))
+        total_length = float(np.dot(row_counts, title_lengths))
+        self.avg_length = total_length / self.num_rows if self.num_rows else 0.0
+
+    @classmethod
+    def build(cls, titles, title_codes, **kwargs):
+        """
+        Builds the index from the distinct titles and the per-row title codes.
+        """
+        title_codes = np.asarray(title_codes)
+        row_counts = np.bincount(title_codes[title_codes >= 0], minlength=len(titles))
+
+        # Postings: term -> (distinct title ids, term frequencies)
+        postings = {}
+        title_lengths = np.zeros(len(titles), dtype=np.float32)
+        for title_id, title in enumerate(titles):
+            tokens = tokenize(title)
+            title_lengths[title_id] = len(tokens)
+            term_counts = {}
+            for token in tokens:
+                term_counts[token] = term_counts.get(token, 0) + 1
+            for token, count in term_counts.items():
+                postings.setdefault(token, ([], []))
+                postings[token][0].append(title_id)
+                postings[token][1].append(count)
+
+        # Sorted vocabulary, also used for prefix lookups on the last query term
+        terms = sorted(postings)
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        term_offsets[1:] = np.cumsum([len(postings[term][0]) for term in terms])
+        posting_title_ids = np.fromiter(
+            (title_id for term in terms for title_id in postings[term][0]), dtype=np.int32, count=term_offsets[-1])
+        posting_tfs = np.fromiter(
+            (count for term in terms for count in postings[term][1]), dtype=np.float32, count=term_offsets[-1])
+
+        # Collection statistics are counted per row, not per distinct title
+        if terms:
+            document_frequency = np.add.reduceat(row_counts[posting_title_ids], term_offsets[:-1])
+        else:
+            document_frequency = np.empty(0, dtype=np.int64)
+        return cls(title_codes, terms, term_offsets, posting_title_ids, posting_tfs,
+                   title_lengths, document_frequency, **kwargs)
+
+    def postings(self, term_id):
+        start, stop = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+        return self.posting_title_ids[start:stop], self.posting_tfs[start:stop]
+
+    def expand_prefix(self, prefix):
+        start = np.searchsorted(self.vocabulary, prefix, side='left')
+        stop = np.searchsorted(self.vocabulary, prefix + '\uffff', side='left')
+        return list(self.vocabulary[start:stop])
+
+    def query_terms(self, query):
+        """
+        Returns the indexed terms to score for a query. The last token is
+        treated as a prefix so partial words keep matching, like the old
+        substring search did.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        terms = [token for token in tokens[:-1] if token in self.term_ids]
+        last = tokens[-1]
+        if last in self.term_ids:
+            terms.append(last)
+        else:
+            terms.extend(self.expand_prefix(last))
+        return list(dict.fromkeys(terms))
+
+    def score_titles(self, query):
+        """
+        Returns (title ids, scores) for every distinct title matching the query.
+        """
+        terms = self.query_terms(query)
+        if not terms:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+        scores = np.zeros(len(self.title_lengths), dtype=np.float32)
+        length_norm = self.k1 * (1 - self.b + self.b * self.title_lengths / (self.avg_length or 1.0))
+        for term in terms:
+            term_id = self.term_ids[term]
+            ids, tf = self.postings(term_id)
+            df = self.document_frequency[term_id]
+            idf = np.log(1 + (self.num_rows - df + 0.5) / (df + 0.5))
+            scores[ids] += idf * tf * (self.k1 + 1) / (tf + length_norm[ids])
+
+        title_ids = np.flatnonzero(scores)
+        return title_ids, scores[title_ids]
+
+    def search(self, query, row_mask=None):
+        """
+        Returns (row positions, scores) for the rows matching the query, best
+        match first. Ties are broken by row position so the order is stable.
+        row_mask optionally restricts the result to rows where it is True.
+        """
+        title_ids, scores = self.score_titles(query)
+        if len(title_ids) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        title_scores = np.zeros(len(self.title_lengths) + 1, dtype=np.float32)  # last slot: code -1
+        title_scores[title_ids] = scores
+        row_scores = title_scores[self.title_codes]
+        matched = row_scores > 0
+        if row_mask is not None:
+            matched &= row_mask
+        rows = np.flatnonzero(matched)
+        row_scores = row_scores[rows]
+
+        order = np.lexsort((rows, -row_scores))
+        return rows[order], row_scores[order]
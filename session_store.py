@@ -0,0 +1,244 @@
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from flask.sessions import SecureCookieSession, SecureCookieSessionInterface, SessionInterface
+from observability import timed
+
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'sqlite')  # sqlite, memory or cookie
+SESSION_STORE_PATH = os.environ.get(
+    'SESSION_STORE_PATH', os.path.join(os.path.dirname(__file__), 'session_store.db')
+)
+SESSION_LIFETIME = float(os.environ.get('SESSION_LIFETIME', 31 * 24 * 60 * 60))
+SESSION_CACHE_ENTRIES = int(os.environ.get('SESSION_CACHE_ENTRIES', 10000))
+
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{22}$')
+
+
+def new_session_id():
+    # 128 random bits, URL safe: 22 characters
+    return secrets.token_urlsafe(16)
+
+
+class SessionStore:
+    """
+    Base class for server-side session stores. Sessions are stored as JSON
+    payloads under their session ID and expire lifetime seconds after they
+    were last written.
+    """
+
+    def __init__(self, lifetime=SESSION_LIFETIME):
+        self.lifetime = lifetime
+
+    def load(self, session_id):
+        """
+        Returns the session's JSON payload, or None if it does not exist or has expired.
+        """
+        raise NotImplementedError
+
+    def save(self, session_id, payload):
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Per-process LRU session store. Sessions are lost on restart and not
+    shared between workers, so it suits development and single-process runs.
+    """
+
+    def __init__(self, max_entries=SESSION_CACHE_ENTRIES, **kwargs):
+        super().__init__(**kwargs)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            payload, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[session_id]
+                return None
+            self._entries.move_to_end(session_id)
+            return payload
+
+    def save(self, session_id, payload):
+        with self._lock:
+            self._entries[session_id] = (payload, time.time() + self.lifetime)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Session store in a SQLite file shared by every worker process on the
+    machine. Recently used payloads are also kept in a per-process LRU
+    front; every row carries a version that is bumped on each write, and a
+    read only fetches the payload from disk when the front's copy is stale.
+    """
+
+    def __init__(self, path=SESSION_STORE_PATH, cache_entries=SESSION_CACHE_ENTRIES, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.cache_entries = cache_entries
+        self._front = OrderedDict()  # session ID -> (version, payload)
+        self._front_lock = threading.Lock()
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _remember(self, session_id, version, payload):
+        with self._front_lock:
+            self._front[session_id] = (version, payload)
+            self._front.move_to_end(session_id)
+            while len(self._front) > self.cache_entries:
+                self._front.popitem(last=False)
+
+    def _forget(self, session_id):
+        with self._front_lock:
+            self._front.pop(session_id, None)
+
+    @timed('sqlite.session_load')
+    def load(self, session_id):
+        conn = self._connection()
+        row = conn.execute('SELECT version FROM sessions WHERE id = ? AND expires_at > ?',
+                           (session_id, time.time())).fetchone()
+        if row is None:
+            self._forget(session_id)
+            return None
+        with self._front_lock:
+            cached = self._front.get(session_id)
+            if cached is not None and cached[0] == row[0]:
+                self._front.move_to_end(session_id)
+                return cached[1]
+        row = conn.execute('SELECT version, payload FROM sessions WHERE id = ?', (session_id,)).fetchone()
+        if row is None:
+            return None
+        self._remember(session_id, *row)
+        return row[1]
+
+    @timed('sqlite.session_save')
+    def save(self, session_id, payload):
+        conn = self._connection()
+        now = time.time()
+        version = conn.execute('''
+            INSERT INTO sessions (id, payload, version, expires_at) VALUES (?, ?, 1, ?)
+            ON CONFLICT(id) DO UPDATE SET payload = excluded.payload, version = version + 1,
+                                          expires_at = excluded.expires_at
+            RETURNING version
+        ''', (session_id, payload, now + self.lifetime)).fetchone()[0]
+        self._remember(session_id, version, payload)
+        conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,))
+
+    def delete(self, session_id):
+        self._connection().execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+        self._forget(session_id)
+
+
+class ServerSideSession(SecureCookieSession):
+    """
+    A session whose data lives in a SessionStore; the cookie only holds its ID.
+    payload is the JSON the session was loaded with, so an unchanged session
+    is never written back.
+    """
+
+    def __init__(self, initial=None, session_id=None, payload=None):
+        super().__init__(initial)
+        self.session_id = session_id
+        self.payload = payload
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    Keeps session data server side under a small random session ID cookie.
+    A session is only written when its data changed, and visitors that never
+    store anything get no session at all.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        session_id = request.cookies.get(self.get_cookie_name(app))
+        if session_id and SESSION_ID_PATTERN.match(session_id):
+            payload = self.store.load(session_id)
+            if payload is not None:
+                return ServerSideSession(json.loads(payload), session_id, payload)
+        return ServerSideSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.session_id is not None and session.modified:
+                self.store.delete(session.session_id)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app), httponly=self.get_cookie_httponly(app),
+                                       samesite=self.get_cookie_samesite(app))
+            return
+
+        new_cookie = False
+        if session.modified:
+            payload = json.dumps(dict(session), sort_keys=True, separators=(',', ':'))
+            if payload != session.payload:
+                if session.session_id is None:
+                    session.session_id = new_session_id()
+                    new_cookie = True
+                self.store.save(session.session_id, payload)
+                session.payload = payload
+
+        refresh = session.permanent and app.config['SESSION_REFRESH_EACH_REQUEST']
+        if new_cookie or (session.session_id is not None and refresh):
+            response.set_cookie(
+                name, session.session_id, expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app),
+                partitioned=self.get_cookie_partitioned(app),
+            )
+
+
+def create_session_interface(backend=SESSION_BACKEND, **kwargs):
+    if backend == 'sqlite':
+        return ServerSideSessionInterface(SQLiteSessionStore(**kwargs))
+    if backend == 'memory':
+        return ServerSideSessionInterface(MemorySessionStore(**kwargs))
+    if backend == 'cookie':
+        # Flask's default signed cookie sessions
+        return SecureCookieSessionInterface()
+    raise ValueError(f"Unknown session backend: {backend}")
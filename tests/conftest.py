@@ -0,0 +1,41 @@
+"""
+Shared test setup. The app's modules read their data paths from the
+environment when they are first imported, so the synthetic benchmark data
+is put in place here, before any test module imports them.
+"""
+import csv
+import json
+import os
+import sys
+import tempfile
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fixtures import use_fixtures  # noqa: E402
+
+TEST_DATA_DIR = os.environ.get('TEST_DATA_DIR', os.path.join(tempfile.gettempdir(), 'recipe-finder-tests'))
+TEST_ROWS = 3000
+FIXTURES = use_fixtures(rows=TEST_ROWS, data_dir=TEST_DATA_DIR)
+
+
+@pytest.fixture
+def make_store(tmp_path):
+    """
+    Returns a function building a RecipeStore from (title, NER list) pairs,
+    with recipe IDs 0..N-1 unless ids are given.
+    """
+    from recipe_store import RecipeStore
+
+    def make(recipes, ids=None):
+        csv_path = str(tmp_path / 'recipes.csv')
+        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['', 'title', 'ingredients', 'directions', 'link', 'source', 'NER'])
+            for recipe_id, (title, ner) in zip(ids if ids is not None else range(len(recipes)), recipes):
+                writer.writerow([recipe_id, title, json.dumps([f'1 cup {name}' for name in ner]),
+                                 json.dumps(['Mix.']), f'example.com/{recipe_id}', 'Gathered', json.dumps(ner)])
+        return RecipeStore.from_csv(csv_path, str(tmp_path / 'recipes.snapshot'))
+
+    return make
@@ -0,0 +1,46 @@
+import pytest
+from allergen_checker import check_allergens
+from allergen_index import ALLERGEN_MATCHER, AllergenMatcher
+
+
+@pytest.mark.parametrize('text, families', [
+    ('buttermilk', {'milk'}),
+    ('Cultured Buttermilk', {'milk'}),
+    ('eggs', {'egg'}),
+    ('eggplant', set()),
+    ('nutmeg', set()),
+    ('butternut squash', set()),
+    ('doughnuts', set()),
+    ('walnuts', {'tree nut'}),
+    ('peanut butter', {'peanut'}),
+    ('shellfish', {'shellfish'}),
+    ('whole wheat flour', {'wheat', 'gluten'}),
+])
+def test_families_in(text, families):
+    assert ALLERGEN_MATCHER.families_in(text) == families
+
+
+def test_blank_keywords_match_nothing():
+    assert AllergenMatcher({'blank': ['', '  ']}).mask('anything') == 0
+
+
+def test_check_allergens():
+    products = {
+        'buttermilk': {'product_name': 'Cultured Buttermilk', 'nutrients': []},
+        'eggplant': {'product_name': 'Eggplant, raw', 'nutrients': []},
+    }
+    assert check_allergens(products, ['milk', 'egg']) == ['milk']
+    assert check_allergens(products, ['', ' ']) == []
+
+
+def test_allergen_free_mask(make_store):
+    store = make_store([
+        ('Pancakes', ['flour', 'buttermilk']),
+        ('Moussaka', ['eggplant', 'lamb']),
+        ('Omelette', ['eggs', 'chives']),
+    ])
+    assert store.allergen_free_mask(['milk']).tolist() == [False, True, True]
+    assert store.allergen_free_mask(['egg']).tolist() == [True, True, False]
+    # Allergens outside the vocabulary follow the same rules
+    assert store.allergen_free_mask(['lamb']).tolist() == [True, False, True]
+    assert store.allergen_free_mask(['chive']).tolist() == [True, True, False]
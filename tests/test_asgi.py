@@ -0,0 +1,28 @@
+import pytest
+
+pytest.importorskip('a2wsgi')
+pytest.importorskip('aiohttp')
+httpx = pytest.importorskip('httpx')
+
+import asyncio  # noqa: E402
+import app  # noqa: E402
+import asgi  # noqa: E402
+
+
+def asgi_get(url):
+    async def get():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=asgi.app), base_url='http://test') as client:
+            return await client.get(url)
+    return asyncio.run(get())
+
+
+@pytest.mark.parametrize('url', [
+    '/fetch_products?source=openfoodfacts',
+    '/fetch_products?source=openfoodfacts&ingredient=',
+    '/fetch_products?source=localdb&ingredient=%20',
+])
+def test_fetch_products_without_ingredient(url):
+    wsgi_response = app.app.test_client().get(url)
+    asgi_response = asgi_get(url)
+    assert wsgi_response.status_code == asgi_response.status_code == 200
+    assert asgi_response.text == wsgi_response.get_data(as_text=True)
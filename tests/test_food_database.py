@@ -0,0 +1,51 @@
+import os
+import shutil
+import sqlite3
+from conftest import ROOT
+from food_database import FOOD_SCHEMA_VERSION, ensure_schema, schema_is_current, search_foods
+
+
+def old_database(tmp_path):
+    # The food database as it was before the normalized schema: a flat nutrients table
+    path = str(tmp_path / 'food_database.db')
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE foods (id INTEGER PRIMARY KEY, description TEXT);
+        CREATE TABLE nutrients (id INTEGER PRIMARY KEY, food_id INTEGER, nutrient_name TEXT, amount REAL, unit TEXT);
+        INSERT INTO foods VALUES (1, 'Eggs, Grade A, Large, egg whole');
+        INSERT INTO nutrients VALUES (1, 1, 'Protein', 12.4, 'g');
+    ''')
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_schema_check_only_reads(tmp_path):
+    path = old_database(tmp_path)
+    with open(path, 'rb') as f:
+        before = f.read()
+    assert not schema_is_current(path)
+    with open(path, 'rb') as f:
+        assert f.read() == before
+    assert sorted(os.listdir(tmp_path)) == ['food_database.db']
+    assert not schema_is_current(str(tmp_path / 'missing.db'))
+
+
+def test_ensure_schema_upgrades_the_old_layout(tmp_path):
+    path = old_database(tmp_path)
+    ensure_schema(path)
+    assert schema_is_current(path)
+    conn = sqlite3.connect(path)
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == FOOD_SCHEMA_VERSION
+    conn.close()
+    assert search_foods('egg', path=path) == [(1, 'Eggs, Grade A, Large, egg whole', [('Protein', 12.4, 'g')])]
+
+
+def test_upgrade_command(tmp_path, monkeypatch):
+    import app
+    path = str(tmp_path / 'food_database.db')
+    shutil.copy(os.path.join(ROOT, 'food_database.db'), path)
+    monkeypatch.setattr(app, 'ensure_schema', lambda: ensure_schema(path))
+    result = app.app.test_cli_runner().invoke(args=['upgrade-food-db'])
+    assert result.exit_code == 0, result.output
+    assert schema_is_current(path)
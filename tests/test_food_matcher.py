@@ -0,0 +1,39 @@
+import sqlite3
+from food_database import ensure_schema
+from food_matcher import FoodMatcher
+
+
+def food_database(tmp_path, foods):
+    path = str(tmp_path / 'food_database.db')
+    ensure_schema(path)
+    conn = sqlite3.connect(path)
+    conn.executemany('INSERT INTO foods (id, description) VALUES (?, ?)', foods)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_edited_descriptions_invalidate_persisted_matches(tmp_path):
+    path = food_database(tmp_path, [(1, 'Parsnips, raw'), (2, 'Carrots, raw'), (3, 'Onions, raw')])
+    matcher = FoodMatcher(path)
+    assert matcher.match('parsnip', persist=True)[0] == 1
+
+    # An in-place upsert, as populate_db.py and import_fdc.py do: same IDs, new descriptions
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE foods SET description = 'Kohlrabi, raw' WHERE id = 1")
+    conn.commit()
+    conn.close()
+
+    rematched = FoodMatcher(path)
+    assert rematched.signature != matcher.signature
+    assert 1 not in rematched.match('parsnip')
+    assert rematched.match('kohlrabi')[0] == 1
+    assert (rematched.hits, rematched.misses) == (0, 2)
+
+
+def test_unchanged_foods_reuse_persisted_matches(tmp_path):
+    path = food_database(tmp_path, [(1, 'Parsnips, raw'), (2, 'Carrots, raw')])
+    FoodMatcher(path).match('carrot', persist=True)
+    matcher = FoodMatcher(path)
+    assert matcher.match('carrot')[0] == 2
+    assert (matcher.hits, matcher.misses) == (1, 0)
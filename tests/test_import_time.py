@@ -0,0 +1,8 @@
+from benchmarks.import_time import CHECK_MODULES, DEFERRED_MODULES, IMPORT_TIME_BUDGET, deferred_imported, run
+
+
+def test_import_app_defers_heavy_modules_and_stays_within_budget():
+    # RECIPE_PRELOAD=0, so no recipe data is loaded either
+    elapsed, result = run(CHECK_MODULES, importtime=True)
+    assert deferred_imported(result.stdout) == [], f"imported at startup, of {DEFERRED_MODULES}"
+    assert elapsed < IMPORT_TIME_BUDGET
@@ -0,0 +1,131 @@
+"""
+The Open Food Facts clients (off_client.py) against the local stub API:
+read timeouts, retries of 5xx and 429 responses (honouring Retry-After),
+giving up once retries run out, and coalescing of identical concurrent
+requests, for the sync client and, when aiohttp is installed, the async one.
+"""
+import asyncio
+import threading
+import time
+import pytest
+from benchmarks.off_stub import OffStub
+from off_client import AsyncOpenFoodFactsClient, OpenFoodFactsClient, async_request_error, request_error
+
+SEARCH_PATH = '/cgi/search.pl'
+# Short timeouts and backoff, so the tests take seconds
+CLIENT_OPTIONS = {'connect_timeout': 1.0, 'read_timeout': 0.3, 'max_retries': 2, 'backoff_factor': 0.01}
+CONCURRENT_CALLERS = 10
+
+
+@pytest.fixture(scope='module')
+def stub():
+    with OffStub() as stub:
+        yield stub
+
+
+@pytest.fixture(autouse=True)
+def clear_faults(stub):
+    yield
+    stub.clear_faults()
+
+
+class SyncCaller:
+    def __init__(self, stub):
+        self.client = OpenFoodFactsClient(stub.base_url, **CLIENT_OPTIONS)
+        self.errors = request_error()
+
+    def search(self, params):
+        return self.client.search(params)
+
+    def search_concurrently(self, params, callers):
+        results = [None] * callers
+        barrier = threading.Barrier(callers)
+
+        def run(i):
+            barrier.wait()
+            results[i] = self.client.search(params)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(callers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def close(self):
+        self.client.close()
+
+
+class AsyncCaller:
+    # Runs the async client's coroutines on one event loop, from synchronous tests
+    def __init__(self, stub):
+        self.loop = asyncio.new_event_loop()
+
+        async def create():
+            return AsyncOpenFoodFactsClient(stub.base_url, **CLIENT_OPTIONS)
+        self.client = self.loop.run_until_complete(create())
+        self.errors = async_request_error()
+
+    def search(self, params):
+        return self.loop.run_until_complete(self.client.search(params))
+
+    def search_concurrently(self, params, callers):
+        async def gather():
+            return await asyncio.gather(*(self.client.search(params) for _ in range(callers)))
+        return self.loop.run_until_complete(gather())
+
+    def close(self):
+        try:
+            self.loop.run_until_complete(self.client.close())
+        finally:
+            self.loop.close()
+
+
+@pytest.fixture(params=['sync', 'async'])
+def caller(request, stub):
+    if request.param == 'async':
+        pytest.importorskip('aiohttp')
+        caller = AsyncCaller(stub)
+    else:
+        caller = SyncCaller(stub)
+    yield caller
+    caller.close()
+
+
+def test_timeout(stub, caller):
+    stub.inject(SEARCH_PATH, delay=1.0, times=CLIENT_OPTIONS['max_retries'] + 1)
+    started = time.perf_counter()
+    with pytest.raises(caller.errors):
+        caller.search({'search_terms': 'slow'})
+    assert time.perf_counter() - started < 1.0 * (CLIENT_OPTIONS['max_retries'] + 1)
+
+
+def test_retry_5xx(stub, caller):
+    stub.inject(SEARCH_PATH, status=503, times=2)
+    faults = stub.faults
+    assert caller.search({'search_terms': 'flaky'}).get('products')
+    assert stub.faults - faults == 2
+
+
+def test_retry_429_after_retry_after(stub, caller):
+    stub.inject(SEARCH_PATH, status=429, retry_after=1)
+    started = time.perf_counter()
+    assert caller.search({'search_terms': 'throttled'}).get('products')
+    assert time.perf_counter() - started >= 1.0
+
+
+def test_retries_exhausted(stub, caller):
+    stub.inject(SEARCH_PATH, status=500, times=CLIENT_OPTIONS['max_retries'] + 1)
+    with pytest.raises(caller.errors):
+        caller.search({'search_terms': 'broken'})
+
+
+def test_coalescing(stub, caller):
+    # The first request is slow (but within the read timeout), so every caller arrives while it is in flight
+    stub.inject(SEARCH_PATH, delay=CLIENT_OPTIONS['read_timeout'] * 2 / 3)
+    requests = stub.requests
+    coalesced = caller.client._single_flight.coalesced
+    results = caller.search_concurrently({'search_terms': 'popular'}, CONCURRENT_CALLERS)
+    assert all(result == results[0] for result in results)
+    assert stub.requests - requests == 1
+    assert caller.client._single_flight.coalesced - coalesced == CONCURRENT_CALLERS - 1
@@ -0,0 +1,66 @@
+import math
+import pytest
+from recipe_parser import (NO_UNIT, UNITS, _parse, format_quantity, parse_batch, parse_ingredient,
+                           parse_multiple_ingredients, parse_number)
+
+# (line, quantity, quantity_max, unit, name)
+INGREDIENT_LINES = [
+    ('1 1/2 cups flour', 1.5, None, 'cup', 'flour'),
+    ('1-1/2 c. brown sugar', 1.5, None, 'cup', 'brown sugar'),
+    ('½ tsp salt', 0.5, None, 'tsp', 'salt'),
+    ('1½ Tbsp. butter', 1.5, None, 'tbsp', 'butter'),
+    ('.5 oz yeast', 0.5, None, 'oz', 'yeast'),
+    ('1 to 2 pinch soy sauce', 1.0, 2.0, 'pinch', 'soy sauce'),
+    ('2-3 lb. potatoes', 2.0, 3.0, 'lb', 'potatoes'),
+    ('4 (10 oz.) pkg. frozen beans', 4.0, None, 'package', 'frozen beans'),
+    ('2 large eggs', 2.0, None, 'large', 'eggs'),
+    ('3 cloves garlic, minced', 3.0, None, 'clove', 'garlic, minced'),
+    ('1 fl oz rum', 1.0, None, 'fl oz', 'rum'),
+    ('1 cup of milk', 1.0, None, 'cup', 'milk'),
+    ('pinch of salt', None, None, 'pinch', 'salt'),
+    ('salt to taste', None, None, None, 'salt to taste'),
+    ('1/0 cup water', None, None, None, '1/0 cup water'),
+    ('', None, None, None, ''),
+]
+
+
+@pytest.mark.parametrize('line, quantity, quantity_max, unit, name', INGREDIENT_LINES)
+def test_parse_ingredient(line, quantity, quantity_max, unit, name):
+    parsed = parse_ingredient(line)
+    assert (parsed.quantity, parsed.quantity_max, parsed.unit, parsed.name) == (quantity, quantity_max, unit, name)
+
+
+@pytest.mark.parametrize('text, value', [
+    ('2', 2.0), ('1.5', 1.5), ('1/2', 0.5), ('1 1/2', 1.5), ('1-1/2', 1.5), ('¾', 0.75), ('1½', 1.5),
+    ('1/0', None), ('abc', None),
+])
+def test_parse_number(text, value):
+    assert parse_number(text) == value
+
+
+def test_parse_batch_agrees_with_parse():
+    lines = [line for line, *_ in INGREDIENT_LINES] + [None]
+    columns = parse_batch(lines)
+    for i, line in enumerate(lines):
+        quantity, quantity_max, unit, name = _parse(line or '')
+        for column, expected in (('quantity', quantity), ('quantity_max', quantity_max)):
+            value = columns[column][i]
+            assert math.isnan(value) if expected is None else value == expected
+        assert columns['unit'][i] == unit
+        assert columns['name'][i] == name
+    assert UNITS[columns['unit'][0]] == 'cup'
+    assert columns['unit'][lines.index('salt to taste')] == NO_UNIT
+
+
+@pytest.mark.parametrize('quantity, text', [(None, ''), (2.0, '2'), (1.5, '1.5'), (0.25, '0.25'), (1 / 3, '0.333333')])
+def test_format_quantity(quantity, text):
+    assert format_quantity(quantity) == text
+
+
+def test_parse_multiple_ingredients():
+    recipe, parsed = parse_multiple_ingredients(['1 1/2 cups flour', '', '2 large eggs', 'salt to taste'])
+    assert [ingredient.name for ingredient in parsed] == ['flour', 'eggs', 'salt to taste']
+    # directions and NER are lists, like the recipes of the dataset, rather than joined strings
+    assert recipe['NER'] == ['flour', 'eggs', 'salt to taste']
+    assert isinstance(recipe['directions'], list) and all(isinstance(step, str) for step in recipe['directions'])
+    assert recipe['ingredients'] == ['1.5 cup flour', '2 large eggs', 'salt to taste']
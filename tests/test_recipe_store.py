@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from recipe_store import get_recipe_store
+
+# (q, allergens): browsing everything takes the fast path over plain ID ranges
+SEARCHES = [
+    ('', []),
+    ('', ['milk']),
+    ('sugar', []),
+    ('chili sauce', ['egg', 'peanut']),
+    ('bread', ['wheat']),
+    ('no such recipe', []),
+]
+PAGE_SIZE = 7
+
+
+def walk(store, recipe_name, allergens, limit=PAGE_SIZE):
+    """
+    Returns the pages of a search, following next_cursor from the first one.
+    """
+    pages = [store.search_page(recipe_name, allergens, None, limit)]
+    while pages[-1].next_cursor is not None:
+        pages.append(store.search_page(recipe_name, allergens, pages[-1].next_cursor, limit))
+    return pages
+
+
+def check_pages(store, recipe_name, allergens, pages):
+    expected = store.search(recipe_name, allergens)
+    assert np.array_equal(np.concatenate([page.rows for page in pages]), expected)
+    assert all(page.total == len(expected) for page in pages)
+    assert [page.start for page in pages] == list(range(0, max(len(expected), 1), PAGE_SIZE))
+    assert pages[0].previous_cursor is None
+    for previous, page in zip(pages, pages[1:]):
+        # '' means the previous page is the first one, fetched without a cursor
+        if previous.start == 0:
+            assert page.previous_cursor == ''
+        else:
+            assert page.previous_cursor
+        back = store.search_page(recipe_name, allergens, page.previous_cursor or None, PAGE_SIZE)
+        assert np.array_equal(back.rows, previous.rows)
+
+
+@pytest.mark.parametrize('recipe_name, allergens', SEARCHES)
+def test_next_cursor_walks_the_whole_result(recipe_name, allergens):
+    store = get_recipe_store()
+    check_pages(store, recipe_name, allergens, walk(store, recipe_name, allergens))
+
+
+@pytest.mark.parametrize('recipe_name, allergens', [('', []), ('', ['milk']), ('apple pie', []), ('pie', ['egg'])])
+def test_pages_follow_recipe_ids_that_are_not_rows(make_store, recipe_name, allergens):
+    titles = ['Apple Pie', 'Apple Crumble', 'Cherry Pie', 'Pie', 'Apple Pie']
+    ners = [['apples', 'flour'], ['apples', 'butter', 'milk'], ['cherries', 'eggs'], ['flour'], ['apples']]
+    recipes = [(titles[i % len(titles)], ners[i % len(ners)]) for i in range(40)]
+    ids = np.random.default_rng(0).permutation(len(recipes)) * 3 + 7
+    store = make_store(recipes, ids=ids)
+    pages = walk(store, recipe_name, allergens)
+    found = store.recipe_ids[np.concatenate([page.rows for page in pages])]
+    assert sorted(found) == sorted(store.recipe_ids[store.search(recipe_name, allergens)])
+    if not recipe_name:
+        assert list(found) == sorted(found)
+    for previous, page in zip(pages, pages[1:]):
+        back = store.search_page(recipe_name, allergens, page.previous_cursor or None, PAGE_SIZE)
+        assert np.array_equal(back.rows, previous.rows)
+
+
+@pytest.mark.parametrize('cursor', ['!!!', 'abc', 'AAAAAAAAAAAAAAAAAAAAAAAAAAAA'])
+def test_malformed_cursor_is_a_bad_request(cursor):
+    import app
+    response = app.app.test_client().get('/api/recipes/search', query_string={'q': 'sugar', 'cursor': cursor})
+    assert response.status_code == 400
+    assert 'cursor' in response.get_json()['error'].lower()
+
+
+def test_api_search_pages():
+    import app
+    client = app.app.test_client()
+    first = client.get('/api/recipes/search', query_string={'q': 'sugar', 'limit': 3, 'fields': 'id,title'}).get_json()
+    assert first['previous_cursor'] is None and len(first['recipes']) == 3
+    second = client.get('/api/recipes/search', query_string={'q': 'sugar', 'limit': 3, 'fields': 'id,title',
+                                                             'cursor': first['next_cursor']}).get_json()
+    assert second['previous_cursor'] == ''
+    assert not {recipe['id'] for recipe in first['recipes']} & {recipe['id'] for recipe in second['recipes']}
@@ -0,0 +1,30 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+from conftest import ROOT
+
+pytest.importorskip('gunicorn')
+if not os.path.exists('/proc/self/smaps_rollup'):
+    pytest.skip('needs Linux /proc/self/smaps_rollup', allow_module_level=True)
+
+WORKER_COUNTS = (1, 2, 4, 8)
+# How much private memory per worker may grow over the single worker's as workers are added
+GROWTH_TOLERANCE_MB = 2.0
+
+
+def private_memory(mode, output):
+    subprocess.run([sys.executable, '-m', 'benchmarks.worker_memory', '--mode', mode,
+                    '--workers', *map(str, WORKER_COUNTS), '--output', str(output)],
+                   cwd=ROOT, capture_output=True, check=True)
+    with open(output, 'r', encoding='utf-8') as f:
+        return [result['private'] for result in json.load(f)['results']]
+
+
+def test_preloaded_workers_private_memory_stays_flat(tmp_path):
+    preloaded = private_memory('preload', tmp_path / 'preload.json')
+    assert max(preloaded) <= preloaded[0] + GROWTH_TOLERANCE_MB, preloaded
+    # Workers loading their own copy hold it privately instead of sharing the parent's
+    per_worker = private_memory('per-worker', tmp_path / 'per-worker.json')
+    assert preloaded[-1] < per_worker[-1], (preloaded, per_worker)
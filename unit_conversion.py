@@ -0,0 +1,200 @@
+import logging
+import re
+import sqlite3
+import threading
+from functools import lru_cache
+from food_database import FOOD_DATABASE_PATH, get_read_connection
+from observability import register_lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Grams per unit
+MASS_UNITS = {
+    'g': 1.0,
+    'mg': 0.001,
+    'µg': 0.000001,
+    'kg': 1000.0,
+    'oz': 28.349523125,
+    'lb': 453.59237,
+}
+
+# Milliliters per unit (US customary for the kitchen units)
+VOLUME_UNITS = {
+    'ml': 1.0,
+    'cl': 10.0,
+    'dl': 100.0,
+    'l': 1000.0,
+    'tsp': 4.92892159375,
+    'tbsp': 14.78676478125,
+    'fl oz': 29.5735295625,
+    'cup': 236.5882365,
+    'pint': 473.176473,
+    'quart': 946.352946,
+    'gallon': 3785.411784,
+    'cubic inch': 16.387064,
+    'cc': 1.0,
+}
+
+# Spellings seen in recipes, product serving sizes and FoodData Central
+UNIT_ALIASES = {
+    'gram': 'g', 'gr': 'g', 'grm': 'g', 'gm': 'g', 'gramme': 'g',
+    'milligram': 'mg', 'microgram': 'µg', 'mcg': 'µg', 'ug': 'µg',
+    'kilogram': 'kg', 'kilo': 'kg', 'kilogramme': 'kg',
+    'ounce': 'oz', 'pound': 'lb', 'lbs': 'lb',
+    'milliliter': 'ml', 'millilitre': 'ml', 'mls': 'ml',
+    'centiliter': 'cl', 'centilitre': 'cl', 'deciliter': 'dl', 'decilitre': 'dl',
+    'liter': 'l', 'litre': 'l', 'lt': 'l', 'ltr': 'l',
+    'teaspoon': 'tsp', 't': 'tsp', 'tsps': 'tsp', 'tspn': 'tsp',
+    'tablespoon': 'tbsp', 'tbsps': 'tbsp', 'tbs': 'tbsp', 'tbl': 'tbsp', 'tbls': 'tbsp', 'tblsp': 'tbsp',
+    'fluid ounce': 'fl oz', 'fl. oz': 'fl oz', 'floz': 'fl oz', 'fl.oz': 'fl oz',
+    'c': 'cup', 'pt': 'pint', 'qt': 'quart', 'gal': 'gallon',
+    'cubic centimeter': 'cc', 'cubic centimetre': 'cc', 'cm3': 'cc',
+}
+
+# Grams per milliliter used for volumes when the food's own density is unknown (water)
+DEFAULT_DENSITY = 1.0
+
+
+@lru_cache(maxsize=4096)
+def normalize_unit(unit):
+    """
+    Maps a unit spelling to its canonical name: 'Tablespoons', 'tbs.' and
+    'T' become 'tbsp', 'grams' becomes 'g'. Unknown units come back lower
+    cased and singular, so they can still be matched against portion names.
+    """
+    if unit is None:
+        return None
+    text = re.sub(r'\s+', ' ', str(unit)).strip().rstrip('.')
+    if text == 'T':
+        return 'tbsp'
+    text = text.lower()
+    if text in MASS_UNITS or text in VOLUME_UNITS:
+        return text
+    if text in UNIT_ALIASES:
+        return UNIT_ALIASES[text]
+    for suffix in ('es', 's'):
+        if text.endswith(suffix) and len(text) > len(suffix) + 1:
+            singular = text[:-len(suffix)]
+            if singular in MASS_UNITS or singular in VOLUME_UNITS:
+                return singular
+            if singular in UNIT_ALIASES:
+                return UNIT_ALIASES[singular]
+    if text.endswith('es') and text[:-2].endswith(('s', 'x', 'ch', 'sh', 'o')):
+        return text[:-2]
+    if text.endswith('s') and len(text) > 2 and not text.endswith('ss'):
+        return text[:-1]
+    return text
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_unit_registry():
+    """
+    Returns the shared pint UnitRegistry, creating it on first use. Building
+    it is slow, so only units missing from the tables above ever load it.
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                import pint
+                _registry = pint.UnitRegistry()
+    return _registry
+
+
+@lru_cache(maxsize=4096)
+def unit_factor(unit):
+    """
+    Returns ('mass', grams per unit), ('volume', milliliters per unit) or
+    (None, None) for units that are neither, e.g. 'large' or 'clove'.
+    """
+    canonical = normalize_unit(unit)
+    if not canonical:
+        return None, None
+    if canonical in MASS_UNITS:
+        return 'mass', MASS_UNITS[canonical]
+    if canonical in VOLUME_UNITS:
+        return 'volume', VOLUME_UNITS[canonical]
+
+    registry = get_unit_registry()
+    try:
+        quantity = registry.Quantity(1.0, str(unit).strip())
+        if quantity.check('[mass]'):
+            return 'mass', quantity.to('gram').magnitude
+        if quantity.check('[volume]'):
+            return 'volume', quantity.to('milliliter').magnitude
+    except Exception:
+        # Units come from request bodies: pint's parser also raises ZeroDivisionError ('1/0'),
+        # tokenize.TokenError ('(') and more, none of which should fail the request
+        pass
+    logger.debug("Unit '%s' is not a mass or volume unit", unit)
+    return None, None
+
+
+@lru_cache(maxsize=16384)
+def food_portions(food_id, path=FOOD_DATABASE_PATH):
+    """
+    Returns (grams per portion unit, grams per milliliter or None) for a
+    FoodData Central food, from its food_portion rows. Volume portions
+    ('1 cup', '2 tablespoon') give the food's density; the others ('1
+    large', '1 slice') give the weight of one such unit.
+    """
+    try:
+        rows = get_read_connection(path).execute('''
+            SELECT p.amount, p.gram_weight, u.name, p.modifier, p.portion_description
+            FROM food_portion p
+            LEFT JOIN measure_unit u ON u.id = p.measure_unit_id
+            WHERE p.food_id = ? AND p.gram_weight > 0
+            ORDER BY p.seq_num, p.id
+        ''', (food_id,)).fetchall()
+    except sqlite3.Error:
+        return {}, None
+
+    weights = {}
+    densities = []
+    for amount, gram_weight, unit_name, modifier, description in rows:
+        amount = amount or 1.0
+        names = [unit_name] if unit_name and unit_name != 'undetermined' else []
+        names += [text for text in (modifier, description) if text and not any(c.isdigit() for c in text)]
+        for name in names:
+            canonical = normalize_unit(name)
+            if canonical in VOLUME_UNITS:
+                densities.append(gram_weight / (amount * VOLUME_UNITS[canonical]))
+            elif canonical not in MASS_UNITS:
+                weights.setdefault(canonical, gram_weight / amount)
+    density = sum(densities) / len(densities) if densities else None
+    return weights, density
+
+
+register_lru_cache('unit_factor', unit_factor)
+register_lru_cache('food_portions', food_portions)
+
+
+def convert_to_grams(quantity, unit, food_id=None, density=None):
+    """
+    Converts quantity of unit to grams, or returns None if that is not
+    possible. Volumes are converted with density (g/ml), else the food's
+    density from FoodData Central when food_id is given, else water's.
+    Units like 'large' or 'slice' need food_id and a matching portion.
+    """
+    if isinstance(quantity, list):  # Handle case if quantity is a list
+        quantity = quantity[0] if quantity else None
+    try:
+        quantity = float(quantity)
+    except (TypeError, ValueError):
+        return None
+
+    kind, factor = unit_factor(unit)
+    if kind == 'mass':
+        return quantity * factor
+    if kind == 'volume':
+        if density is None and food_id is not None:
+            density = food_portions(food_id)[1]
+        return quantity * factor * (density if density is not None else DEFAULT_DENSITY)
+    if food_id is not None:
+        grams_per_unit = food_portions(food_id)[0].get(normalize_unit(unit))
+        if grams_per_unit is not None:
+            return quantity * grams_per_unit
+    return None